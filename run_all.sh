@@ -62,6 +62,12 @@ echo "[INFO] SKIP_ISCE : ${SKIP_ISCE}"
 echo "[INFO] RESET_MINTPY: ${RESET_MINTPY}"
 
 mkdir -p "${OUT_DIR}/paper_figs" "${OUT_DIR}/paper_tables"
+
+# ---------- resource instrumentation ----------
+# every stage appends wall/CPU time, peak RSS and I/O to run_metrics.jsonl/.csv
+export PIPELINE_RUN_ID="${PIPELINE_RUN_ID:-$(date +%Y%m%dT%H%M%S)}"
+METRICS_DIR="${OUT_DIR}/paper_tables"
+METRICS="${REPO_DIR}/scripts/py/stage_metrics.py"
 mkdir -p "$(dirname "${ISCE_DIR}")"
 
 # ---------- tool checks ----------
@@ -102,6 +108,7 @@ if [[ ! -f "${CFG}" ]]; then
 echo "[ERROR] MintPy config not found: ${CFG}"
 exit 1
 fi
+CFG="$(realpath "${CFG}")"
 
 # ---------- optional: reset mintpy ----------
 if [[ "${RESET_MINTPY}" == "yes" ]]; then
@@ -120,7 +127,8 @@ echo "=== STEP 1: ISCE2 (topsApp) ==="
 #
 # If your workflow uses a prepared XML, keep it in ISCE_DIR as topsApp.xml.
 if [[ -f "topsApp.xml" ]]; then
-topsApp.py topsApp.xml --steps
+python "${METRICS}" --stage topsApp --record-dir "${METRICS_DIR}" \
+--inputs "${WORKDIR}/work/${PROJECT_NAME}/SLC" -- topsApp.py topsApp.xml --steps
 else
 echo "[ERROR] topsApp.xml not found in ${ISCE_DIR}."
 echo " Either add it, or run with --skip-isce (if ISCE already processed)."
@@ -132,27 +140,27 @@ fi
 
 echo "=== STEP 2: MintPy (smallbaselineApp) ==="
 # IMPORTANT: run MintPy INSIDE ISCE_DIR so relative paths in cfg resolve correctly.
-smallbaselineApp.py "${CFG}" --dostep load_data
-smallbaselineApp.py "${CFG}" --dostep modify_network
-smallbaselineApp.py "${CFG}" --dostep reference_point
-smallbaselineApp.py "${CFG}" --dostep invert_network
-smallbaselineApp.py "${CFG}" --dostep correct_topography
-smallbaselineApp.py "${CFG}" --dostep residual_RMS
-smallbaselineApp.py "${CFG}" --dostep velocity
+# All steps run in one process; steps whose inputs/config did not change are skipped
+# (state in ${ISCE_DIR}/inputs/mintpy_step_state.json, cleared by --reset-mintpy).
+# mintpy.compute.* left on auto are sized for this stack and host first.
+PLANNED_CFG="${ISCE_DIR}/planned_cfg/$(basename "${CFG}")"
+python "${REPO_DIR}/scripts/py/plan_mintpy_resources.py" "${CFG}" --out-dir planned_cfg \
+|| { echo "[WARN] Resource planning failed; using ${CFG} as is"; PLANNED_CFG="${CFG}"; }
+python "${REPO_DIR}/scripts/py/run_mintpy_steps.py" "${PLANNED_CFG}" --metrics-dir "${METRICS_DIR}" \
+--steps load_data,modify_network,reference_point,invert_network,correct_topography,residual_RMS,velocity
 
 echo "=== STEP 3: Custom post-processing (optional) ==="
 cd "${WORKDIR}"
 
-if [[ -d "${REPO_DIR}/scripts/py" ]]; then
-# Run only if scripts exist; do not fail if missing
-for s in los_to_vertical.py visualize_vertical_map.py analyze_vertical_roi.py; do
-if [[ -f "${REPO_DIR}/scripts/py/${s}" ]]; then
-python "${REPO_DIR}/scripts/py/${s}" || echo "[WARN] Script failed: ${s}"
-fi
-done
-fi
+# Products, scripts and their inputs are declared in configs/postprocess_dag.json;
+# independent nodes run in parallel and only nodes with changed inputs are rebuilt.
+python "${REPO_DIR}/scripts/py/postprocess_dag.py" \
+--dag "${REPO_DIR}/configs/postprocess_dag.json" \
+--set isce_dir="${ISCE_DIR}" --set out_dir="${OUT_DIR}" \
+--metrics-dir "${METRICS_DIR}" || echo "[WARN] Some post-processing nodes failed (see above)"
 
 echo "[DONE] ISCE project: ${ISCE_DIR}"
 echo "[DONE] MintPy outputs typically in: ${ISCE_DIR}/inputs and ${ISCE_DIR}/pic"
 echo "[DONE] Paper outputs folder: ${OUT_DIR}"
+echo "[DONE] Resource record (run ${PIPELINE_RUN_ID}): ${METRICS_DIR}/run_metrics.csv"
 
@@ -7,21 +7,26 @@ Compute basic statistics of vertical displacement (mm)
 for the whole image and for a user-defined ROI.
 
 ROI format: x1,x2,y1,y2  (pixel indices; x=range, y=azimuth)
+
+Uncertainty (optional, see roi_uncertainty.py):
+
+--bootstrap N   bootstrap confidence intervals of the ROI mean and
+                percentiles (--block B resamples B x B tiles)
+--std-path      velocity std (e.g. velocity.h5:velocityStd), propagated to
+                vertical with --inc-path; prints the mean sigma and the
+                standard error of the ROI mean
+--zones         integer zone raster: the same statistics per zone
+--out-csv       write the ROI / zone results as a table
 """
 
 import os
+import csv
 import argparse
 import numpy as np
-from osgeo import gdal
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open file: {path}")
-    arr = ds.ReadAsArray()
-    ds = None
-    return arr
+from raster_io import read_band, resolve_path
+from roi_uncertainty import (DEFAULT_PERCENTILES, bootstrap_ci, mean_std_error,
+                             propagate_std, tiles, zones)
 
 
 def stats(arr, name=""):
@@ -36,6 +41,28 @@ def stats(arr, name=""):
     print(f"{name} valid pixels       : {vals.size}")
 
 
+def uncertainty(values, sigma, args, name="", groups=None):
+    """Print bootstrap CIs / propagated std of one ROI or zone; returns a result row."""
+    row = {"name": name, "valid_pixels": int(np.isfinite(values).sum())}
+    if not row["valid_pixels"]:
+        return row
+    if args.bootstrap > 0:
+        res = bootstrap_ci(values, args.bootstrap, DEFAULT_PERCENTILES, args.ci,
+                           block=args.block, seed=args.seed, mem_mb=args.mem_mb,
+                           groups=groups)
+        for stat, (est, se, lo, hi) in res.items():
+            print(f"{name} {stat:<5s}: {est:.3f}  {args.ci:g}% CI [{lo:.3f}, {hi:.3f}]  (se {se:.3f})")
+            row.update({f"{stat}": est, f"{stat}_se": se, f"{stat}_lo": lo, f"{stat}_hi": hi})
+    else:
+        row["mean"] = float(np.nanmean(values))
+    if sigma is not None:
+        se_ind, se_cor, n = mean_std_error(sigma)
+        print(f"{name} propagated std    : mean sigma {se_cor:.3f} over {n} pixels; "
+              f"SE of mean {se_ind:.4f} (independent) .. {se_cor:.3f} (fully correlated)")
+        row.update({"sigma_mean": se_cor, "mean_se_independent": se_ind})
+    return row
+
+
 def parse_roi(roi_str):
     parts = [int(p) for p in roi_str.split(",")]
     if len(parts) != 4:
@@ -51,25 +78,42 @@ def parse_args():
     p.add_argument("--isce-dir", default=".", help="Path to ISCE project directory.")
     p.add_argument("--vert-path", required=True,
                    help="Path to vertical displacement GeoTIFF (mm).")
-    p.add_argument("--roi", required=True,
-                   help="ROI in pixel coordinates: x1,x2,y1,y2")
-    return p.parse_args()
+    p.add_argument("--roi", default=None,
+                   help="ROI in pixel coordinates: x1,x2,y1,y2 (required unless --zones).")
+    p.add_argument("--bootstrap", type=int, default=0,
+                   help="Bootstrap replicates for CIs of ROI mean / percentiles (0 = off).")
+    p.add_argument("--ci", type=float, default=95.0, help="Confidence level in %% (default 95).")
+    p.add_argument("--block", type=int, default=1,
+                   help="Resample BLOCK x BLOCK tiles instead of pixels (default 1).")
+    p.add_argument("--seed", type=int, default=0, help="Random seed of the bootstrap.")
+    p.add_argument("--mem-mb", type=float, default=256,
+                   help="Memory per chunk of bootstrap replicates (MB).")
+    p.add_argument("--std-path", default=None,
+                   help="LOS std raster or 'velocity.h5:velocityStd' to propagate.")
+    p.add_argument("--std-scale", type=float, default=1.0,
+                   help="Multiply the std by this (1000 for MintPy m/year -> mm/year).")
+    p.add_argument("--inc-path", default=None,
+                   help="Incidence angle (degrees) for LOS -> vertical std.")
+    p.add_argument("--inc-band", type=int, default=1, help="Incidence band (default 1).")
+    p.add_argument("--zones", default=None,
+                   help="Integer zone raster (0 = no zone): statistics per zone.")
+    p.add_argument("--out-csv", default=None, help="Write ROI / zone results to this CSV.")
+    args = p.parse_args()
+    if args.roi is None and args.zones is None:
+        p.error("--roi or --zones is required")
+    return args
 
 
 def main():
     args = parse_args()
 
     isce_dir = os.path.abspath(args.isce_dir)
-    vert_path = args.vert_path
-    if not os.path.isabs(vert_path):
-        vert_path = os.path.join(isce_dir, vert_path)
+    vert_path = resolve_path(isce_dir, args.vert_path)
 
     print("ISCE DIR:", isce_dir)
     print("Vertical displacement file:", vert_path)
 
-    data = read_gdal_array(vert_path)
-    if data.ndim == 3:
-        data = data[0]
+    data, _, _ = read_band(vert_path, band=1)
 
     ny, nx = data.shape
     print("Image size (ny, nx):", ny, nx)
@@ -77,20 +121,65 @@ def main():
     print("\n== Global vertical displacement stats (mm) ==")
     stats(data, "Global")
 
-    x1, x2, y1, y2 = parse_roi(args.roi)
-    print(f"\nROI (x1,x2,y1,y2) = ({x1},{x2},{y1},{y2})")
-
-    # sanity clamp
-    x1 = max(0, min(nx, x1))
-    x2 = max(0, min(nx, x2))
-    y1 = max(0, min(ny, y1))
-    y2 = max(0, min(ny, y2))
-
-    roi = data[y1:y2, x1:x2]
-    print("ROI shape (ny, nx):", roi.shape)
-
-    print("\n== ROI vertical displacement stats (mm) ==")
-    stats(roi, "ROI")
+    sigma = None
+    if args.std_path is not None:
+        std, _, _ = read_band(resolve_path(isce_dir, args.std_path), band=1)
+        inc = None
+        if args.inc_path is not None:
+            inc, _, _ = read_band(resolve_path(isce_dir, args.inc_path), band=args.inc_band)
+        for name, arr in (("std", std), ("incidence", inc)):
+            if arr is not None and arr.shape != data.shape:
+                raise RuntimeError(f"Shape mismatch: vertical {data.shape} vs {name} {arr.shape}")
+        sigma = propagate_std(std * np.float32(args.std_scale), inc)
+        sigma = np.where(np.isfinite(data), sigma, np.nan)
+
+    rows = []
+    if args.roi is not None:
+        x1, x2, y1, y2 = parse_roi(args.roi)
+        print(f"\nROI (x1,x2,y1,y2) = ({x1},{x2},{y1},{y2})")
+
+        # sanity clamp
+        x1 = max(0, min(nx, x1))
+        x2 = max(0, min(nx, x2))
+        y1 = max(0, min(ny, y1))
+        y2 = max(0, min(ny, y2))
+
+        roi = data[y1:y2, x1:x2]
+        print("ROI shape (ny, nx):", roi.shape)
+
+        print("\n== ROI vertical displacement stats (mm) ==")
+        stats(roi, "ROI")
+
+        if args.bootstrap > 0 or sigma is not None:
+            print(f"\n== ROI uncertainty ({args.bootstrap} bootstrap replicates"
+                  + (f", {args.block}x{args.block} tiles" if args.block > 1 else "") + ") ==")
+            roi_sigma = sigma[y1:y2, x1:x2] if sigma is not None else None
+            rows.append(uncertainty(roi, roi_sigma, args, "ROI"))
+
+    if args.zones is not None:
+        labels, _, _ = read_band(resolve_path(isce_dir, args.zones), band=1, dtype=None)
+        if labels.shape != data.shape:
+            raise RuntimeError(f"Shape mismatch: vertical {data.shape} vs zones {labels.shape}")
+        flat = data.ravel()
+        flat_sigma = sigma.ravel() if sigma is not None else None
+        # zones are resampled by the image tiles their pixels fall in
+        tile_id = tiles(data, args.block) if args.block > 1 and args.bootstrap > 0 else None
+        print(f"\n== Zonal statistics ({args.zones}) ==")
+        for label, idx in zones(labels).items():
+            values = flat[idx]
+            name = f"zone {label}"
+            stats(values, name)
+            rows.append(uncertainty(values, flat_sigma[idx] if sigma is not None else None,
+                                    args, name, tile_id[idx] if tile_id is not None else None))
+
+    if args.out_csv and rows:
+        out_csv = resolve_path(isce_dir, args.out_csv)
+        fields = list(dict.fromkeys(k for r in rows for k in r))
+        with open(out_csv, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            w.writerows(rows)
+        print("\nResults:", out_csv)
 
 
 if __name__ == "__main__":
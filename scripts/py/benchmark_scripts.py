@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark_scripts.py
+
+Time and memory-profile the scripts of scripts/py on synthetic stacks
+(synthetic_stack.py) at several sizes, check their outputs against a
+reference run and fail on throughput / peak-memory regressions.
+
+Every case in CASES runs one script in one processing mode as a separate
+process through stage_metrics.py, so wall / CPU time, peak RSS and I/O are
+measured exactly like the pipeline stages.  Results go to
+
+    <work-dir>/bench_results.json / .csv     this run
+    <work-dir>/metrics/run_metrics.jsonl     stage_metrics history
+
+Numerical checks: --save-reference DIR copies the raster outputs and the
+numbers printed by each case; --reference DIR compares a later run with
+them (NaN-aware, --rtol / --atol).
+
+Start-up: --startup times "subsidence <command> --help" for every command of
+subsidence.py (median of --startup-repeats runs, next to a bare
+"import numpy" for reference) and fails non-plotting commands slower than
+--max-startup-ms (default 200).
+
+Regression checks: --save-baseline FILE stores throughput (Mpixel/s) and
+peak RSS per size and case; --baseline FILE fails the run if throughput
+drops or peak RSS grows by more than --max-slowdown / --max-rss-growth.
+
+Example:
+
+python scripts/py/benchmark_scripts.py --work-dir /tmp/bench --sizes 2000,10000 \
+    --save-baseline configs/bench_baseline.json
+python scripts/py/benchmark_scripts.py --work-dir /tmp/bench --sizes 2000,10000 \
+    --baseline configs/bench_baseline.json
+"""
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+
+import numpy as np
+
+from raster_io import read_band
+from subsidence import COMMANDS
+from synthetic_stack import generate
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NUMBER = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?")
+
+# One entry per script / processing mode, in run order (later cases read the
+# outputs of earlier ones).  {m} = merged dir, {isce} = project dir,
+# {inc} = incidence file, {roi} = pixel ROI over the main bowl.
+CASES = [
+    {"name": "remove_ramp.deg2", "script": "remove_ramp.py",
+     "args": ["--isce-dir", "{isce}", "--unw-path", "{m}/filt_topophase.unw.geo.vrt",
+              "--unw-band", "2", "--coh-path", "{m}/topophase.cor.geo.vrt",
+              "--coh-scale", "1", "--degree", "2", "--out-unw", "{m}/bench_rampcorr_deg2.tif"],
+     "rasters": ["{m}/bench_rampcorr_deg2.tif"]},
+    {"name": "remove_ramp.deg1", "script": "remove_ramp.py",
+     "args": ["--isce-dir", "{isce}", "--unw-path", "{m}/filt_topophase.unw.geo.vrt",
+              "--unw-band", "2", "--coh-path", "{m}/topophase.cor.geo.vrt",
+              "--coh-scale", "1", "--degree", "1", "--out-unw", "{m}/bench_rampcorr_deg1.tif"],
+     "rasters": ["{m}/bench_rampcorr_deg1.tif"]},
+    {"name": "postprocess_ifg.raw", "script": "postprocess_ifg.py",
+     "args": ["--isce-dir", "{isce}", "--unw-path", "{m}/filt_topophase.unw.geo.vrt",
+              "--unw-band", "2", "--coh-path", "{m}/topophase.cor.geo.vrt",
+              "--coh-scale", "1", "--out", "{m}/bench_los_raw.tif"],
+     "rasters": ["{m}/bench_los_raw.tif"]},
+    {"name": "postprocess_ifg.deramped_roi", "script": "postprocess_ifg.py",
+     "args": ["--isce-dir", "{isce}", "--unw-path", "{m}/bench_rampcorr_deg2.tif",
+              "--coh-path", "{m}/topophase.cor.geo.vrt", "--coh-scale", "1",
+              "--coh-threshold", "0.3", "--roi", "{roi}", "--out", "{m}/bench_los.tif"],
+     "rasters": ["{m}/bench_los.tif"]},
+    {"name": "los_to_vertical.convert", "script": "los_to_vertical.py",
+     "args": ["--isce-dir", "{isce}", "--los-path", "{m}/bench_los.tif",
+              "--inc-path", "{inc}", "--out", "{m}/bench_vertical.tif"],
+     "rasters": ["{m}/bench_vertical.tif"]},
+    {"name": "dask_postprocess.vertical", "script": "dask_postprocess.py",
+     "args": ["--isce-dir", "{isce}", "--unw-path", "{m}/filt_topophase.unw.geo.vrt",
+              "--unw-band", "2", "--coh-path", "{m}/topophase.cor.geo.vrt", "--coh-scale", "1",
+              "--coh-threshold", "0.3", "--inc-path", "{inc}", "--roi", "{roi}",
+              "--out", "{m}/bench_vertical_dask.tif", "--dashboard", "None"],
+     "rasters": ["{m}/bench_vertical_dask.tif"]},
+    {"name": "analyze_vertical_roi", "script": "analyze_vertical_roi.py",
+     "args": ["--isce-dir", "{isce}", "--vert-path", "{m}/bench_vertical.tif", "--roi", "{roi}"],
+     "stdout": True},
+    {"name": "visualize_los", "script": "visualize_los.py",
+     "args": ["--isce-dir", "{isce}", "--los-path", "{m}/bench_los.tif", "--roi", "{roi}",
+              "--savefig", "{m}/bench_los.png"]},
+    {"name": "visualize_los_map", "script": "visualize_los_map.py",
+     "args": ["--isce-dir", "{isce}", "--los-path", "{m}/bench_los.tif"]},
+    {"name": "visualize_vertical_map", "script": "visualize_vertical_map.py",
+     "args": ["--isce-dir", "{isce}", "--los-path", "{m}/bench_vertical.tif"]},
+    {"name": "vertical_histogram", "script": "vertical_histogram.py",
+     "args": ["--isce-dir", "{isce}", "--vert-path", "{m}/bench_vertical.tif"],
+     "stdout": True},
+    {"name": "vertical_roi_plots", "script": "vertical_roi_plots.py",
+     "args": ["--isce-dir", "{isce}", "--vert-path", "{m}/bench_vertical.tif", "--roi", "{roi}"]},
+    {"name": "valid_pixels_heatmap", "script": "valid_pixels_heatmap.py",
+     "args": ["--isce-dir", "{isce}", "--vert-path", "{m}/bench_vertical.tif"]},
+    {"name": "scatter_coh_vs_vertical", "script": "scatter_coh_vs_vertical.py",
+     "args": ["--isce-dir", "{isce}", "--vert-path", "{m}/bench_vertical.tif",
+              "--coh-path", "{m}/topophase.cor.geo.vrt"]},
+    {"name": "profile_los_vertical", "script": "profile_los_vertical.py",
+     "args": ["--isce-dir", "{isce}", "--los-path", "{m}/bench_los.tif",
+              "--vert-path", "{m}/bench_vertical.tif"]},
+]
+
+
+# every subsidence.py command is timed by --startup; True = held to
+# --max-startup-ms (plotting commands import matplotlib only when they draw,
+# but are reported without a limit)
+STARTUP_COMMANDS = [(name, not name.startswith("plot-")) for name in COMMANDS]
+
+
+# --------------------- running ------------------------
+
+def case_paths(isce_dir, size):
+    x1, x2 = int(0.25 * size), int(0.45 * size)
+    y1, y2 = int(0.30 * size), int(0.50 * size)
+    return {
+        "isce": isce_dir,
+        "m": os.path.join(isce_dir, "merged"),
+        "inc": os.path.join(isce_dir, "mintpy_inputs", "geometry", "incidenceAngle.geo"),
+        "roi": f"{x1},{x2},{y1},{y2}",
+    }
+
+
+def last_record(metrics_dir, stage):
+    with open(os.path.join(metrics_dir, "run_metrics.jsonl")) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if r["stage"] == stage][-1]
+
+
+def run_case(case, size, paths, metrics_dir, log_path):
+    """Run one case under stage_metrics.py; returns its result row."""
+    args = [a.format(**paths) for a in case["args"]]
+    stage = f"bench.{size}.{case['name']}"
+    command = [sys.executable, os.path.join(SCRIPT_DIR, "stage_metrics.py"),
+               "--stage", stage, "--record-dir", metrics_dir, "--",
+               sys.executable, os.path.join(SCRIPT_DIR, case["script"])] + args
+    env = dict(os.environ, MPLBACKEND="Agg")
+    with open(log_path, "w") as log:
+        subprocess.call(command, stdout=log, stderr=subprocess.STDOUT, env=env)
+
+    rec = last_record(metrics_dir, stage)
+    wall = max(rec["wall_s"], 1e-6)
+    return {
+        "size": size,
+        "case": case["name"],
+        "exit_code": rec["exit_code"],
+        "wall_s": rec["wall_s"],
+        "cpu_s": round(rec["cpu_user_s"] + rec["cpu_sys_s"], 3),
+        "peak_rss_mb": rec["peak_rss_mb"],
+        "read_mb": rec["read_mb"],
+        "write_mb": rec["write_mb"],
+        "mpix_per_s": round(size * size / 1e6 / wall, 3),
+        "log": log_path,
+    }
+
+
+def measure_startup(command, repeats):
+    """(median wall seconds, exit code) of ``command`` run ``repeats`` times."""
+    times, code = [], 0
+    for _ in range(max(1, repeats)):
+        t0 = time.perf_counter()
+        code = subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)), code
+
+
+def startup_rows(repeats, max_ms):
+    """Result rows of the start-up cases (size 0)."""
+    cli = os.path.join(SCRIPT_DIR, "subsidence.py")
+    cases = [("numpy", [sys.executable, "-c", "import numpy"], False)]
+    cases += [(name, [sys.executable, cli, name, "--help"], gated)
+              for name, gated in STARTUP_COMMANDS]
+    rows = []
+    base = None
+    for name, command, gated in cases:
+        wall, code = measure_startup(command, repeats)
+        base = wall if base is None else base
+        problems = []
+        if code != 0:
+            problems.append(f"exit code {code}")
+        elif gated and wall * 1000.0 > max_ms:
+            problems.append(f"start-up {wall * 1000.0:.0f} ms > {max_ms:.0f} ms")
+        rows.append({"size": 0, "case": f"startup.{name}", "exit_code": code,
+                     "wall_s": round(wall, 4), "problems": problems,
+                     "status": "FAIL" if problems else "ok"})
+        extra = f" (+{(wall - base) * 1000.0:4.0f} ms over numpy)" if name != "numpy" else ""
+        print(f"{'startup.' + name:<30s} {wall * 1000.0:8.0f} ms{extra}  {rows[-1]['status']}"
+              + (": " + "; ".join(problems) if problems else ""))
+    return rows
+
+
+# --------------------- numerical checks ------------------------
+
+def printed_numbers(log_path):
+    """Numbers printed by a case, ignoring lines with paths and the metrics line."""
+    values = []
+    with open(log_path) as f:
+        for line in f:
+            if os.sep in line or line.startswith("[METRICS]"):
+                continue
+            values.extend(float(v) for v in NUMBER.findall(line))
+    return np.array(values, dtype="float64")
+
+
+def save_reference(case, size, paths, log_path, ref_dir):
+    dest = os.path.join(ref_dir, f"size_{size}")
+    os.makedirs(dest, exist_ok=True)
+    for pattern in case.get("rasters", []):
+        src = pattern.format(**paths)
+        shutil.copy2(src, os.path.join(dest, f"{case['name']}.{os.path.basename(src)}"))
+    if case.get("stdout"):
+        np.save(os.path.join(dest, f"{case['name']}.stdout.npy"), printed_numbers(log_path))
+
+
+def compare_reference(case, size, paths, log_path, ref_dir, rtol, atol):
+    """List of mismatch messages (empty if the outputs match the reference)."""
+    problems = []
+    dest = os.path.join(ref_dir, f"size_{size}")
+    for pattern in case.get("rasters", []):
+        out = pattern.format(**paths)
+        ref = os.path.join(dest, f"{case['name']}.{os.path.basename(out)}")
+        if not os.path.exists(ref):
+            problems.append(f"no reference for {os.path.basename(out)}")
+            continue
+        a, _, _ = read_band(out, band=1)
+        b, _, _ = read_band(ref, band=1)
+        if a.shape != b.shape:
+            problems.append(f"{os.path.basename(out)}: shape {a.shape} != {b.shape}")
+        elif not np.allclose(a, b, rtol=rtol, atol=atol, equal_nan=True):
+            diff = np.nanmax(np.abs(np.asarray(a, "float64") - b))
+            problems.append(f"{os.path.basename(out)}: max |diff| = {diff:.3g}")
+    if case.get("stdout"):
+        ref = os.path.join(dest, f"{case['name']}.stdout.npy")
+        if os.path.exists(ref):
+            a, b = printed_numbers(log_path), np.load(ref)
+            if a.shape != b.shape or not np.allclose(a, b, rtol=rtol, atol=atol, equal_nan=True):
+                problems.append("printed statistics differ from reference")
+        else:
+            problems.append("no reference for printed statistics")
+    return problems
+
+
+# --------------------- regression checks ------------------------
+
+def compare_baseline(row, baseline, max_slowdown, max_rss_growth):
+    ref = baseline.get(str(row["size"]), {}).get(row["case"])
+    if ref is None:
+        return []
+    problems = []
+    if row["mpix_per_s"] < ref["mpix_per_s"] * (1.0 - max_slowdown):
+        problems.append(f"throughput {row['mpix_per_s']:.2f} < baseline "
+                        f"{ref['mpix_per_s']:.2f} Mpix/s")
+    if row["peak_rss_mb"] > ref["peak_rss_mb"] * (1.0 + max_rss_growth):
+        problems.append(f"peak RSS {row['peak_rss_mb']:.0f} > baseline "
+                        f"{ref['peak_rss_mb']:.0f} MB")
+    return problems
+
+
+def write_results(rows, work_dir):
+    with open(os.path.join(work_dir, "bench_results.json"), "w") as f:
+        json.dump(rows, f, indent=2)
+    fields = ["size", "case", "status", "wall_s", "cpu_s", "peak_rss_mb", "read_mb",
+              "write_mb", "mpix_per_s", "problems"]
+    with open(os.path.join(work_dir, "bench_results.csv"), "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        w.writeheader()
+        for row in rows:
+            w.writerow(dict(row, problems="; ".join(row["problems"])))
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Benchmark the scripts on synthetic stacks and check for regressions."
+    )
+    p.add_argument("--work-dir", required=True,
+                   help="Folder for synthetic stacks, outputs and results.")
+    p.add_argument("--sizes", default="2000",
+                   help="Comma-separated raster sizes in pixels, e.g. 2000,10000,30000.")
+    p.add_argument("--dates", type=int, default=30, help="Dates in the synthetic timeseries.")
+    p.add_argument("--cases", default=None,
+                   help="Comma-separated case names (default: all). Cases read outputs "
+                        "of earlier cases, so keep the producers selected.")
+    p.add_argument("--reference", default=None, help="Compare outputs with this reference folder.")
+    p.add_argument("--save-reference", default=None, help="Store outputs as the reference here.")
+    p.add_argument("--rtol", type=float, default=1e-5)
+    p.add_argument("--atol", type=float, default=1e-4)
+    p.add_argument("--baseline", default=None, help="Baseline JSON to check regressions against.")
+    p.add_argument("--save-baseline", default=None, help="Write this run as the baseline JSON.")
+    p.add_argument("--max-slowdown", type=float, default=0.25,
+                   help="Allowed throughput drop vs baseline (fraction, default 0.25).")
+    p.add_argument("--max-rss-growth", type=float, default=0.25,
+                   help="Allowed peak RSS growth vs baseline (fraction, default 0.25).")
+    p.add_argument("--startup", action="store_true",
+                   help="Also time 'subsidence <command> --help' (use --sizes '' for only this).")
+    p.add_argument("--startup-repeats", type=int, default=5, help="Runs per start-up case.")
+    p.add_argument("--max-startup-ms", type=float, default=200.0,
+                   help="Start-up limit for non-plotting commands (ms, default 200).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    metrics_dir = os.path.join(work_dir, "metrics")
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    cases = CASES
+    if args.cases:
+        names = [n.strip() for n in args.cases.split(",") if n.strip()]
+        unknown = sorted(set(names) - {c["name"] for c in CASES})
+        if unknown:
+            raise ValueError(f"Unknown case(s): {unknown}")
+        cases = [c for c in CASES if c["name"] in names]
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    os.environ.setdefault("PIPELINE_RUN_ID", "bench-" + time.strftime("%Y%m%dT%H%M%S"))
+    rows = []
+    if args.startup:
+        print("\n== start-up (median of %d runs) ==" % args.startup_repeats)
+        rows += startup_rows(args.startup_repeats, args.max_startup_ms)
+    for size in sizes:
+        isce_dir = os.path.join(work_dir, f"size_{size}")
+        t0 = time.perf_counter()
+        generate(isce_dir, size, n_dates=args.dates)
+        print(f"\n== size {size} x {size} (stack ready in {time.perf_counter() - t0:.1f} s) ==")
+        paths = case_paths(isce_dir, size)
+        log_dir = os.path.join(isce_dir, "bench_logs")
+        os.makedirs(log_dir, exist_ok=True)
+
+        for case in cases:
+            log_path = os.path.join(log_dir, case["name"] + ".log")
+            row = run_case(case, size, paths, metrics_dir, log_path)
+            problems = []
+            if row["exit_code"] != 0:
+                problems.append(f"exit code {row['exit_code']} (see {log_path})")
+            else:
+                if args.save_reference:
+                    save_reference(case, size, paths, log_path, args.save_reference)
+                if args.reference:
+                    problems += compare_reference(case, size, paths, log_path,
+                                                  args.reference, args.rtol, args.atol)
+                problems += compare_baseline(row, baseline, args.max_slowdown,
+                                             args.max_rss_growth)
+            row["problems"] = problems
+            row["status"] = "FAIL" if problems else "ok"
+            rows.append(row)
+            print(f"{case['name']:<30s} {row['wall_s']:8.2f} s {row['mpix_per_s']:9.2f} Mpix/s "
+                  f"{row['peak_rss_mb']:8.0f} MB  {row['status']}"
+                  + (": " + "; ".join(problems) if problems else ""))
+
+    write_results(rows, work_dir)
+    if args.save_baseline:
+        out = {}
+        for row in rows:
+            if row["exit_code"] == 0 and "mpix_per_s" in row:
+                out.setdefault(str(row["size"]), {})[row["case"]] = {
+                    "mpix_per_s": row["mpix_per_s"], "peak_rss_mb": row["peak_rss_mb"]}
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(out, f, indent=2, sort_keys=True)
+        print("Baseline written:", args.save_baseline)
+
+    n_fail = sum(1 for r in rows if r["problems"])
+    print(f"\n{len(rows) - n_fail} ok, {n_fail} failed; results in "
+          f"{os.path.join(work_dir, 'bench_results.json')}")
+    sys.exit(1 if n_fail else 0)
+
+
+if __name__ == "__main__":
+    main()
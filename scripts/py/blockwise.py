@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+blockwise.py
+
+Row-block execution of per-pixel NumPy kernels on a thread pool.
+
+NumPy releases the GIL inside elementwise operations and reductions, so a
+kernel applied to independent row blocks of a raster runs in parallel on
+plain threads (no pickling, the memmap / output arrays are shared).
+
+The block partition depends only on the raster shape, never on the thread
+count, and results come back in block order, so merged partial results
+(sums, normal equations, statistics) are identical for any --threads.
+
+Usage from a script in scripts/py:
+
+    from blockwise import map_row_blocks, Stats
+
+    def kernel(y0, y1):
+        out[y0:y1] = data[y0:y1] * scale
+        return Stats.of(out[y0:y1])
+
+    stats = Stats.merge(map_row_blocks(kernel, ny, nx, threads=args.threads))
+"""
+
+import os
+
+import numpy as np
+
+
+# pixels per block: large enough to amortise the dispatch, small enough that
+# a float64 design matrix of a block (6 columns) stays around 12 MB
+BLOCK_PIXELS = 1 << 18
+
+
+def default_threads():
+    """Usable cores (CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def row_blocks(ny, nx, block_pixels=BLOCK_PIXELS):
+    """[(y0, y1), ...] covering ny rows, about block_pixels pixels each."""
+    rows = max(1, block_pixels // max(1, nx))
+    return [(y0, min(ny, y0 + rows)) for y0 in range(0, ny, rows)]
+
+
+def map_row_blocks(func, ny, nx, threads=None, block_pixels=BLOCK_PIXELS):
+    """[func(y0, y1) for each row block], run on ``threads`` threads, in block order."""
+    blocks = row_blocks(ny, nx, block_pixels)
+    threads = min(threads or default_threads(), len(blocks))
+    if threads <= 1:
+        return [func(y0, y1) for y0, y1 in blocks]
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda b: func(*b), blocks))
+
+
+class Stats:
+    """count / sum / min / max of the finite values, mergeable across blocks."""
+
+    __slots__ = ("count", "total", "vmin", "vmax")
+
+    def __init__(self, count=0, total=0.0, vmin=np.inf, vmax=-np.inf):
+        self.count, self.total, self.vmin, self.vmax = count, total, vmin, vmax
+
+    @classmethod
+    def of(cls, arr):
+        a = arr[np.isfinite(arr)]
+        if not a.size:
+            return cls()
+        return cls(int(a.size), float(a.sum(dtype="float64")), float(a.min()), float(a.max()))
+
+    @classmethod
+    def merge(cls, parts):
+        out = cls()
+        for p in parts:
+            out.count += p.count
+            out.total += p.total
+            out.vmin = min(out.vmin, p.vmin)
+            out.vmax = max(out.vmax, p.vmax)
+        return out
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else float("nan")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+closure_phase.py
+
+Screen the interferogram network for unwrapping errors before
+invert_network, using the phase closure of all closed triplets
+
+    C_ijk = phi_ij + phi_jk - phi_ik
+
+which is ~0 (up to noise) when the three pairs are unwrapped consistently
+and off by a multiple of 2*pi when one of them has an unwrapping error.
+As in MintPy, every pair is first referenced to REF_Y/REF_X (its phase at
+the reference pixel is subtracted), which removes the arbitrary 2*pi*k
+offset of each unwrapped interferogram; pairs whose reference phase is NaN
+are no-data.
+
+The triplets are enumerated from the pair index matrix (one vectorised
+lookup per first date).  The stack is read in row strips and the closures
+are computed in batches of triplets sized by --mem-mb, so no
+triplets x pixels array is ever held.  Accumulated are
+
+- per pixel  : number of triplets, number with a non-zero integer
+               ambiguity round(C / 2pi), mean |wrapped closure|
+- per triplet: valid and non-zero pixel counts
+
+From the per-triplet counts the pairs are screened greedily: the pair
+with the largest fraction of non-zero closures over its triplets is
+flagged if above --max-fraction, its triplets are dropped, and so on.
+The flagged pairs are printed as a mintpy.network.excludeDate12 line and,
+with --cfg, written into a copy of the cfg.  Pairs in no triplet cannot be
+checked and are listed as such.
+
+Outputs: closurePhase.h5 (MintPy-style numTriNonzeroIntAmbiguity,
+numTriplet, avgAbsWrappedClosure) and closure_pairs.csv.
+
+Example (inside the MintPy work dir):
+
+python scripts/py/closure_phase.py inputs/ifgramStack.h5 --mask-coh 0.3 \
+    --cfg smallbaselineApp.cfg --cfg-out smallbaselineApp_closure.cfg
+"""
+
+import os
+import csv
+import time
+import argparse
+
+import numpy as np
+
+from plan_mintpy_resources import apply_overlay
+from run_mintpy_steps import read_cfg
+
+
+TWO_PI = 2.0 * np.pi
+
+
+# --------------------- network ------------------------
+
+def triplets(date12):
+    """(n_tri, 3) ifg indices [ij, jk, ik] of all closed triplets i < j < k."""
+    dates = sorted({d for pair in date12 for d in pair})
+    index = {d: n for n, d in enumerate(dates)}
+    P = np.full((len(dates), len(dates)), -1, dtype=np.int64)
+    for k, (d1, d2) in enumerate(date12):
+        P[index[d1], index[d2]] = k
+    has = P >= 0
+    out = []
+    for i in range(len(dates)):
+        # j, k with pairs i-j, j-k and i-k all present
+        j, k = np.nonzero(has[i, :, None] & has & has[i, None, :])
+        if j.size:
+            out.append(np.stack([P[i, j], P[j, k], P[i, k]], axis=1))
+    return np.concatenate(out) if out else np.zeros((0, 3), dtype=np.int64)
+
+
+# --------------------- closure ------------------------
+
+def accumulate(f, used, tri, mask_coh=0.0, mem_mb=512):
+    """Stream the stack and accumulate the per-pixel / per-triplet counts."""
+    n_all, ny, nx = f["unwrapPhase"].shape
+    sel = slice(None) if len(used) == n_all else list(used)
+    strip = max(1, int(mem_mb * 1024 ** 2 // 2 // (len(used) * nx * 4)))
+    batch = max(1, int(mem_mb * 1024 ** 2 // 2 // (strip * nx * 4 * 4)))
+
+    n_tri_pix = np.zeros((ny, nx), dtype="int32")
+    n_nonzero_pix = np.zeros((ny, nx), dtype="int32")
+    abs_wrapped = np.zeros((ny, nx), dtype="float32")
+    tri_valid = np.zeros(len(tri), dtype="int64")
+    tri_nonzero = np.zeros(len(tri), dtype="int64")
+
+    if "REF_Y" not in f.attrs or "REF_X" not in f.attrs:
+        raise RuntimeError("REF_Y / REF_X missing in the stack: run reference_point first.")
+    ref_y, ref_x = int(f.attrs["REF_Y"]), int(f.attrs["REF_X"])
+    ref = f["unwrapPhase"][sel, ref_y, ref_x].astype("float32")
+
+    for r0 in range(0, ny, strip):
+        r1 = min(ny, r0 + strip)
+        obs = f["unwrapPhase"][sel, r0:r1, :].reshape(len(used), -1)
+        obs[obs == 0] = np.nan            # ISCE / MintPy no-data
+        if mask_coh > 0:
+            coh = f["coherence"][sel, r0:r1, :].reshape(len(used), -1)
+            obs[coh < mask_coh] = np.nan
+        obs -= ref[:, None]               # NaN reference -> no-data pair
+        cnt = np.zeros(obs.shape[1], dtype="int32")
+        nz = np.zeros(obs.shape[1], dtype="int32")
+        aw = np.zeros(obs.shape[1], dtype="float32")
+        for t0 in range(0, len(tri), batch):
+            t = tri[t0:t0 + batch]
+            C = obs[t[:, 0]] + obs[t[:, 1]] - obs[t[:, 2]]
+            valid = np.isfinite(C)
+            amb = np.rint(np.where(valid, C, 0.0) / TWO_PI)
+            nonzero = amb != 0
+            cnt += valid.sum(axis=0, dtype="int32")
+            nz += nonzero.sum(axis=0, dtype="int32")
+            aw += np.abs(np.where(valid, C - amb * TWO_PI, 0.0)).sum(axis=0)
+            tri_valid[t0:t0 + batch] += valid.sum(axis=1)
+            tri_nonzero[t0:t0 + batch] += nonzero.sum(axis=1)
+        n_tri_pix[r0:r1] = cnt.reshape(r1 - r0, nx)
+        n_nonzero_pix[r0:r1] = nz.reshape(r1 - r0, nx)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            abs_wrapped[r0:r1] = (aw / cnt).reshape(r1 - r0, nx)
+    return n_tri_pix, n_nonzero_pix, abs_wrapped, tri_valid, tri_nonzero
+
+
+def pair_fractions(n_ifg, tri, tri_valid, tri_nonzero, active):
+    """Per pair: number of active triplets and their non-zero closure fraction."""
+    t = tri[active]
+    n_tri = np.bincount(t.ravel(), minlength=n_ifg)
+    valid = np.bincount(t.ravel(), weights=np.repeat(tri_valid[active], 3), minlength=n_ifg)
+    nonzero = np.bincount(t.ravel(), weights=np.repeat(tri_nonzero[active], 3), minlength=n_ifg)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return n_tri, nonzero / valid
+
+
+def screen_pairs(n_ifg, tri, tri_valid, tri_nonzero, max_fraction, min_triplets=2):
+    """Greedy: flag the worst pair, drop its triplets, repeat."""
+    active = np.ones(len(tri), dtype=bool)
+    flagged = []
+    while active.any():
+        n_tri, frac = pair_fractions(n_ifg, tri, tri_valid, tri_nonzero, active)
+        frac = np.where(n_tri >= min_triplets, frac, np.nan)
+        if np.all(np.isnan(frac)):
+            break
+        worst = int(np.nanargmax(frac))
+        if frac[worst] <= max_fraction:
+            break
+        flagged.append((worst, float(frac[worst]), int(n_tri[worst])))
+        active &= ~(tri == worst).any(axis=1)
+    return flagged
+
+
+# --------------------- output ------------------------
+
+def write_h5(path, attrs, n_tri_pix, n_nonzero_pix, abs_wrapped, n_tri):
+    import h5py
+
+    with h5py.File(path, "w") as f:
+        for k, v in attrs.items():
+            f.attrs[k] = v
+        f.attrs["FILE_TYPE"] = "mask"
+        f.attrs["NUM_TRIPLET"] = n_tri
+        f.create_dataset("numTriNonzeroIntAmbiguity", data=n_nonzero_pix, chunks=True)
+        f.create_dataset("numTriplet", data=n_tri_pix, chunks=True)
+        d = f.create_dataset("avgAbsWrappedClosure", data=abs_wrapped, chunks=True)
+        d.attrs["UNIT"] = "radian"
+
+
+def write_csv(path, date12, used, n_tri, frac, flagged):
+    reason = {k: "closure" for k, _, _ in flagged}
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["date12", "n_triplets", "nonzero_fraction", "flagged"])
+        for k, ifg in enumerate(used):
+            d1, d2 = date12[ifg]
+            w.writerow([f"{d1}_{d2}", int(n_tri[k]),
+                        "" if np.isnan(frac[k]) else f"{frac[k]:.5f}",
+                        reason.get(k, "unchecked" if n_tri[k] == 0 else "")])
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Triplet phase closure of ifgramStack.h5 to flag unwrapping errors."
+    )
+    p.add_argument("stack", help="MintPy ifgramStack.h5.")
+    p.add_argument("--out-dir", default=".", help="Folder for closurePhase.h5 / closure_pairs.csv.")
+    p.add_argument("--mask-coh", type=float, default=0.0,
+                   help="Ignore observations with coherence below this.")
+    p.add_argument("--max-fraction", type=float, default=0.05,
+                   help="Flag a pair if more than this fraction of its closures are non-zero.")
+    p.add_argument("--min-triplets", type=int, default=2,
+                   help="Only judge pairs that are in at least this many triplets.")
+    p.add_argument("--ignore-drop", action="store_true",
+                   help="Also use interferograms marked in dropIfgram.")
+    p.add_argument("--mem-mb", type=float, default=512, help="Working memory (MB).")
+    p.add_argument("--cfg", default=None,
+                   help="smallbaselineApp cfg to add the flagged pairs to (excludeDate12).")
+    p.add_argument("--cfg-out", default=None,
+                   help="Output cfg (default: <cfg name>_closure.cfg next to --cfg).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    import h5py
+
+    t0 = time.perf_counter()
+    with h5py.File(args.stack, "r") as f:
+        attrs = dict(f.attrs)
+        date12 = [(d1.decode(), d2.decode()) for d1, d2 in f["date"][:]]
+        keep = f["dropIfgram"][:] if "dropIfgram" in f else np.ones(len(date12), dtype=bool)
+        used = [k for k in range(len(date12)) if keep[k] or args.ignore_drop]
+        tri = triplets([date12[k] for k in used])
+        print(f"Network: {len(used)} pairs, {len(tri)} closed triplets")
+        if not len(tri):
+            raise RuntimeError("No closed triplet in the network; nothing to check.")
+        n_tri_pix, n_nonzero_pix, abs_wrapped, tri_valid, tri_nonzero = accumulate(
+            f, used, tri, args.mask_coh, args.mem_mb)
+    print(f"Closure computed in {time.perf_counter() - t0:.1f} s")
+
+    n_tri, frac = pair_fractions(len(used), tri, tri_valid, tri_nonzero,
+                                 np.ones(len(tri), dtype=bool))
+    flagged = screen_pairs(len(used), tri, tri_valid, tri_nonzero,
+                           args.max_fraction, args.min_triplets)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    h5_path = os.path.join(args.out_dir, "closurePhase.h5")
+    csv_path = os.path.join(args.out_dir, "closure_pairs.csv")
+    write_h5(h5_path, attrs, n_tri_pix, n_nonzero_pix, abs_wrapped, len(tri))
+    write_csv(csv_path, date12, used, n_tri, frac, flagged)
+
+    unchecked = int((n_tri == 0).sum())
+    print(f"Pairs in no triplet (unchecked): {unchecked}")
+    print(f"Flagged pairs (non-zero closure fraction > {args.max_fraction}):")
+    for k, fr, nt in flagged:
+        d1, d2 = date12[used[k]]
+        print(f"  {d1}_{d2}  {fr:7.2%} over {nt} triplets")
+    excluded = [f"{date12[used[k]][0]}_{date12[used[k]][1]}" for k, _, _ in flagged]
+    line = ",".join(excluded) if excluded else "no"
+    print(f"mintpy.network.excludeDate12 = {line}")
+
+    if args.cfg and excluded:
+        current = read_cfg(args.cfg).get("mintpy.network.excludeDate12", "auto")
+        if current not in ("auto", "no", ""):
+            excluded = [s.strip() for s in current.split(",")] + \
+                [d for d in excluded if d not in current]
+        cfg_out = args.cfg_out or os.path.splitext(args.cfg)[0] + "_closure.cfg"
+        apply_overlay(args.cfg, {"mintpy.network.excludeDate12": ",".join(excluded)},
+                      cfg_out, origin="closure_phase.py")
+        print("Cfg   :", cfg_out)
+    print("Output:", h5_path, csv_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+dask_postprocess.py
+
+Out-of-core post-processing on chunked dask arrays.
+
+The same operations as postprocess_ifg.py / los_to_vertical.py /
+analyze_vertical_roi.py (phase clipping, swath and coherence masks, LOS in
+mm, LOS -> vertical, re-referencing, statistics) are expressed lazily over
+dask arrays whose chunks are read on demand from
+
+- raw ISCE products (memmap windows) or GeoTIFFs (GDAL windowed reads)
+- timeseries.h5 / any HDF5 dataset (h5py chunk reads)
+
+and the result is streamed to disk chunk by chunk, so products larger than
+memory are processed with bounded memory.  By default the graph runs on a
+distributed LocalCluster (one process per core, spilling to
+--local-dir); --scheduler threads / synchronous run in this process.
+
+The output is a raw float32 ISCE file with .xml/.vrt headers (readable by
+every script through raster_io); if --out ends with .tif it is converted to
+a tiled GeoTIFF afterwards.
+
+Examples:
+
+# interferogram -> LOS -> vertical, 8 workers of 4 GB
+python scripts/py/dask_postprocess.py --isce-dir . \
+    --unw-path merged/filt_topophase.unw.geo.vrt --unw-band 2 \
+    --coh-path merged/topophase.cor.geo.vrt --coh-scale 1 --coh-threshold 0.3 \
+    --inc-path mintpy_inputs/geometry/incidenceAngle.geo \
+    --ref-roi 100,120,900,920 --roi 100,400,200,500 \
+    --out merged/vertical_displacement_mm.tif --workers 8 --memory-limit 4GB
+
+# one date of timeseries.h5 (metres) -> vertical mm
+python scripts/py/dask_postprocess.py --timeseries timeseries.h5 --date 20231201 \
+    --inc-path mintpy_inputs/geometry/incidenceAngle.geo --out ts_20231201_vertical.tif
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+
+from raster_io import attrs_geotransform, open_band, write_isce_headers, resolve_path
+from los_to_vertical import los_to_vertical
+
+
+S1_WAVELENGTH = 0.055465  # m, as in postprocess_ifg.py
+
+_OPEN = {}   # per-process cache of opened sources (workers reuse their handles)
+
+
+# --------------------- lazy sources ------------------------
+
+class BandSource:
+    """Picklable array-like over one raster band; opened lazily per process."""
+
+    def __init__(self, path, band=1):
+        self.path, self.band = os.path.abspath(path), band
+        arr, self.geotransform, self.projection = open_band(self.path, band)
+        self.shape, self.dtype, self.ndim = arr.shape, arr.dtype, 2
+        self.native_chunks = getattr(arr, "block_shape", None)
+
+    def _array(self):
+        key = ("band", self.path, self.band)
+        if key not in _OPEN:
+            _OPEN[key] = open_band(self.path, self.band)[0]
+        return _OPEN[key]
+
+    def __getitem__(self, key):
+        return np.asarray(self._array()[key])
+
+
+class H5Source:
+    """Picklable array-like over an HDF5 dataset; opened lazily per process."""
+
+    def __init__(self, path, dataset):
+        import h5py
+
+        self.path, self.dataset = os.path.abspath(path), dataset
+        with h5py.File(self.path, "r") as f:
+            ds = f[dataset]
+            self.shape, self.dtype, self.ndim = ds.shape, ds.dtype, ds.ndim
+            self.native_chunks = ds.chunks
+            self.attrs = {k: (v.decode() if isinstance(v, bytes) else v)
+                          for k, v in f.attrs.items()}
+
+    def _dataset(self):
+        import h5py
+
+        key = ("h5", self.path, self.dataset)
+        if key not in _OPEN:
+            _OPEN[key] = h5py.File(self.path, "r")[self.dataset]
+        return _OPEN[key]
+
+    def __getitem__(self, key):
+        return self._dataset()[key]
+
+
+def chunk_shape(source, chunk):
+    """Chunks of about chunk x chunk pixels (one date per chunk for cubes),
+    aligned to the native tiles / HDF5 chunks when there are any."""
+    native = source.native_chunks or (chunk,) * source.ndim
+    lead = (1,) * (source.ndim - 2)
+    rows, cols = native[-2:]
+    if rows == 1 or cols == source.shape[-1]:
+        # striped / untiled storage: any window is as cheap as another
+        rows = cols = chunk
+    return lead + (max(rows, (chunk // rows) * rows), max(cols, (chunk // cols) * cols))
+
+
+def lazy_band(path, band=1, chunk=2048):
+    """(dask array, geotransform, projection) of one raster band."""
+    import dask.array as da
+
+    src = BandSource(path, band)
+    arr = da.from_array(src, chunks=chunk_shape(src, chunk), lock=False,
+                        asarray=False, fancy=False, name=f"band-{os.path.basename(path)}-{band}")
+    return arr, src.geotransform, src.projection
+
+
+def lazy_h5(path, dataset, chunk=2048):
+    """(dask array, file attributes) of an HDF5 dataset."""
+    import dask.array as da
+
+    src = H5Source(path, dataset)
+    arr = da.from_array(src, chunks=chunk_shape(src, chunk), lock=False,
+                        asarray=False, fancy=False, name=f"h5-{os.path.basename(path)}-{dataset}")
+    return arr, src.attrs
+
+
+def timeseries_date(path, date, chunk=2048):
+    """Displacement (m) of one date of a MintPy timeseries file, lazily."""
+    import h5py
+
+    with h5py.File(path, "r") as f:
+        dates = [d.decode() if isinstance(d, bytes) else str(d) for d in f["date"][:]]
+    if date is None:
+        date = dates[-1]
+    if date not in dates:
+        raise ValueError(f"Date {date} not in {path} ({dates[0]} .. {dates[-1]})")
+    cube, attrs = lazy_h5(path, "timeseries", chunk)
+    gt = attrs_geotransform(attrs)
+    return cube[dates.index(date)], gt, date
+
+
+# --------------------- operations ------------------------
+
+def los_mm_from_phase(unw, coh, coh_threshold=0.0, phase_clip=50.0,
+                      wavelength=S1_WAVELENGTH):
+    """LOS (mm) with phase clipping, swath mask and optional coherence mask,
+    as in postprocess_ifg.py."""
+    import dask.array as da
+
+    good = da.isfinite(unw) & (abs(unw) <= phase_clip)
+    los_mm = da.where(good, unw, np.nan) * (wavelength / (4.0 * np.pi) * 1000.0)
+    mask = da.isfinite(coh) & (coh > 0.0)
+    if coh_threshold > 0.0:
+        mask_coh = mask & (coh >= coh_threshold)
+        # postprocess_ifg.py falls back to the swath mask if nothing passes
+        if int(mask_coh.sum().compute()) > 0:
+            mask = mask_coh
+        else:
+            print("[WARN] No pixel passes the coherence threshold; swath mask only.")
+    return da.where(mask, los_mm, np.nan).astype("float32")
+
+
+def vertical_from_los(los, inc_deg):
+    import dask.array as da
+
+    return da.map_blocks(los_to_vertical, los, inc_deg, dtype="float32")
+
+
+def rereference(arr, ref_yx=None, ref_roi=None):
+    """Subtract the value at a pixel (y, x) or the nanmedian of a small ROI."""
+    if ref_yx is not None:
+        y, x = ref_yx
+        ref = float(arr[y, x].compute())
+    elif ref_roi is not None:
+        x1, x2, y1, y2 = ref_roi
+        ref = float(np.nanmedian(arr[y1:y2, x1:x2].compute()))
+    else:
+        return arr, None
+    if not np.isfinite(ref):
+        raise RuntimeError("Reference value is NaN (masked reference pixel / ROI).")
+    return arr - np.float32(ref), ref
+
+
+def stats_tasks(arr):
+    """Lazy min / max / sum / count of the finite values."""
+    import dask.array as da
+
+    finite = da.isfinite(arr)
+    return {"min": da.nanmin(arr), "max": da.nanmax(arr),
+            "sum": da.nansum(arr.astype("float64")), "count": finite.sum()}
+
+
+def finish_stats(values, arr, bins=4096):
+    """Mean and approximate P5 / P50 / P95 (histogram, one more pass)."""
+    import dask.array as da
+
+    out = {k: float(v) for k, v in values.items()}
+    out["count"] = int(out["count"])
+    if out["count"] == 0:
+        return out
+    out["mean"] = out["sum"] / out["count"]
+    hist, edges = da.histogram(arr, bins=bins, range=(out["min"], out["max"]))
+    cdf = np.cumsum(hist.compute()) / out["count"]
+    for p in (5, 50, 95):
+        out[f"p{p}"] = float(edges[min(bins, int(np.searchsorted(cdf, p / 100.0)) + 1)])
+    out["bin_width"] = float(edges[1] - edges[0])
+    return out
+
+
+def print_stats(name, s):
+    if s["count"] == 0:
+        print(f"{name}: all values are NaN.")
+        return
+    print(f"{name} min / mean / max : {s['min']:.3f}  {s['mean']:.3f}  {s['max']:.3f}")
+    print(f"{name} P5 / P50 / P95     : {s['p5']:.3f}  {s['p50']:.3f}  {s['p95']:.3f}"
+          f"  (+/- {s['bin_width']:.3g})")
+    print(f"{name} valid pixels       : {s['count']}")
+
+
+# --------------------- output ------------------------
+
+class RawWriter:
+    """Picklable da.store target writing into a raw float32 file."""
+
+    def __init__(self, path, shape):
+        self.path, self.shape = path, shape
+
+    def __setitem__(self, key, value):
+        out = np.memmap(self.path, mode="r+", dtype="<f4", shape=self.shape)
+        out[key] = value
+        out.flush()
+        del out
+
+
+def create_raw(path, shape, geotransform):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(int(np.prod(shape)) * 4)
+    write_isce_headers(path, shape[1], shape[0], 1, geotransform)
+    return RawWriter(path, shape)
+
+
+def to_geotiff(raw_path, tif_path, projection):
+    from osgeo import gdal
+
+    gdal.Translate(tif_path, raw_path + ".vrt", format="GTiff", outputSRS=projection or None,
+                   noData="nan",
+                   creationOptions=["TILED=YES", "BIGTIFF=IF_SAFER", "COMPRESS=NONE"])
+
+
+# --------------------- cluster ------------------------
+
+def start_scheduler(args):
+    """Configure dask; returns the distributed Client (or None)."""
+    import dask
+
+    if args.scheduler != "local":
+        dask.config.set(scheduler=args.scheduler)
+        return None
+    from dask.distributed import Client, LocalCluster
+
+    cluster = LocalCluster(n_workers=args.workers, threads_per_worker=args.threads_per_worker,
+                           host="127.0.0.1",
+                           memory_limit=args.memory_limit, local_directory=args.local_dir,
+                           dashboard_address=None if args.dashboard.lower() == "none" else args.dashboard)
+    client = Client(cluster)
+    print("Dask cluster:", len(cluster.workers), "workers x", args.threads_per_worker,
+          "threads, memory limit", args.memory_limit, "| dashboard:", client.dashboard_link)
+    return client
+
+
+# --------------------- CLI ------------------------
+
+def parse_pixels(text, n, what):
+    if text is None:
+        return None
+    parts = [int(p) for p in text.split(",")]
+    if len(parts) != n:
+        raise ValueError(f"{what} needs {n} comma-separated integers, got: {text}")
+    return tuple(parts)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Out-of-core LOS / vertical post-processing on dask arrays."
+    )
+    p.add_argument("--isce-dir", default=".", help="ISCE project folder (relative paths).")
+    src = p.add_argument_group("input (interferogram or timeseries)")
+    src.add_argument("--unw-path", default=None, help="Unwrapped phase raster.")
+    src.add_argument("--unw-band", type=int, default=1)
+    src.add_argument("--coh-path", default=None, help="Coherence raster.")
+    src.add_argument("--coh-band", type=int, default=1)
+    src.add_argument("--coh-scale", type=float, default=1000.0)
+    src.add_argument("--coh-threshold", type=float, default=0.0)
+    src.add_argument("--phase-clip", type=float, default=50.0)
+    src.add_argument("--timeseries", default=None,
+                     help="MintPy timeseries.h5; its --date (default: last) is used as LOS.")
+    src.add_argument("--date", default=None, help="YYYYMMDD of --timeseries.")
+    ops = p.add_argument_group("operations")
+    ops.add_argument("--inc-path", default=None, help="Incidence angle (deg): output vertical.")
+    ops.add_argument("--inc-band", type=int, default=1)
+    ops.add_argument("--ref-yx", default=None, help="Re-reference to pixel y,x.")
+    ops.add_argument("--ref-roi", default=None, help="Re-reference to the median of x1,x2,y1,y2.")
+    ops.add_argument("--roi", default=None, help="Also report statistics of x1,x2,y1,y2.")
+    ops.add_argument("--out", required=True, help="Output (.tif: GeoTIFF, else raw ISCE).")
+    run = p.add_argument_group("execution")
+    run.add_argument("--chunk", type=int, default=2048, help="Chunk size in pixels (square).")
+    run.add_argument("--scheduler", default="local",
+                     choices=["local", "threads", "processes", "synchronous"],
+                     help="local = distributed LocalCluster (default).")
+    run.add_argument("--workers", type=int, default=os.cpu_count(), help="LocalCluster workers.")
+    run.add_argument("--threads-per-worker", type=int, default=1)
+    run.add_argument("--memory-limit", default="auto",
+                     help="Per-worker memory limit, e.g. 4GB (workers spill to disk above it).")
+    run.add_argument("--local-dir", default=None, help="Spill folder of the workers.")
+    run.add_argument("--dashboard", default=":0", help="Dashboard address (None to disable).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    # dask is imported after argument parsing, so --help starts fast
+    import dask
+    import dask.array as da
+
+    isce_dir = os.path.abspath(args.isce_dir)
+    out_path = resolve_path(isce_dir, args.out)
+    roi = parse_pixels(args.roi, 4, "--roi")
+    client = start_scheduler(args)
+    t0 = time.perf_counter()
+
+    try:
+        if args.timeseries:
+            disp, gt, date = timeseries_date(resolve_path(isce_dir, args.timeseries),
+                                             args.date, args.chunk)
+            proj = None
+            los = (disp * 1000.0).astype("float32")
+            print("Timeseries date:", date)
+        else:
+            if args.unw_path is None or args.coh_path is None:
+                raise ValueError("Give --unw-path and --coh-path, or --timeseries.")
+            unw, gt, proj = lazy_band(resolve_path(isce_dir, args.unw_path), args.unw_band,
+                                      args.chunk)
+            coh, _, _ = lazy_band(resolve_path(isce_dir, args.coh_path), args.coh_band,
+                                  args.chunk)
+            coh = coh.rechunk(unw.chunks) / float(args.coh_scale)
+            los = los_mm_from_phase(unw.astype("float32"), coh, args.coh_threshold,
+                                    args.phase_clip)
+
+        result, name = los, "LOS mm"
+        if args.inc_path:
+            inc, _, _ = lazy_band(resolve_path(isce_dir, args.inc_path), args.inc_band,
+                                  args.chunk)
+            if inc.shape != los.shape:
+                raise RuntimeError(f"Shape mismatch: LOS {los.shape} vs incidence {inc.shape}")
+            result, name = vertical_from_los(los, inc.rechunk(los.chunks)), "Vertical mm"
+
+        result, ref = rereference(result, parse_pixels(args.ref_yx, 2, "--ref-yx"),
+                                  parse_pixels(args.ref_roi, 4, "--ref-roi"))
+        if ref is not None:
+            print(f"Re-referenced: subtracted {ref:.3f} mm")
+        print("Shape:", result.shape, "chunks:", result.chunksize, "->", result.npartitions,
+              "tasks per operation")
+
+        raw_path = out_path[:-len(".tif")] if out_path.endswith(".tif") else out_path
+        target = create_raw(raw_path, result.shape, gt)
+        store = da.store(result, target, lock=False, compute=False)
+        tasks = {"global": stats_tasks(result)}
+        if roi is not None:
+            x1, x2, y1, y2 = roi
+            tasks["roi"] = stats_tasks(result[y1:y2, x1:x2])
+        _, values = dask.compute(store, tasks)
+
+        # percentiles from the written output (no recomputation of the chain)
+        written, _, _ = lazy_band(raw_path, 1, args.chunk)
+        print(f"\n== Global {name} stats ==")
+        print_stats(name, finish_stats(values["global"], written))
+        if roi is not None:
+            print(f"\n== ROI ({args.roi}) {name} stats ==")
+            print_stats(name, finish_stats(values["roi"], written[y1:y2, x1:x2]))
+
+        if out_path != raw_path:
+            to_geotiff(raw_path, out_path, proj)
+        print("\nSaved:", out_path, f"({time.perf_counter() - t0:.1f} s)")
+    finally:
+        if client is not None:
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+date_utils.py
+
+Acquisition-date helpers shared by the MintPy tools (YYYYMMDD strings, as
+in the date datasets of timeseries.h5 / ifgramStack.h5).  Standard library
+only, so importing it costs nothing at start-up.
+"""
+
+from datetime import datetime
+
+
+def decimal_year(date):
+    """'YYYYMMDD' -> decimal year (day of year / 365.25)."""
+    dt = datetime.strptime(date, "%Y%m%d")
+    return dt.year + (dt.timetuple().tm_yday - 1) / 365.25
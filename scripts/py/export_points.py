@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+export_points.py
+
+Export coherent measurement points (velocity, velocity std, temporal
+coherence, vertical rate, ...) as a point layer of a GeoPackage for GIS use.
+
+The inputs are streamed in row strips: for each strip the coherence (and
+optional mask) selects the points, all field layers are read for the same
+rows and the selected points are written through OGR.  Nothing larger than
+one strip is held in memory, so the full-resolution products of a whole
+frame can be exported.
+
+Writing speed comes from the OGR/SQLite side:
+
+- features are inserted in large transactions (--batch features per
+  COMMIT), not one transaction per row;
+- SQLite runs with synchronous=OFF and a large page cache while writing;
+- the R-tree spatial index (SPATIAL_INDEX=YES) is built by the GPKG
+  driver in one pass when the layer is closed, not updated per insert.
+
+Fields are given as NAME=SPEC, where SPEC is a raster path or
+'file.h5:dataset' (same syntax as query_service.py).  All fields must be on
+the grid of the coherence layer.  Point coordinates come from the
+geotransform (pixel centres); radar-coordinate products need --geometry
+(geometryRadar.h5 with latitude / longitude).
+
+With --timeseries, the displacement time series of every point is attached
+as a compact BLOB: int16 codes of --ts-step millimetres (-32768 = no data),
+little-endian, one value per date.  The dates and the step are written to
+the non-spatial table '<layer>_dates'.  Decoding in Python:
+
+    ts_mm = np.frombuffer(blob, "<i2").astype("float32") * ts_step
+
+Example:
+
+python scripts/py/export_points.py --isce-dir mintpy \
+    --coh temporalCoherence.h5:temporalCoherence --min-coh 0.7 \
+    --field vel=velocity.h5:velocity --field vel_std=velocity.h5:velocityStd \
+    --scale vel=1000 --scale vel_std=1000 \
+    --field vert=../merged/vertical_displacement_mm.tif \
+    --timeseries timeseries.h5 \
+    --out points.gpkg
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+
+from raster_io import QUANT_MAX_CODE, QUANT_NODATA, open_band, resolve_path
+
+
+# --------------------- reading / point selection ------------------------
+
+class FieldSource:
+    """One field layer, read by row strips as float32 with nodata -> NaN."""
+
+    def __init__(self, name, spec, scale=1.0):
+        self.name = name
+        self.spec = spec
+        self.scale = scale
+        self.arr, self.geotransform, self.projection = open_band(spec)
+        self.shape = tuple(self.arr.shape)
+        self.nodata = getattr(self.arr, "nodata", None)
+
+    def rows(self, y0, y1):
+        arr = np.asarray(self.arr[y0:y1, :], dtype="float32")
+        if self.nodata is not None and np.isfinite(self.nodata):
+            arr = np.where(arr == self.nodata, np.nan, arr)
+        if self.scale != 1.0:
+            arr = arr * np.float32(self.scale)
+        return arr
+
+
+def strip_rows(nx, n_layers, mem_mb):
+    """Rows per strip so that n_layers float32 strips fit in mem_mb."""
+    return max(1, int(mem_mb * 1024 ** 2 // (4 * nx * max(1, n_layers))))
+
+
+def select_points(coh, fields, min_coh, mask=None, geometry=None, timeseries=None,
+                  mem_mb=256):
+    """Yield one dict of 1D arrays (row, col, lon, lat, coh, fields, ts) per strip.
+
+    A point is kept where coherence >= min_coh, the mask (if any) is
+    non-zero and the first field is finite.
+    """
+    ny, nx = coh.shape
+    n_layers = 3 + len(fields) + (timeseries.shape[0] if timeseries is not None else 0)
+    rows = strip_rows(nx, n_layers, mem_mb)
+    gt = coh.geotransform
+    for y0 in range(0, ny, rows):
+        y1 = min(ny, y0 + rows)
+        c = coh.rows(y0, y1)
+        keep = c >= min_coh
+        if mask is not None:
+            keep &= np.nan_to_num(mask.rows(y0, y1)) != 0
+        values = {}
+        for f in fields:
+            v = f.rows(y0, y1)
+            if not values:
+                keep &= np.isfinite(v)
+            values[f.name] = v
+        yy, xx = np.nonzero(keep)
+        out = {"row": (yy + y0).astype("int32"), "col": xx.astype("int32"),
+               "coh": c[yy, xx]}
+        if geometry is not None:
+            out["lat"] = geometry[0].rows(y0, y1)[yy, xx].astype("float64")
+            out["lon"] = geometry[1].rows(y0, y1)[yy, xx].astype("float64")
+        else:
+            out["lon"] = gt[0] + (xx + 0.5) * gt[1] + (out["row"] + 0.5) * gt[2]
+            out["lat"] = gt[3] + (xx + 0.5) * gt[4] + (out["row"] + 0.5) * gt[5]
+        for name, v in values.items():
+            out[name] = v[yy, xx]
+        if timeseries is not None:
+            out["ts"] = np.asarray(timeseries[:, y0:y1, :], dtype="float32")[:, yy, xx].T
+        yield out
+
+
+def encode_timeseries(ts_m, step_mm):
+    """(n_points, n_dates) metres -> (n_points, n_dates) int16 codes of step_mm."""
+    with np.errstate(invalid="ignore"):
+        codes = np.rint(ts_m * (1000.0 / step_mm))
+    codes = np.clip(codes, -QUANT_MAX_CODE, QUANT_MAX_CODE)
+    return np.where(np.isfinite(codes), codes, QUANT_NODATA).astype("<i2")
+
+
+# --------------------- GeoPackage writing ------------------------
+
+class GpkgWriter:
+    """Point layer of a new GeoPackage, written in large transactions."""
+
+    def __init__(self, path, layer_name, field_names, projection="", batch=200000,
+                 with_timeseries=False, overwrite=False):
+        from osgeo import gdal, ogr, osr
+
+        gdal.UseExceptions()
+        # no fsync per COMMIT during the bulk load
+        gdal.SetConfigOption("OGR_SQLITE_SYNCHRONOUS", "OFF")
+        gdal.SetConfigOption("OGR_SQLITE_CACHE", "512")
+        self.ogr = ogr
+        if os.path.exists(path):
+            if not overwrite:
+                raise FileExistsError(f"{path} exists (use --overwrite)")
+            ogr.GetDriverByName("GPKG").DeleteDataSource(path)
+        self.ds = ogr.GetDriverByName("GPKG").CreateDataSource(path)
+
+        srs = osr.SpatialReference()
+        if projection:
+            srs.ImportFromWkt(projection)
+        else:
+            srs.ImportFromEPSG(4326)
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        self.layer_name = layer_name
+        self.layer = self.ds.CreateLayer(layer_name, srs, ogr.wkbPoint,
+                                         options=["SPATIAL_INDEX=YES", "FID=fid"])
+        for name in ("row", "col"):
+            self.layer.CreateField(ogr.FieldDefn(name, ogr.OFTInteger))
+        for name in ["coh"] + list(field_names):
+            fd = ogr.FieldDefn(name, ogr.OFTReal)
+            fd.SetSubType(ogr.OFSTFloat32)
+            self.layer.CreateField(fd)
+        if with_timeseries:
+            self.layer.CreateField(ogr.FieldDefn("ts", ogr.OFTBinary))
+        defn = self.layer.GetLayerDefn()
+        self.columns = [defn.GetFieldDefn(i).GetName() for i in range(defn.GetFieldCount())]
+
+        self.batch = batch
+        self.pending = 0
+        self.count = 0
+        self.feature = ogr.Feature(defn)
+        self.point = ogr.Geometry(ogr.wkbPoint)
+        self.layer.StartTransaction()
+
+    def write(self, points, ts_codes=None):
+        """Insert the points of one strip (dict of 1D arrays)."""
+        feat, pt, layer = self.feature, self.point, self.layer
+        cols = [(i, points[name].tolist()) for i, name in enumerate(self.columns) if name != "ts"]
+        ts_idx = self.columns.index("ts") if ts_codes is not None else None
+        set_binary = getattr(feat, "SetFieldBinary", None)
+        lon, lat = points["lon"].tolist(), points["lat"].tolist()
+        for k in range(len(lon)):
+            feat.SetFID(-1)
+            for i, vals in cols:
+                v = vals[k]
+                if v != v:                      # NaN -> NULL
+                    feat.SetFieldNull(i)
+                else:
+                    feat.SetField(i, v)
+            if ts_idx is not None:
+                blob = ts_codes[k].tobytes()
+                if set_binary is not None:
+                    set_binary(ts_idx, blob)
+                else:
+                    feat.SetFieldBinaryFromHexString(ts_idx, blob.hex())
+            pt.SetPoint_2D(0, lon[k], lat[k])
+            feat.SetGeometry(pt)
+            layer.CreateFeature(feat)
+            self.pending += 1
+            if self.pending >= self.batch:
+                layer.CommitTransaction()
+                layer.StartTransaction()
+                self.pending = 0
+        self.count += len(lon)
+
+    def write_dates(self, dates, step_mm):
+        """Non-spatial '<layer>_dates' table: position in the BLOB -> date."""
+        ogr = self.ogr
+        table = self.ds.CreateLayer(f"{self.layer_name}_dates", None, ogr.wkbNone)
+        table.CreateField(ogr.FieldDefn("idx", ogr.OFTInteger))
+        table.CreateField(ogr.FieldDefn("date", ogr.OFTString))
+        table.CreateField(ogr.FieldDefn("step_mm", ogr.OFTReal))
+        table.StartTransaction()
+        for i, d in enumerate(dates):
+            feat = ogr.Feature(table.GetLayerDefn())
+            feat.SetField("idx", i)
+            feat.SetField("date", d)
+            feat.SetField("step_mm", step_mm)
+            table.CreateFeature(feat)
+        table.CommitTransaction()
+
+    def close(self, metadata=None):
+        self.layer.CommitTransaction()
+        for k, v in (metadata or {}).items():
+            self.layer.SetMetadataItem(k, str(v))
+        self.layer = None
+        self.ds = None          # flushes and builds the R-tree
+
+
+# --------------------- CLI ------------------------
+
+def parse_pairs(items, what, cast=str):
+    out = {}
+    for item in items or []:
+        if "=" not in item:
+            raise ValueError(f"{what} must be NAME=VALUE: {item}")
+        name, value = item.split("=", 1)
+        out[name.strip()] = cast(value.strip())
+    return out
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Export coherent points to a GeoPackage.")
+    p.add_argument("--isce-dir", default=".", help="Base directory for relative paths.")
+    p.add_argument("--coh", default="temporalCoherence.h5:temporalCoherence",
+                   help="Coherence layer used for the selection (written as field 'coh').")
+    p.add_argument("--min-coh", type=float, default=0.7, help="Minimum coherence (default 0.7).")
+    p.add_argument("--mask", default=None,
+                   help="Optional mask layer (non-zero = keep), e.g. maskTempCoh.h5:mask.")
+    p.add_argument("--field", action="append", default=None,
+                   help="Field NAME=SPEC (repeatable).  The first field must be finite for "
+                        "a point to be exported.  Default: vel=velocity.h5:velocity and "
+                        "vel_std=velocity.h5:velocityStd in mm/yr.")
+    p.add_argument("--scale", action="append", default=None,
+                   help="Multiply field NAME by FACTOR: NAME=FACTOR (e.g. vel=1000 for m -> mm).")
+    p.add_argument("--geometry", default=None,
+                   help="geometryRadar.h5 with latitude/longitude for radar-coordinate inputs.")
+    p.add_argument("--timeseries", default=None,
+                   help="timeseries.h5 to attach per-point displacement (int16 BLOB).")
+    p.add_argument("--ts-step", type=float, default=0.1,
+                   help="Time-series resolution in mm (default 0.1, range +-3276 mm).")
+    p.add_argument("--out", required=True, help="Output GeoPackage (.gpkg).")
+    p.add_argument("--layer-name", default="points", help="Point layer name (default points).")
+    p.add_argument("--batch", type=int, default=200000, help="Features per transaction.")
+    p.add_argument("--mem-mb", type=float, default=256, help="Working memory per strip (MB).")
+    p.add_argument("--overwrite", action="store_true", help="Replace an existing --out.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    isce_dir = os.path.abspath(args.isce_dir)
+
+    field_specs = parse_pairs(args.field, "--field")
+    scales = parse_pairs(args.scale, "--scale", float)
+    if not field_specs:
+        field_specs = {"vel": "velocity.h5:velocity", "vel_std": "velocity.h5:velocityStd"}
+        scales = {"vel": 1000.0, "vel_std": 1000.0, **scales}
+    unknown = set(scales) - set(field_specs)
+    if unknown:
+        raise ValueError(f"--scale for unknown field(s): {', '.join(sorted(unknown))}")
+
+    coh = FieldSource("coh", resolve_path(isce_dir, args.coh))
+    fields = [FieldSource(name, resolve_path(isce_dir, spec), scales.get(name, 1.0))
+              for name, spec in field_specs.items()]
+    mask = FieldSource("mask", resolve_path(isce_dir, args.mask)) if args.mask else None
+    for src in fields + ([mask] if mask else []):
+        if src.shape != coh.shape:
+            raise RuntimeError(f"Shape mismatch: {src.spec} {src.shape} vs coherence {coh.shape}")
+
+    geometry = None
+    if args.geometry:
+        geo_path = resolve_path(isce_dir, args.geometry)
+        geometry = (FieldSource("lat", geo_path + ":latitude"),
+                    FieldSource("lon", geo_path + ":longitude"))
+    elif coh.geotransform is None:
+        raise RuntimeError(f"{coh.spec} has no geotransform; give --geometry for radar coordinates.")
+
+    ts = dates = None
+    if args.timeseries:
+        import h5py
+
+        ts_file = h5py.File(resolve_path(isce_dir, args.timeseries), "r")
+        ts = ts_file["timeseries"]
+        if ts.shape[1:] != coh.shape:
+            raise RuntimeError(f"Shape mismatch: timeseries {ts.shape[1:]} vs coherence {coh.shape}")
+        dates = [d.decode() if isinstance(d, bytes) else str(d) for d in ts_file["date"][()]]
+
+    out_path = resolve_path(isce_dir, args.out)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    print("Coherence:", coh.spec, f"{coh.shape[0]} x {coh.shape[1]}, min {args.min_coh}")
+    for f in fields:
+        print(f"Field    : {f.name} = {f.spec}" + (f" (x {f.scale:g})" if f.scale != 1.0 else ""))
+
+    t0 = time.perf_counter()
+    writer = GpkgWriter(out_path, args.layer_name, [f.name for f in fields],
+                        projection=coh.projection if geometry is None else "",
+                        batch=args.batch, with_timeseries=ts is not None,
+                        overwrite=args.overwrite)
+    for points in select_points(coh, fields, args.min_coh, mask, geometry, ts, args.mem_mb):
+        codes = encode_timeseries(points["ts"], args.ts_step) if ts is not None else None
+        writer.write(points, codes)
+        print(f"\r{writer.count} points ({time.perf_counter() - t0:.0f} s)", end="", flush=True)
+    print()
+    if ts is not None:
+        writer.write_dates(dates, args.ts_step)
+    writer.close({"MIN_COH": args.min_coh, "COHERENCE": coh.spec,
+                  "FIELDS": ";".join(f"{f.name}={f.spec}" for f in fields)})
+
+    elapsed = time.perf_counter() - t0
+    print(f"Done: {writer.count} points in {elapsed:.1f} s "
+          f"({writer.count / max(elapsed, 1e-9):.0f} points/s)")
+    print("Output:", out_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+file_utils.py
+
+File helpers shared by the caching tools (run_mintpy_steps.py, step_cache.py,
+postprocess_dag.py).  Standard library only, so importing it costs nothing at
+start-up.
+"""
+
+import os
+
+
+def file_identity(path):
+    """[path, size, mtime_ns] of a file: changes whenever the file is rewritten."""
+    st = os.stat(path)
+    return [path, st.st_size, st.st_mtime_ns]
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+fit_timeseries_model.py
+
+Fit a temporal deformation model to every pixel of a MintPy timeseries.h5
+without rerunning MintPy's velocity step, e.g.
+
+- linear rate (+ acceleration)             --polynomial 1 / 2
+- annual / semi-annual terms               --periodic 1.0,0.5
+- offset at a known date (earthquake, ...) --step 20210615
+- rate change at a date (piecewise rate)   --rate-change 20220101
+
+The design matrix A (n_date x n_param) is built once and its
+pseudo-inverse and diag((A^T A)^-1) are precomputed, so a block of pixels
+with complete time series is solved as one matrix multiply.  Pixels with
+missing dates are grouped by their NaN pattern; each distinct pattern gets
+its own (cached) pseudo-inverse and is again one multiply.
+
+Formal standard deviations come from the residuals of each pixel:
+std_k = sqrt(diag((A^T A)^-1)_k * sum(r^2) / (n - m)).
+
+Output: one HDF5 dataset per parameter plus <name>Std and residualRMS,
+with the timeseries attributes (geometry, reference) so MintPy tools read
+it like velocity.h5.  Times are decimal years since the first date.
+
+Example:
+
+python scripts/py/fit_timeseries_model.py timeseries.h5 --periodic 1.0,0.5 \
+    --step 20210615 -o velocity_seasonal.h5
+"""
+
+import math
+import time
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from date_utils import decimal_year
+
+
+# --------------------- model ------------------------
+
+def design_matrix(dates, polynomial=1, periods=(), steps=(), rate_changes=()):
+    """(A, names, units) for the given dates (YYYYMMDD strings)."""
+    t = np.array([decimal_year(d) for d in dates])
+    t = t - t[0]
+    cols, names, units = [], [], []
+    for p in range(polynomial + 1):
+        cols.append(t ** p / math.factorial(p))
+        names.append(["offset", "velocity", "acceleration"][p] if p < 3 else f"poly{p}")
+        units.append("m" if p == 0 else f"m/year^{p}" if p > 1 else "m/year")
+    for period in periods:
+        label = {1.0: "annual", 0.5: "semiAnnual"}.get(period, f"period{period:g}y")
+        cols += [np.sin(2 * np.pi * t / period), np.cos(2 * np.pi * t / period)]
+        names += [f"{label}Sin", f"{label}Cos"]
+        units += ["m", "m"]
+    for d in steps:
+        tb = decimal_year(d) - decimal_year(dates[0])
+        cols.append((t >= tb).astype("float64"))
+        names.append(f"step{d}")
+        units.append("m")
+    for d in rate_changes:
+        tb = decimal_year(d) - decimal_year(dates[0])
+        cols.append(np.maximum(t - tb, 0.0))
+        names.append(f"rateChange{d}")
+        units.append("m/year")
+    A = np.stack(cols, axis=1)
+    if np.linalg.matrix_rank(A) < A.shape[1]:
+        raise ValueError(f"Model is rank deficient for these dates: {names}")
+    return A, names, units
+
+
+def pattern_groups(valid):
+    """Group the columns (pixels) of a boolean (n_obs, n_pix) mask by pattern.
+
+    Yields (key bytes, rows mask, pixel indices) per distinct pattern; the
+    patterns are packed to bits and grouped with one sort.
+    """
+    keys = np.packbits(valid, axis=0).T.copy()
+    keys = keys.view(np.dtype((np.void, keys.shape[1]))).ravel()
+    patterns, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(inverse.ravel(), kind="stable")
+    bounds = np.searchsorted(inverse.ravel()[order], np.arange(len(patterns) + 1))
+    for g in range(len(patterns)):
+        yield patterns[g].tobytes(), valid[:, first[g]], order[bounds[g]:bounds[g + 1]]
+
+
+class PatternSolver:
+    """Least squares for A x = y over blocks of pixels, one multiply per
+    distinct NaN pattern; pseudo-inverses are cached across blocks."""
+
+    def __init__(self, A, cache_size=4096):
+        self.A = A
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.full = self._operators(np.ones(A.shape[0], dtype=bool))
+
+    def _operators(self, rows):
+        Ag = self.A[rows]
+        if rows.sum() <= Ag.shape[1] or np.linalg.matrix_rank(Ag) < Ag.shape[1]:
+            return None
+        cov = np.linalg.inv(Ag.T @ Ag)
+        return None if rows.all() else rows, Ag.T.copy(), cov, np.sqrt(np.diag(cov))
+
+    def _lookup(self, key, rows):
+        ops = self.cache.get(key)
+        if ops is None:
+            ops = self._operators(rows)
+            self.cache[key] = ops
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return ops
+
+    @staticmethod
+    def _solve(ops, y):
+        rows, At, cov, sd = ops
+        yg = y if rows is None else y[rows]
+        aty = At @ yg
+        x = cov @ aty
+        # sum of squared residuals without forming them: y'y - x'A'y
+        rss = np.einsum("ij,ij->j", yg, yg) - np.einsum("ij,ij->j", x, aty)
+        rms = np.sqrt(np.maximum(rss, 0.0) / (At.shape[1] - At.shape[0]))
+        return x, sd[:, None] * rms[None, :], rms
+
+    def solve(self, y):
+        """y: (n_date, n_pix) float64 with NaN gaps.
+
+        Returns x, std (n_param, n_pix) and residual RMS (n_pix,), NaN where
+        a pixel has too few dates.
+        """
+        valid = np.isfinite(y)
+        complete = valid.all(axis=0)
+        if complete.all():
+            return self._solve(self.full, y)
+
+        m, n_pix = self.A.shape[1], y.shape[1]
+        x = np.full((m, n_pix), np.nan)
+        std = np.full((m, n_pix), np.nan)
+        rms = np.full(n_pix, np.nan)
+        if complete.any():
+            idx = np.flatnonzero(complete)
+            x[:, idx], std[:, idx], rms[idx] = self._solve(self.full, y[:, idx])
+
+        partial = np.flatnonzero(~complete & valid.any(axis=0))
+        if partial.size:
+            for key, rows, pix in pattern_groups(valid[:, partial]):
+                pix = partial[pix]
+                ops = self._lookup(key, rows)
+                if ops is not None:
+                    x[:, pix], std[:, pix], rms[pix] = self._solve(ops, y[:, pix])
+        return x, std, rms
+
+
+# --------------------- I/O ------------------------
+
+def fit_file(ts_file, out_file, A, names, units, date_idx, block_rows=None,
+             mem_mb=512, zero_as_nan=False):
+    import h5py
+
+    with h5py.File(ts_file, "r") as ft:
+        ts = ft["timeseries"]
+        n_date, ny, nx = ts.shape
+        if block_rows is None:
+            per_row = len(date_idx) * nx * 8 * 4        # y, valid, residuals, copies
+            block_rows = max(1, int(mem_mb * 1024 ** 2 // per_row))
+            chunk_rows = ts.chunks[1] if ts.chunks else 1
+            block_rows = max(chunk_rows, block_rows // chunk_rows * chunk_rows)
+        solver = PatternSolver(A)
+
+        with h5py.File(out_file, "w") as fo:
+            for k, v in ft.attrs.items():
+                fo.attrs[k] = v
+            dates = [d.decode() for d in ft["date"][:]]
+            used = [dates[i] for i in date_idx]
+            fo.attrs.update({
+                "FILE_TYPE": "velocity", "UNIT": "m/year",
+                "START_DATE": used[0], "END_DATE": used[-1],
+                "DATE12": f"{used[0][2:]}_{used[-1][2:]}",
+                "MODEL_PARAMS": ",".join(names), "NUM_DATES": len(used),
+            })
+            fo.create_dataset("date", data=np.array([d.encode() for d in used]))
+            chunks = (min(ny, 256), min(nx, 256))
+            out = {}
+            for name, unit in zip(names, units):
+                for suffix in ("", "Std"):
+                    out[name + suffix] = fo.create_dataset(
+                        name + suffix, shape=(ny, nx), dtype="float32", chunks=chunks)
+                    out[name + suffix].attrs["UNIT"] = unit
+            out["residualRMS"] = fo.create_dataset("residualRMS", shape=(ny, nx),
+                                                   dtype="float32", chunks=chunks)
+            out["residualRMS"].attrs["UNIT"] = "m"
+
+            t0 = time.perf_counter()
+            contiguous = list(date_idx) == list(range(date_idx[0], date_idx[-1] + 1))
+            for y0 in range(0, ny, block_rows):
+                y1 = min(ny, y0 + block_rows)
+                if contiguous:
+                    y = ts[date_idx[0]:date_idx[-1] + 1, y0:y1, :]
+                else:
+                    y = ts[list(date_idx), y0:y1, :]
+                y = y.reshape(len(date_idx), -1).astype("float64")
+                if zero_as_nan:
+                    y[y == 0] = np.nan
+                x, std, rms = solver.solve(y)
+                shape = (y1 - y0, nx)
+                for k, name in enumerate(names):
+                    out[name][y0:y1, :] = x[k].reshape(shape)
+                    out[name + "Std"][y0:y1, :] = std[k].reshape(shape)
+                out["residualRMS"][y0:y1, :] = rms.reshape(shape)
+            dt = time.perf_counter() - t0
+    return ny * nx, dt, len(solver.cache)
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Fit velocity / seasonal / step models to every pixel of timeseries.h5."
+    )
+    p.add_argument("timeseries", help="MintPy timeseries HDF5 file.")
+    p.add_argument("-o", "--output", default="velocity_model.h5", help="Output HDF5 file.")
+    p.add_argument("--polynomial", type=int, default=1,
+                   help="Polynomial degree: 1 = offset + rate, 2 = + acceleration.")
+    p.add_argument("--periodic", default="",
+                   help="Comma-separated periods in years, e.g. 1.0,0.5 (annual, semi-annual).")
+    p.add_argument("--step", default="", help="Comma-separated YYYYMMDD dates of offsets.")
+    p.add_argument("--rate-change", default="",
+                   help="Comma-separated YYYYMMDD dates where the rate may change.")
+    p.add_argument("--start-date", default=None, help="Ignore dates before YYYYMMDD.")
+    p.add_argument("--end-date", default=None, help="Ignore dates after YYYYMMDD.")
+    p.add_argument("--ex-date", default="", help="Comma-separated dates to exclude.")
+    p.add_argument("--zero-as-nan", action="store_true",
+                   help="Treat exact zeros as missing (masked pixels written as 0).")
+    p.add_argument("--block-rows", type=int, default=None,
+                   help="Rows per block (default: from --mem-mb, aligned to HDF5 chunks).")
+    p.add_argument("--mem-mb", type=float, default=512, help="Working memory per block (MB).")
+    return p.parse_args()
+
+
+def split(text):
+    return [s.strip() for s in text.split(",") if s.strip()]
+
+
+def main():
+    args = parse_args()
+    import h5py
+
+    with h5py.File(args.timeseries, "r") as f:
+        dates = [d.decode() for d in f["date"][:]]
+    exclude = set(split(args.ex_date))
+    date_idx = [i for i, d in enumerate(dates)
+                if d not in exclude
+                and (args.start_date is None or d >= args.start_date)
+                and (args.end_date is None or d <= args.end_date)]
+    used = [dates[i] for i in date_idx]
+
+    A, names, units = design_matrix(used, args.polynomial,
+                                    [float(p) for p in split(args.periodic)],
+                                    split(args.step), split(args.rate_change))
+    print("Timeseries:", args.timeseries, f"({len(used)} of {len(dates)} dates)")
+    print("Model     :", ", ".join(names))
+    if len(used) <= A.shape[1]:
+        raise ValueError(f"{len(used)} dates cannot constrain {A.shape[1]} parameters.")
+
+    n_pix, dt, n_patterns = fit_file(args.timeseries, args.output, A, names, units, date_idx,
+                                     args.block_rows, args.mem_mb, args.zero_as_nan)
+    print(f"Fitted {n_pix} pixels in {dt:.1f} s ({n_pix / max(dt, 1e-9) / 1e6:.2f} Mpix/s, "
+          f"{n_patterns} distinct NaN patterns)")
+    print("Output    :", args.output)
+
+
+if __name__ == "__main__":
+    main()
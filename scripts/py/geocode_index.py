@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+geocode_index.py
+
+Geocode radar-coordinate products with a lookup index that is built once
+per project from the ISCE lat/lon rasters (merged/lat.rdr.full,
+merged/lon.rdr.full) and then reused for every interferogram, coherence
+and time-series slice.
+
+build
+    For every pixel of the lat/lon grid (--lalo-step, --snwe) the
+    fractional radar position (row, col) is found: a KD-tree on a
+    decimated lat/lon grid gives a first guess, refined by Newton steps
+    on the bilinear lat/lon surface of the full-resolution rasters.  The
+    index keeps, per destination pixel, the flat source index of the
+    upper-left neighbour (int32, -1 outside the swath) and the row / col
+    fractions (float16), i.e. the bilinear weights.
+
+apply
+    Each 2D slice is geocoded by one vectorised gather of the four
+    neighbours and a weighted sum (NaNs in the neighbourhood are
+    renormalised away), or by nearest neighbour for integer data
+    (connectComponent, masks).  Inputs are raster bands (raw ISCE /
+    GDAL) or MintPy HDF5 files in radar coordinates; every dataset with
+    the radar grid shape is geocoded, the rest copied, and the MintPy
+    X_FIRST / Y_FIRST / X_STEP / Y_STEP attributes are set.  As in
+    MintPy's geocode, REF_Y / REF_X are moved to the geo pixel of the
+    reference point (from REF_LAT / REF_LON, else through the index) and
+    radar-only attributes (LAT_REF1..4, LON_REF1..4, SUBSET_*) are dropped.
+
+Example (inside the ISCE project directory):
+
+python scripts/py/geocode_index.py build --lat merged/lat.rdr.full --lon merged/lon.rdr.full \
+    --lalo-step 0.0003 --out geocode_index.h5
+python scripts/py/geocode_index.py apply --index geocode_index.h5 \
+    --in merged/filt_topophase.unw:2 --out merged/filt_topophase.unw.gidx.geo
+python scripts/py/geocode_index.py apply --index geocode_index.h5 \
+    --in mintpy/timeseries.h5 --out mintpy/geo/geo_timeseries.h5
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+
+from raster_io import open_band, read_band, write_isce_headers
+
+
+# attributes that only describe the radar grid (removed on geocoding, as by MintPy)
+RADAR_ONLY_ATTRS = tuple(f"{a}_REF{i}" for i in range(1, 5) for a in ("LAT", "LON")) + \
+    ("SUBSET_XMIN", "SUBSET_XMAX", "SUBSET_YMIN", "SUBSET_YMAX")
+
+# --------------------- build ------------------------
+
+def bilinear(arr, r, c):
+    """arr sampled at fractional (r, c); r, c already clipped to the grid."""
+    r0 = np.minimum(np.floor(r).astype(np.int64), arr.shape[0] - 2)
+    c0 = np.minimum(np.floor(c).astype(np.int64), arr.shape[1] - 2)
+    fr, fc = r - r0, c - c0
+    a00, a01 = arr[r0, c0], arr[r0, c0 + 1]
+    a10, a11 = arr[r0 + 1, c0], arr[r0 + 1, c0 + 1]
+    val = (a00 * (1 - fr) * (1 - fc) + a01 * (1 - fr) * fc
+           + a10 * fr * (1 - fc) + a11 * fr * fc)
+    # partial derivatives on the cell
+    d_r = (a10 - a00) * (1 - fc) + (a11 - a01) * fc
+    d_c = (a01 - a00) * (1 - fr) + (a11 - a10) * fr
+    return val, d_r, d_c
+
+
+def locate(lat, lon, tree, tree_rc, q_lat, q_lon, iterations=5):
+    """Fractional radar (row, col) of geographic points, clipped to the grid."""
+    ny, nx = lat.shape
+    _, nearest = tree.query(np.column_stack([q_lat, q_lon]))
+    r = tree_rc[nearest, 0].astype("float64")
+    c = tree_rc[nearest, 1].astype("float64")
+    for _ in range(iterations):
+        la, la_r, la_c = bilinear(lat, r, c)
+        lo, lo_r, lo_c = bilinear(lon, r, c)
+        det = la_r * lo_c - la_c * lo_r
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dr = (lo_c * (q_lat - la) - la_c * (q_lon - lo)) / det
+            dc = (la_r * (q_lon - lo) - lo_r * (q_lat - la)) / det
+        r = np.clip(r + np.nan_to_num(dr), 0, ny - 1)
+        c = np.clip(c + np.nan_to_num(dc), 0, nx - 1)
+    return r, c
+
+
+def build_index(lat, lon, lat_step, lon_step, snwe=None, decimate=8, block_rows=256):
+    """(index int32, frac float16 (2, ...), geotransform) of the lat/lon grid."""
+    from scipy.spatial import cKDTree
+
+    ny, nx = lat.shape
+    if snwe is None:
+        snwe = (float(np.nanmin(lat)), float(np.nanmax(lat)),
+                float(np.nanmin(lon)), float(np.nanmax(lon)))
+    s, n, w, e = snwe
+    out_ny = int(np.ceil((n - s) / lat_step))
+    out_nx = int(np.ceil((e - w) / lon_step))
+    gt = (w, lon_step, 0.0, n, 0.0, -lat_step)
+
+    # decimated grid for the first guess
+    rr, cc = np.mgrid[0:ny:decimate, 0:nx:decimate]
+    tree = cKDTree(np.column_stack([lat[rr, cc].ravel(), lon[rr, cc].ravel()]))
+    tree_rc = np.column_stack([rr.ravel(), cc.ravel()])
+
+    index = np.full((out_ny, out_nx), -1, dtype="int32")
+    frac = np.zeros((2, out_ny, out_nx), dtype="float16")
+    q_lon_row = w + (np.arange(out_nx) + 0.5) * lon_step
+    for y0 in range(0, out_ny, block_rows):
+        y1 = min(out_ny, y0 + block_rows)
+        q_lat = np.repeat(n - (np.arange(y0, y1) + 0.5) * lat_step, out_nx)
+        q_lon = np.tile(q_lon_row, y1 - y0)
+        r, c = locate(lat, lon, tree, tree_rc, q_lat, q_lon)
+        la, _, _ = bilinear(lat, r, c)
+        lo, _, _ = bilinear(lon, r, c)
+        # converged to within half a destination pixel -> inside the swath
+        inside = (np.abs(la - q_lat) <= lat_step / 2) & (np.abs(lo - q_lon) <= lon_step / 2)
+        r0 = np.minimum(np.floor(r).astype(np.int64), ny - 2)
+        c0 = np.minimum(np.floor(c).astype(np.int64), nx - 2)
+        idx = np.where(inside, r0 * nx + c0, -1).astype("int32")
+        index[y0:y1] = idx.reshape(y1 - y0, out_nx)
+        frac[0, y0:y1] = (r - r0).reshape(y1 - y0, out_nx)
+        frac[1, y0:y1] = (c - c0).reshape(y1 - y0, out_nx)
+    return index, frac, gt
+
+
+def default_step(lat, lon):
+    """Square step (degrees) with about the area of a radar pixel."""
+    d = max(1, min(16, min(lat.shape) // 4))
+    la, lo = lat[::d, ::d], lon[::d, ::d]
+    la_r, la_c = np.diff(la, axis=0)[:, :-1] / d, np.diff(la, axis=1)[:-1, :] / d
+    lo_r, lo_c = np.diff(lo, axis=0)[:, :-1] / d, np.diff(lo, axis=1)[:-1, :] / d
+    return float(np.sqrt(np.nanmedian(np.abs(la_r * lo_c - la_c * lo_r))))
+
+
+# --------------------- apply ------------------------
+
+class GeocodeIndex:
+    """Loaded index; ``geocode(slice2d)`` returns the geocoded slice."""
+
+    def __init__(self, path):
+        import h5py
+
+        with h5py.File(path, "r") as f:
+            index = f["index"][:]
+            frac = f["frac"][:]
+            self.src_shape = tuple(int(v) for v in f.attrs["SRC_SHAPE"])
+            self.geotransform = tuple(float(v) for v in f.attrs["GEOTRANSFORM"])
+        self.shape = index.shape
+        self.valid = np.flatnonzero(index.ravel() >= 0)
+        self.i00 = index.ravel()[self.valid].astype(np.int64)
+        self.fr = fr = frac[0].ravel()[self.valid].astype("float32")
+        self.fc = fc = frac[1].ravel()[self.valid].astype("float32")
+        nx = self.src_shape[1]
+        self.neighbours = (self.i00, self.i00 + 1, self.i00 + nx, self.i00 + nx + 1)
+        self.weights = ((1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc)
+        self.nearest = self.i00 + (fr >= 0.5) * nx + (fc >= 0.5)
+
+    def geocode(self, src, method="bilinear", fill=np.nan):
+        src = np.asarray(src).ravel()
+        if src.size != self.src_shape[0] * self.src_shape[1]:
+            raise ValueError(f"Input grid {src.size} pixels != index source grid {self.src_shape}")
+        if method == "nearest" or src.dtype.kind in "iub":
+            out = np.full(self.shape[0] * self.shape[1], fill if src.dtype.kind == "f" else 0,
+                          dtype=src.dtype)
+            out[self.valid] = src[self.nearest]
+            return out.reshape(self.shape)
+        num = np.zeros(self.valid.size, dtype="float32")
+        den = np.zeros(self.valid.size, dtype="float32")
+        for idx, w in zip(self.neighbours, self.weights):
+            v = src[idx].astype("float32")
+            ok = np.isfinite(v)
+            num += np.where(ok, v, 0.0) * w
+            den += ok * w
+        out = np.full(self.shape[0] * self.shape[1], fill, dtype="float32")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[self.valid] = np.where(den > 1e-3, num / den, fill)
+        return out.reshape(self.shape)
+
+    def geo_attrs(self):
+        x0, dx, _, y0, _, dy = self.geotransform
+        return {"LENGTH": self.shape[0], "WIDTH": self.shape[1], "X_FIRST": x0, "X_STEP": dx,
+                "Y_FIRST": y0, "Y_STEP": dy, "X_UNIT": "degrees", "Y_UNIT": "degrees"}
+
+    def geo_pixel(self, row, col, max_dist=1.0):
+        """(y, x) of the geo pixel closest to radar pixel (row, col); None if no
+        geo pixel maps within ``max_dist`` radar pixels of it (outside the grid)."""
+        nx = self.src_shape[1]
+        d2 = (self.i00 // nx + self.fr - row) ** 2 + (self.i00 % nx + self.fc - col) ** 2
+        if not d2.size:
+            return None
+        k = int(np.argmin(d2))
+        if d2[k] > max_dist ** 2:
+            return None
+        return divmod(int(self.valid[k]), self.shape[1])
+
+    def file_attrs(self, attrs):
+        """MintPy attributes of a radar-grid file, converted to the geo grid."""
+        out = {k: v for k, v in attrs.items() if k not in RADAR_ONLY_ATTRS}
+        out.update(self.geo_attrs())
+        if "REF_Y" not in out or "REF_X" not in out:
+            return out
+        x0, dx, _, y0, _, dy = self.geotransform
+
+        def num(key):
+            v = out.get(key)
+            v = v.decode() if isinstance(v, bytes) else v
+            try:
+                return float(v)
+            except (TypeError, ValueError):
+                return None
+
+        ref_lat, ref_lon = num("REF_LAT"), num("REF_LON")
+        if ref_lat is not None and ref_lon is not None:
+            yx = (int(np.floor((ref_lat - y0) / dy)), int(np.floor((ref_lon - x0) / dx)))
+            if not (0 <= yx[0] < self.shape[0] and 0 <= yx[1] < self.shape[1]):
+                yx = None
+        else:
+            yx = self.geo_pixel(num("REF_Y"), num("REF_X"))
+            if yx is not None:
+                out["REF_LAT"] = y0 + (yx[0] + 0.5) * dy
+                out["REF_LON"] = x0 + (yx[1] + 0.5) * dx
+        if yx is None:
+            print("[WARN] Reference point outside the geo grid; REF_Y / REF_X removed.")
+            for k in ("REF_Y", "REF_X", "REF_LAT", "REF_LON"):
+                out.pop(k, None)
+        else:
+            out["REF_Y"], out["REF_X"] = yx
+        return out
+
+
+def apply_h5(gidx, in_path, out_path, method):
+    import h5py
+
+    n_slices = 0
+    with h5py.File(in_path, "r") as fi, h5py.File(out_path, "w") as fo:
+        fo.attrs.update(gidx.file_attrs(dict(fi.attrs)))
+        for name, ds in fi.items():
+            if not isinstance(ds, h5py.Dataset):
+                continue
+            if ds.shape[-2:] != gidx.src_shape or ds.ndim not in (2, 3):
+                fi.copy(ds, fo, name=name)
+                continue
+            m = "nearest" if ds.dtype.kind in "iub" else method
+            dtype = ds.dtype if m == "nearest" else np.dtype("float32")
+            shape = ds.shape[:-2] + gidx.shape
+            out = fo.create_dataset(name, shape=shape, dtype=dtype,
+                                    chunks=(1,) * (ds.ndim - 2) + (min(256, shape[-2]), min(256, shape[-1])),
+                                    compression=ds.compression)
+            for k2, v in ds.attrs.items():
+                out.attrs[k2] = v
+            if ds.ndim == 2:
+                out[:] = gidx.geocode(ds[:], m)
+                n_slices += 1
+            else:
+                for i in range(ds.shape[0]):
+                    out[i] = gidx.geocode(ds[i], m)
+                    n_slices += 1
+    return n_slices
+
+
+def apply_raster(gidx, spec, out_path, method):
+    path, band = spec, 1
+    head, sep, tail = spec.rpartition(":")
+    if sep and tail.isdigit():
+        path, band = head, int(tail)
+    src, _, _ = open_band(path, band)
+    geo = gidx.geocode(np.asarray(src), method)
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    if out_path.lower().endswith((".tif", ".tiff")):
+        from raster_io import save_geotiff, WGS84_WKT
+
+        save_geotiff(out_path, geo, gidx.geotransform, WGS84_WKT, nodata=np.nan)
+    else:
+        geo.astype(geo.dtype.newbyteorder("<")).tofile(out_path)
+        write_isce_headers(out_path, gidx.shape[1], gidx.shape[0], 1, gidx.geotransform,
+                           dtype=geo.dtype)
+    return 1
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Reusable radar-to-geo lookup index.")
+    sub = p.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Build the index from lat/lon rasters.")
+    b.add_argument("--lat", default="merged/lat.rdr.full", help="Latitude raster (radar grid).")
+    b.add_argument("--lon", default="merged/lon.rdr.full", help="Longitude raster (radar grid).")
+    b.add_argument("--lalo-step", default=None,
+                   help="lat_step[,lon_step] in degrees (default: about the radar pixel area).")
+    b.add_argument("--snwe", default=None, help="Output bounding box S,N,W,E (default: full).")
+    b.add_argument("--decimate", type=int, default=8,
+                   help="Decimation of the first-guess KD-tree (default 8).")
+    b.add_argument("--out", default="geocode_index.h5", help="Index file.")
+    a = sub.add_parser("apply", help="Geocode a raster band or a MintPy HDF5 file.")
+    a.add_argument("--index", default="geocode_index.h5", help="Index file.")
+    a.add_argument("--in", dest="inputs", nargs="+", required=True,
+                   help="Radar-grid raster[:band] or HDF5 file(s).")
+    a.add_argument("--out", nargs="+", required=True, help="Output file(s), one per input.")
+    a.add_argument("--method", choices=("bilinear", "nearest"), default="bilinear",
+                   help="Interpolation of float data (integer data is always nearest).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    import h5py
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        lat, _, _ = read_band(args.lat, band=1, dtype="float64")
+        lon, _, _ = read_band(args.lon, band=1, dtype="float64")
+        if lat.shape != lon.shape:
+            raise RuntimeError(f"Shape mismatch: lat {lat.shape} vs lon {lon.shape}")
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        if args.lalo_step:
+            steps = [float(v) for v in args.lalo_step.split(",")]
+            lat_step, lon_step = steps[0], steps[-1]
+        else:
+            lat_step = lon_step = default_step(lat, lon)
+        snwe = tuple(float(v) for v in args.snwe.split(",")) if args.snwe else None
+        index, frac, gt = build_index(lat, lon, lat_step, lon_step, snwe, args.decimate)
+        with h5py.File(args.out, "w") as f:
+            f.create_dataset("index", data=index, chunks=True, compression="gzip")
+            f.create_dataset("frac", data=frac, chunks=True, compression="gzip")
+            f.attrs["SRC_SHAPE"] = lat.shape
+            f.attrs["GEOTRANSFORM"] = gt
+            f.attrs["LAT_FILE"] = os.path.abspath(args.lat)
+            f.attrs["LON_FILE"] = os.path.abspath(args.lon)
+        valid = float((index >= 0).mean())
+        print(f"Radar grid {lat.shape[0]} x {lat.shape[1]} -> geo grid {index.shape[0]} x "
+              f"{index.shape[1]} (step {lat_step:.6g} x {lon_step:.6g} deg), "
+              f"{valid:.1%} inside the swath")
+        print(f"Built in {time.perf_counter() - t0:.1f} s -> {args.out} "
+              f"({(index.nbytes + frac.nbytes) / 1e6:.1f} MB in memory)")
+        return
+
+    if len(args.inputs) != len(args.out):
+        raise SystemExit("--in and --out need the same number of files.")
+    gidx = GeocodeIndex(args.index)
+    for src, dst in zip(args.inputs, args.out):
+        t0 = time.perf_counter()
+        if src.endswith(".h5"):
+            n = apply_h5(gidx, src, dst, args.method)
+        else:
+            n = apply_raster(gidx, src, dst, args.method)
+        dt = time.perf_counter() - t0
+        print(f"{src} -> {dst}: {n} slice(s) in {dt:.2f} s ({dt / max(n, 1) * 1000:.0f} ms/slice)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ifg_quality.py
+
+Per-interferogram quality table of a MintPy ifgramStack.h5, i.e. the numbers
+behind modify_network (mintpy.network.minCoherence / minAreaRatio).
+
+The stack is read once, in row strips (aligned to the HDF5 chunks), and for
+every pair the strip accumulates
+
+- coherence sum and a 1000-bin histogram  -> mean / median coherence and the
+  over the whole AOI / mask                  area ratio (fraction >= --area-coh),
+                                             as modify_network computes them
+- unwrapped pixel count                   -> valid-area fraction
+- normal equations of a plane a + b x + c y on the unwrapped phase
+                                          -> phase std, ramp magnitude
+                                             (peak-to-peak of the plane) and
+                                             residual RMS after the ramp
+- pixel counts per connected-component label
+                                          -> number of components and the
+                                             fraction in the largest one
+
+All accumulators are sums, so the strips are processed by --workers
+processes (each opens the file itself) and merged in strip order: the table
+does not depend on the number of workers.  Zero or NaN phase is no-data (as
+in MintPy); --aoi / mintpy.network.aoiYX and --mask limit the area.
+
+Outputs (in --out-dir, default outputs/):
+
+    ifg_quality.csv          one row per pair, sorted by --sort
+    ifg_quality_network.png  dates vs. bperp, pairs coloured by the
+                             --plot-metric, pairs failing the cfg
+                             thresholds dashed
+
+Example (inside the MintPy work dir):
+
+python scripts/py/ifg_quality.py inputs/ifgramStack.h5 --cfg smallbaselineApp.cfg \
+    --workers 4 --out-dir outputs
+"""
+
+import os
+import csv
+import time
+import argparse
+
+import numpy as np
+
+from run_mintpy_steps import read_cfg
+
+
+HIST_BINS = 1000
+COLUMNS = ["date12", "index", "dropped", "btemp_days", "bperp_m", "mean_coh", "median_coh",
+           "area_ratio", "valid_fraction", "phase_std_rad", "ramp_rad", "residual_rms_rad",
+           "num_conn_comp", "largest_comp_fraction", "below_min_coh", "below_min_area_ratio"]
+
+
+# --------------------- accumulation ------------------------
+
+class PairAccumulator:
+    """Mergeable per-pair sums of one or more row strips."""
+
+    def __init__(self, n_ifg):
+        self.n_pixels = 0
+        self.count = np.zeros(n_ifg, dtype="int64")
+        self.coh_sum = np.zeros(n_ifg, dtype="float64")
+        self.coh_hist = np.zeros((n_ifg, HIST_BINS), dtype="int64")
+        self.GtG = np.zeros((n_ifg, 3, 3), dtype="float64")
+        self.Gtz = np.zeros((n_ifg, 3), dtype="float64")
+        self.ztz = np.zeros(n_ifg, dtype="float64")
+        self.comp = np.zeros((n_ifg, 1), dtype="int64")
+
+    def merge(self, other):
+        self.n_pixels += other.n_pixels
+        self.count += other.count
+        self.coh_sum += other.coh_sum
+        self.coh_hist += other.coh_hist
+        self.GtG += other.GtG
+        self.Gtz += other.Gtz
+        self.ztz += other.ztz
+        width = max(self.comp.shape[1], other.comp.shape[1])
+        comp = np.zeros((len(self.count), width), dtype="int64")
+        comp[:, :self.comp.shape[1]] += self.comp
+        comp[:, :other.comp.shape[1]] += other.comp
+        self.comp = comp
+        return self
+
+
+def strip_stats(stack_path, r0, r1, x0, x1, used, mask_spec=None):
+    """PairAccumulator of rows r0:r1, columns x0:x1 of the stack."""
+    import h5py
+
+    n = len(used)
+    acc = PairAccumulator(n)
+    with h5py.File(stack_path, "r") as f:
+        n_all, ny, nx = f["unwrapPhase"].shape
+        sel = slice(None) if n == n_all else list(used)
+        phase = f["unwrapPhase"][sel, r0:r1, x0:x1].reshape(n, -1)
+        coh = f["coherence"][sel, r0:r1, x0:x1].reshape(n, -1)
+        cc = f["connectComponent"][sel, r0:r1, x0:x1].reshape(n, -1) \
+            if "connectComponent" in f else None
+    area = np.ones(phase.shape[1], dtype=bool)
+    if mask_spec is not None:
+        mpath, mname = mask_spec.rsplit(":", 1)
+        with h5py.File(mpath, "r") as f:
+            area = np.asarray(f[mname][r0:r1, x0:x1]).ravel() != 0
+    acc.n_pixels = int(area.sum())
+
+    valid = np.isfinite(phase) & (phase != 0) & area
+    # coherence over the whole AOI / mask, whether or not the pixel is unwrapped
+    cvalid = np.isfinite(coh) & area
+    coh = np.where(cvalid, coh, 0.0).astype("float32")
+    acc.count = valid.sum(axis=1, dtype="int64")
+    acc.coh_sum = coh.sum(axis=1, dtype="float64")
+    bins = np.clip((coh * HIST_BINS).astype("int64"), 0, HIST_BINS - 1)
+    rows = np.broadcast_to(np.arange(n)[:, None], bins.shape)
+    acc.coh_hist = np.bincount((rows * HIST_BINS + bins)[cvalid],
+                               minlength=n * HIST_BINS).reshape(n, HIST_BINS)
+
+    # plane a + b x + c y in coordinates normalised to [-1, 1] over the full grid
+    yy, xx = np.mgrid[r0:r1, x0:x1]
+    G = np.stack([np.ones(yy.size), 2.0 * xx.ravel() / max(1, nx - 1) - 1.0,
+                  2.0 * yy.ravel() / max(1, ny - 1) - 1.0], axis=1)
+    W = valid.astype("float64")
+    Z = np.where(valid, phase, 0.0).astype("float64")
+    for i in range(3):
+        for j in range(i, 3):
+            acc.GtG[:, i, j] = acc.GtG[:, j, i] = W @ (G[:, i] * G[:, j])
+    acc.Gtz = Z @ G
+    acc.ztz = np.einsum("ij,ij->i", Z, Z)
+
+    if cc is not None:
+        labels = np.where(valid, cc, 0).astype("int64")
+        width = int(labels.max()) + 1
+        acc.comp = np.bincount((rows * width + labels).ravel(),
+                               minlength=n * width).reshape(n, width)
+        acc.comp[:, 0] = 0                  # label 0 = not unwrapped
+    return acc
+
+
+def accumulate(stack_path, used, aoi=None, mask_spec=None, workers=1, mem_mb=512):
+    """Merged PairAccumulator of the whole stack (or AOI)."""
+    import h5py
+
+    with h5py.File(stack_path, "r") as f:
+        _, ny, nx = f["unwrapPhase"].shape
+        chunk_rows = (f["unwrapPhase"].chunks or (1, 1, 1))[1]
+    y0, y1, x0, x1 = aoi or (0, ny, 0, nx)
+    # phase + coherence (float32) + components + work arrays per pixel and pair
+    per_row = len(used) * (x1 - x0) * 40
+    rows = max(1, int(mem_mb * 1024 ** 2 // max(1, workers) // per_row))
+    rows = max(chunk_rows, rows // chunk_rows * chunk_rows)
+    strips = [(r, min(y1, r + rows)) for r in range(y0, y1, rows)]
+
+    total = PairAccumulator(len(used))
+    args = [(stack_path, r0, r1, x0, x1, used, mask_spec) for r0, r1 in strips]
+    if workers <= 1 or len(strips) == 1:
+        parts = (strip_stats(*a) for a in args)
+        for part in parts:
+            total.merge(part)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(strip_stats, *zip(*args)):
+                total.merge(part)
+    return total
+
+
+# --------------------- metrics ------------------------
+
+def hist_quantile(hist, q):
+    """Quantile of each row of a coherence histogram (bin centres)."""
+    cum = np.cumsum(hist, axis=1)
+    n = cum[:, -1]
+    idx = np.array([np.searchsorted(c, q * t) if t else 0 for c, t in zip(cum, n)])
+    return np.where(n > 0, (idx + 0.5) / HIST_BINS, np.nan)
+
+
+def pair_metrics(acc, area_coh):
+    """Dict of per-pair metric arrays from the merged accumulator."""
+    n = acc.count.astype("float64")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = acc.Gtz[:, 0] / n
+        phase_std = np.sqrt(np.maximum(acc.ztz / n - mean ** 2, 0.0))
+        ramp = np.full(len(n), np.nan)
+        resid = np.full(len(n), np.nan)
+        for k in np.nonzero(n >= 3)[0]:
+            try:
+                m = np.linalg.solve(acc.GtG[k], acc.Gtz[k])
+            except np.linalg.LinAlgError:
+                continue
+            ramp[k] = 2.0 * (abs(m[1]) + abs(m[2]))
+            resid[k] = np.sqrt(max(acc.ztz[k] - m @ acc.Gtz[k], 0.0) / n[k])
+        n_coh = acc.coh_hist.sum(axis=1)
+        above = acc.coh_hist[:, int(round(area_coh * HIST_BINS)):].sum(axis=1)
+        comp_pix = acc.comp[:, 1:]
+        return {
+            "mean_coh": acc.coh_sum / n_coh,
+            "median_coh": hist_quantile(acc.coh_hist, 0.5),
+            "area_ratio": above / n_coh,
+            "valid_fraction": n / max(1, acc.n_pixels),
+            "phase_std_rad": phase_std,
+            "ramp_rad": ramp,
+            "residual_rms_rad": resid,
+            "num_conn_comp": (comp_pix > 0).sum(axis=1),
+            "largest_comp_fraction": (comp_pix.max(axis=1) / n) if comp_pix.size
+            else np.full(len(n), np.nan),
+        }
+
+
+def cfg_float(cfg, key, default):
+    value = cfg.get(key, "auto")
+    return default if value in ("auto", "no", "") else float(value)
+
+
+def parse_aoi(text, shape):
+    """'y0:y1,x0:x1' -> (y0, y1, x0, x1) clipped to shape."""
+    ys, xs = text.split(",")
+    y0, y1 = (int(v) for v in ys.split(":"))
+    x0, x1 = (int(v) for v in xs.split(":"))
+    ny, nx = shape
+    y0, y1, x0, x1 = max(0, y0), min(ny, y1), max(0, x0), min(nx, x1)
+    if y1 <= y0 or x1 <= x0:
+        raise ValueError(f"Empty AOI: {text}")
+    return y0, y1, x0, x1
+
+
+# --------------------- output ------------------------
+
+def days_between(d1, d2):
+    return int((np.datetime64(f"{d2[:4]}-{d2[4:6]}-{d2[6:]}")
+                - np.datetime64(f"{d1[:4]}-{d1[4:6]}-{d1[6:]}")).astype(int))
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        for r in rows:
+            w.writerow(["" if isinstance(r[c], float) and np.isnan(r[c])
+                        else f"{r[c]:.5f}" if isinstance(r[c], float) else r[c]
+                        for c in COLUMNS])
+
+
+def plot_network(path, rows, metric, date_bperp):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from matplotlib.dates import date2num
+    from datetime import datetime
+
+    def t(d):
+        return date2num(datetime.strptime(d, "%Y%m%d"))
+
+    segs, values, styles = [], [], []
+    for r in rows:
+        d1, d2 = r["date12"].split("_")
+        segs.append([(t(d1), date_bperp[d1]), (t(d2), date_bperp[d2])])
+        values.append(r[metric])
+        styles.append("--" if r["dropped"] or r["below_min_coh"] or r["below_min_area_ratio"]
+                      else "-")
+    fig, ax = plt.subplots(figsize=(10, 5))
+    lc = LineCollection(segs, cmap="RdYlBu", linestyles=styles, linewidths=1.2)
+    lc.set_array(np.asarray(values, dtype="float64"))
+    ax.add_collection(lc)
+    dates = sorted(date_bperp)
+    ax.plot([t(d) for d in dates], [date_bperp[d] for d in dates], "ko", ms=4)
+    ax.xaxis_date()
+    ax.autoscale_view()
+    fig.colorbar(lc, ax=ax, label=metric)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Perpendicular baseline [m]")
+    ax.set_title(f"Interferogram network ({len(rows)} pairs, dashed = dropped / below threshold)")
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def date_baselines(date12, bperp):
+    """Per-date perpendicular baseline relative to the first date (least squares)."""
+    dates = sorted({d for pair in date12 for d in pair})
+    index = {d: k for k, d in enumerate(dates)}
+    A = np.zeros((len(date12), len(dates)))
+    for k, (d1, d2) in enumerate(date12):
+        A[k, index[d1]], A[k, index[d2]] = -1.0, 1.0
+    b = np.linalg.lstsq(A[:, 1:], np.asarray(bperp, dtype="float64"), rcond=None)[0]
+    return dict(zip(dates, np.concatenate([[0.0], b])))
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Per-interferogram quality metrics of ifgramStack.h5.")
+    p.add_argument("stack", help="MintPy ifgramStack.h5.")
+    p.add_argument("--out-dir", default="outputs", help="Folder for the table and plot.")
+    p.add_argument("--cfg", default=None,
+                   help="smallbaselineApp cfg: minCoherence / minAreaRatio / aoiYX thresholds.")
+    p.add_argument("--min-coh", type=float, default=None,
+                   help="Mean-coherence threshold (default: cfg minCoherence, else 0.7).")
+    p.add_argument("--min-area-ratio", type=float, default=None,
+                   help="Area-ratio threshold (default: cfg minAreaRatio, else 0.75).")
+    p.add_argument("--area-coh", type=float, default=None,
+                   help="Pixel coherence counted in the area ratio (default: the --min-coh value).")
+    p.add_argument("--aoi", default=None, help="Area y0:y1,x0:x1 (default: cfg aoiYX, else all).")
+    p.add_argument("--mask", default=None,
+                   help="Mask 'file.h5:dataset' (non-zero = use), e.g. waterMask.h5:mask.")
+    p.add_argument("--all", action="store_true", help="Include pairs marked in dropIfgram.")
+    p.add_argument("--sort", default="mean_coh", choices=COLUMNS, help="Table sort column.")
+    p.add_argument("--plot-metric", default="mean_coh", help="Metric used to colour the network plot.")
+    p.add_argument("--no-plot", action="store_true", help="Only write the table.")
+    p.add_argument("--workers", type=int, default=1, help="Worker processes (default 1).")
+    p.add_argument("--mem-mb", type=float, default=512, help="Working memory, all workers (MB).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    import h5py
+
+    cfg = read_cfg(args.cfg) if args.cfg else {}
+    min_coh = args.min_coh if args.min_coh is not None else \
+        cfg_float(cfg, "mintpy.network.minCoherence", 0.7)
+    min_area = args.min_area_ratio if args.min_area_ratio is not None else \
+        cfg_float(cfg, "mintpy.network.minAreaRatio", 0.75)
+    area_coh = args.area_coh if args.area_coh is not None else min_coh
+
+    with h5py.File(args.stack, "r") as f:
+        date12 = [(d1.decode(), d2.decode()) for d1, d2 in f["date"][:]]
+        drop = ~f["dropIfgram"][:] if "dropIfgram" in f else np.zeros(len(date12), dtype=bool)
+        bperp = f["bperp"][:] if "bperp" in f else np.zeros(len(date12))
+        shape = f["unwrapPhase"].shape[1:]
+    used = [k for k in range(len(date12)) if args.all or not drop[k]]
+    aoi_text = args.aoi or cfg.get("mintpy.network.aoiYX", "auto")
+    aoi = None if aoi_text in ("auto", "no", "") else parse_aoi(aoi_text, shape)
+    print(f"Stack : {args.stack} ({len(used)} of {len(date12)} pairs, {shape[0]} x {shape[1]})")
+    if aoi:
+        print(f"AOI   : rows {aoi[0]}:{aoi[1]}, cols {aoi[2]}:{aoi[3]}")
+
+    t0 = time.perf_counter()
+    acc = accumulate(args.stack, used, aoi, args.mask, args.workers, args.mem_mb)
+    print(f"Read once in {time.perf_counter() - t0:.1f} s ({args.workers} worker(s))")
+    metrics = pair_metrics(acc, area_coh)
+
+    rows = []
+    for k, ifg in enumerate(used):
+        d1, d2 = date12[ifg]
+        r = {"date12": f"{d1}_{d2}", "index": ifg, "dropped": int(drop[ifg]),
+             "btemp_days": days_between(d1, d2), "bperp_m": float(bperp[ifg])}
+        for name, values in metrics.items():
+            v = values[k]
+            r[name] = int(v) if name == "num_conn_comp" else float(v)
+        r["below_min_coh"] = int(r["mean_coh"] < min_coh)
+        r["below_min_area_ratio"] = int(r["area_ratio"] < min_area)
+        rows.append(r)
+    rows.sort(key=lambda r: (np.isnan(r[args.sort]) if isinstance(r[args.sort], float)
+                             else False, r[args.sort]))
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    csv_path = os.path.join(args.out_dir, "ifg_quality.csv")
+    write_csv(csv_path, rows)
+    print(f"Pairs below minCoherence {min_coh}: {sum(r['below_min_coh'] for r in rows)}")
+    print(f"Pairs below minAreaRatio {min_area} (pixels >= {area_coh}): "
+          f"{sum(r['below_min_area_ratio'] for r in rows)}")
+    print("Table :", csv_path)
+    if not args.no_plot:
+        if args.plot_metric not in rows[0]:
+            raise ValueError(f"Unknown --plot-metric {args.plot_metric}")
+        png_path = os.path.join(args.out_dir, "ifg_quality_network.png")
+        plot_network(png_path, rows, args.plot_metric,
+                     date_baselines([date12[k] for k in used], bperp[used]))
+        print("Plot  :", png_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+incremental_update.py
+
+Incremental update of an existing MintPy stack when new Sentinel-1
+acquisitions arrive, instead of rerunning the full chain.
+
+1. Detect SLC dates in the SLC folder that are not in ifgramStack.h5.
+2. List the interferograms required by mintpy.network.type = sequential
+   (each new date paired with the --num-conn previous dates).  The list is
+   written to date12_new.txt so ISCE can be asked to form only those pairs.
+3. Append the new interferograms (unwrapPhase, coherence, date, bperp,
+   dropIfgram) to inputs/ifgramStack.h5.
+4. Estimate displacement for the new dates only, holding the existing
+   dates of timeseries.h5 fixed, and insert them in date order (later
+   existing dates are moved; a back-filled date is placed where it belongs).
+   New dates before the first (reference) date are refused.
+5. Update velocity.h5 from per-pixel running sums (velocity_sums.h5), so
+   only the new dates are read.  The sums record the identity (size, mtime)
+   of timeseries.h5 they were built from and are rebuilt when the file was
+   rewritten since (e.g. by a full MintPy rerun).  velocity / velocityStd
+   are a plain linear fit of the raw timeseries.h5: they replace the
+   velocity.h5 of MintPy's velocity step, not its timeFunc model of the
+   DEM-error-corrected time series.
+
+Datasets that were created with a fixed size are converted once to
+resizable datasets; later updates only append.
+
+Note: correct_topography / residual_RMS are not redone here; run the full
+MintPy chain periodically to refresh DEM-error-corrected products.
+
+Example (inside the ISCE project directory):
+
+python scripts/py/incremental_update.py --cfg configs/smallbaselineApp.cfg --detect-only
+python scripts/py/incremental_update.py --cfg configs/smallbaselineApp.cfg
+"""
+
+import os
+import re
+import json
+import glob
+import argparse
+
+import numpy as np
+
+from date_utils import decimal_year
+from file_utils import file_identity
+from raster_io import band_count, read_band
+from run_mintpy_steps import read_cfg
+
+
+SLC_DATE = re.compile(r"S1[ABCD]_IW_SLC__\w{4}_(\d{8})T\d{6}")
+
+
+# --------------------- dates and network ------------------------
+
+def slc_dates(slc_dir):
+    dates = set()
+    for name in os.listdir(slc_dir):
+        m = SLC_DATE.match(name)
+        if m:
+            dates.add(m.group(1))
+    return sorted(dates)
+
+
+def sequential_pairs(old_dates, new_dates, num_conn):
+    """Pairs (d1, d2) of a sequential network that involve a new date."""
+    all_dates = sorted(set(old_dates) | set(new_dates))
+    pairs = []
+    for d in sorted(new_dates):
+        i = all_dates.index(d)
+        for j in range(max(0, i - num_conn), i):
+            pairs.append((all_dates[j], d))
+        # a back-filled date also closes pairs with later existing dates
+        for j in range(i + 1, min(len(all_dates), i + num_conn + 1)):
+            if all_dates[j] not in new_dates:
+                pairs.append((d, all_dates[j]))
+    return sorted(set(pairs))
+
+
+def stack_dates(stack_file):
+    import h5py
+
+    with h5py.File(stack_file, "r") as f:
+        date12 = [(a.decode(), b.decode()) for a, b in f["date"][:]]
+    dates = sorted({d for pair in date12 for d in pair})
+    return date12, dates
+
+
+def read_bperp(baseline_dir, ref_date, date):
+    """Average perpendicular baseline of `date` w.r.t. the stack reference
+    date from an ISCE baselines/<ref>_<date>/<ref>_<date>.txt file (or None)."""
+    if not baseline_dir or date == ref_date:
+        return 0.0 if date == ref_date else None
+    for d1, d2, sign in ((ref_date, date, 1.0), (date, ref_date, -1.0)):
+        txt = os.path.join(baseline_dir, f"{d1}_{d2}", f"{d1}_{d2}.txt")
+        if not os.path.exists(txt):
+            continue
+        values = []
+        with open(txt) as f:
+            for line in f:
+                if "Bperp" in line and ":" in line:
+                    values.append(float(line.split(":")[-1]))
+        if values:
+            return sign * float(np.mean(values))
+    return None
+
+
+# --------------------- HDF5 helpers ------------------------
+
+def make_resizable(f, name):
+    """Return dataset `name`, converting it once to maxshape (None, ...)."""
+    ds = f[name]
+    if ds.maxshape[0] is None:
+        return ds
+    print(f"  converting {name} to a resizable dataset (one-time copy)")
+    tmp = name + "__resizable"
+    chunks = ds.chunks or ((1,) + ds.shape[1:] if ds.ndim == 3 else True)
+    new = f.create_dataset(tmp, shape=ds.shape, maxshape=(None,) + ds.shape[1:],
+                           dtype=ds.dtype, chunks=chunks,
+                           compression=ds.compression)
+    if ds.ndim == 3:
+        for i in range(ds.shape[0]):
+            new[i] = ds[i]
+    else:
+        new[...] = ds[...]
+    for k, v in ds.attrs.items():
+        new.attrs[k] = v
+    del f[name]
+    f.move(tmp, name)
+    return f[name]
+
+
+def append_rows(f, name, data):
+    ds = make_resizable(f, name)
+    n0 = ds.shape[0]
+    ds.resize(n0 + data.shape[0], axis=0)
+    ds[n0:] = data
+    return n0
+
+
+# --------------------- steps ------------------------
+
+def date_baselines(baseline_dir, ref_date, dates, known=None):
+    """{date: bperp w.r.t. ref_date or None}, read once per date."""
+    known = {} if known is None else known
+    for d in dates:
+        if d not in known:
+            known[d] = read_bperp(baseline_dir, ref_date, d)
+    return known
+
+
+def append_ifgrams(stack_file, pairs, unw_pattern, cor_pattern, baseline_dir,
+                   min_coherence, baselines=None):
+    """Append new interferograms to ifgramStack.h5; returns their indices.
+
+    ``baselines`` ({date: bperp}) is filled with the per-date baselines read.
+    """
+    import h5py
+
+    baselines = {} if baselines is None else baselines
+    with h5py.File(stack_file, "a") as f:
+        _, ny, nx = f["unwrapPhase"].shape
+        ref_date = sorted({d.decode() for d in f["date"][:].ravel()})[0]
+
+        rows = []
+        for d1, d2 in pairs:
+            date12 = f"{d1}_{d2}"
+            unw_path = unw_pattern.replace("*", date12)
+            cor_path = cor_pattern.replace("*", date12)
+            for path in (unw_path, cor_path):
+                if not (os.path.exists(path) or os.path.exists(path + ".vrt")):
+                    raise RuntimeError(f"Missing interferogram product: {path}")
+
+            # ISCE .unw / .cor: band 2 holds phase / coherence when two bands
+            unw, _, _ = read_band(unw_path, band=min(2, band_count(unw_path)))
+            cor, _, _ = read_band(cor_path, band=min(2, band_count(cor_path)))
+            if unw.shape != (ny, nx) or cor.shape != (ny, nx):
+                raise RuntimeError(f"Shape mismatch for {date12}: "
+                                   f"{unw.shape} vs stack {(ny, nx)}")
+
+            date_baselines(baseline_dir, ref_date, (d1, d2), baselines)
+            b1, b2 = baselines[d1], baselines[d2]
+            bperp = (b2 - b1) if (b1 is not None and b2 is not None) else 0.0
+            if b1 is None or b2 is None:
+                print(f"  WARN: no baseline found for {date12}, bperp = 0")
+
+            keep = float(np.nanmean(cor)) >= min_coherence
+            i = append_rows(f, "unwrapPhase", unw[np.newaxis])
+            append_rows(f, "coherence", cor[np.newaxis])
+            if "connectComponent" in f:
+                # no connected components from ISCE for appended pairs:
+                # mark every valid pixel as component 1
+                cc = np.where(np.isfinite(unw) & (unw != 0), 1, 0)
+                append_rows(f, "connectComponent",
+                            cc[np.newaxis].astype(f["connectComponent"].dtype))
+            append_rows(f, "date", np.array([[d1.encode(), d2.encode()]]))
+            append_rows(f, "bperp", np.array([bperp], dtype=f["bperp"].dtype))
+            append_rows(f, "dropIfgram", np.array([keep]))
+            rows.append(i)
+            print(f"  appended {date12} (index {i}, keep={keep}, bperp={bperp:.1f} m)")
+    return rows
+
+
+def solve_pattern_groups(A, obs, known):
+    """Least squares x for A x = obs - known per pixel, grouping pixels with
+    the same NaN pattern so every group is one matrix multiply.
+
+    A: (n_ifg, n_new); obs/known: (n_ifg, n_pix). Returns (n_new, n_pix).
+    """
+    rhs = obs - known
+    valid = np.isfinite(rhs)
+    x = np.full((A.shape[1], rhs.shape[1]), np.nan, dtype="float32")
+    keys = np.packbits(valid, axis=0)
+    patterns, inverse = np.unique(keys, axis=1, return_inverse=True)
+    inverse = inverse.ravel()
+    for g in range(patterns.shape[1]):
+        pix = np.flatnonzero(inverse == g)
+        rows = valid[:, pix[0]]
+        if not rows.any():
+            continue
+        Ag = A[rows]
+        solvable = np.abs(Ag).sum(axis=0) > 0
+        x[np.ix_(solvable, pix)] = np.linalg.pinv(Ag[:, solvable]) @ rhs[np.ix_(rows, pix)]
+    return x
+
+
+def update_timeseries(stack_file, ts_file, new_rows, new_dates, row_block, baselines=None):
+    """Insert displacement (m) of new_dates into ts_file in date order, old dates held fixed.
+
+    ``baselines`` ({date: bperp}) gives the per-date bperp of the new dates
+    when ts_file has a bperp dataset.
+    """
+    import h5py
+
+    with h5py.File(stack_file, "r") as fs, h5py.File(ts_file, "a") as ft:
+        atr = fs.attrs
+        phase2range = -float(atr["WAVELENGTH"]) / (4.0 * np.pi)
+        ref_y, ref_x = int(atr["REF_Y"]), int(atr["REF_X"])
+        date12 = [(fs["date"][i][0].decode(), fs["date"][i][1].decode()) for i in new_rows]
+        keep = [i for i, r in enumerate(new_rows) if fs["dropIfgram"][r]]
+        if not keep:
+            raise RuntimeError("All new interferograms were dropped (low coherence).")
+        rows = [new_rows[i] for i in keep]
+        date12 = [date12[i] for i in keep]
+
+        old_dates = [d.decode() for d in ft["date"][:]]
+        new_dates = sorted(new_dates)
+        if old_dates != sorted(old_dates):
+            raise RuntimeError(f"Dates of {ts_file} are not in order; rerun the time-series inversion.")
+        if new_dates[0] < old_dates[0]:
+            raise RuntimeError(f"New date {new_dates[0]} precedes the reference date {old_dates[0]} "
+                               f"of {ts_file}; rerun the full MintPy chain.")
+        new_bperp = None
+        if "bperp" in ft:
+            # per-date baselines are used by correct_topography
+            baselines = baselines or {}
+            missing = [d for d in new_dates if baselines.get(d) is None]
+            if missing:
+                raise RuntimeError(f"No baseline for {', '.join(missing)}: cannot extend the "
+                                   f"bperp of {ts_file} (check mintpy.load.baselineDir).")
+            new_bperp = {d: baselines[d] for d in new_dates}
+
+        # final (sorted) position of every date
+        all_dates = sorted(old_dates + new_dates)
+        pos = {d: i for i, d in enumerate(all_dates)}
+        A = np.zeros((len(rows), len(new_dates)), dtype="float64")
+        old_idx = {}  # ifg -> (sign, final ts index) for old dates
+        for k, (d1, d2) in enumerate(date12):
+            for d, sign in ((d1, -1.0), (d2, 1.0)):
+                if d in new_dates:
+                    A[k, new_dates.index(d)] = sign
+                else:
+                    old_idx.setdefault(k, []).append((sign, pos[d]))
+        old_needed = sorted({j for v in old_idx.values() for _, j in v})
+
+        ts_ds = ft["timeseries"]
+        _, ny, nx = ts_ds.shape
+        ref_phase = np.array([fs["unwrapPhase"][r, ref_y, ref_x] for r in rows])
+        if not np.all(np.isfinite(ref_phase)):
+            raise RuntimeError("Reference pixel is NaN in a new interferogram.")
+
+        n0 = len(old_dates)
+        ts_ds = make_resizable(ft, "timeseries")
+        ts_ds.resize(len(all_dates), axis=0)
+        # move the existing dates to their final slots, last first so that no
+        # date is overwritten before it is copied (a date only moves later)
+        for j in range(n0 - 1, -1, -1):
+            if pos[old_dates[j]] != j:
+                ts_ds[pos[old_dates[j]]] = ts_ds[j]
+        date_ds = make_resizable(ft, "date")
+        date_ds.resize(len(all_dates), axis=0)
+        date_ds[:] = np.array([d.encode() for d in all_dates])
+        if new_bperp is not None:
+            old_bperp = dict(zip(old_dates, ft["bperp"][:]))
+            bperp_ds = make_resizable(ft, "bperp")
+            bperp_ds.resize(len(all_dates), axis=0)
+            bperp_ds[:] = np.array([old_bperp[d] if d in old_bperp else new_bperp[d]
+                                    for d in all_dates], dtype=bperp_ds.dtype)
+        new_pos = [pos[d] for d in new_dates]
+
+        for y0 in range(0, ny, row_block):
+            y1 = min(ny, y0 + row_block)
+            obs = np.stack([fs["unwrapPhase"][r, y0:y1, :] for r in rows]).astype("float64")
+            obs[obs == 0] = np.nan  # ISCE no-data
+            obs = (obs - ref_phase[:, None, None]) * phase2range
+            obs = obs.reshape(len(rows), -1)
+
+            known = np.zeros_like(obs)
+            if old_needed:
+                old = ts_ds[old_needed, y0:y1, :].reshape(len(old_needed), -1)
+                for k, terms in old_idx.items():
+                    for sign, j in terms:
+                        known[k] += sign * old[old_needed.index(j)]
+
+            x = solve_pattern_groups(A, obs, known)
+            ts_ds[new_pos, y0:y1, :] = x.reshape(len(new_dates), y1 - y0, nx)
+
+        ft.attrs["END_DATE"] = all_dates[-1]
+    print(f"  timeseries: inserted {len(new_dates)} date(s) into {ts_file}")
+
+
+def update_velocity(ts_file, vel_file, sums_file, row_block, ts_identity):
+    """Update velocity / velocityStd from running sums of (t, y) per pixel.
+
+    ``ts_identity`` is the file_identity of ts_file before this run changed
+    it (None if it did not exist).  The sums are reused only if they were
+    last synced with exactly that file; otherwise (missing sums, another
+    file, timeseries.h5 rewritten by a full MintPy rerun) they are rebuilt
+    from the whole time series.
+    """
+    import h5py
+
+    with h5py.File(ts_file, "r") as ft:
+        dates = [d.decode() for d in ft["date"][:]]
+        ts_ds = ft["timeseries"]
+        _, ny, nx = ts_ds.shape
+        ts_atr = dict(ft.attrs)
+
+        done = []
+        if os.path.exists(sums_file):
+            with h5py.File(sums_file, "r") as fa:
+                same_source = (fa.attrs.get("SOURCE") == os.path.abspath(ts_file)
+                               and ts_identity is not None
+                               and fa.attrs.get("SOURCE_IDENTITY") == json.dumps(ts_identity))
+                done = [d.decode() for d in fa["date"][:]] if same_source else []
+                # the sums do not depend on the date order, only on the set
+                if not set(done) <= set(dates):
+                    done = []
+        todo = [i for i, d in enumerate(dates) if d not in set(done)]
+        if not todo:
+            print("  velocity: already up to date")
+            return
+        print(f"  velocity: adding {len(todo)} date(s) to running sums")
+
+        t = np.array([decimal_year(d) for d in dates])
+        names = ("n", "s_t", "s_tt", "s_y", "s_ty", "s_yy")
+        with h5py.File(sums_file, "a" if done else "w") as fa:
+            for name in names:
+                if name not in fa:
+                    fa.create_dataset(name, shape=(ny, nx), dtype="float64",
+                                      chunks=(min(ny, row_block), nx), fillvalue=0)
+            for y0 in range(0, ny, row_block):
+                y1 = min(ny, y0 + row_block)
+                acc = {name: fa[name][y0:y1, :] for name in names}
+                for i in todo:
+                    y = ts_ds[i, y0:y1, :].astype("float64")
+                    ok = np.isfinite(y)
+                    yz = np.where(ok, y, 0.0)
+                    acc["n"] += ok
+                    acc["s_t"] += ok * t[i]
+                    acc["s_tt"] += ok * t[i] ** 2
+                    acc["s_y"] += yz
+                    acc["s_ty"] += yz * t[i]
+                    acc["s_yy"] += yz * yz
+                for name in names:
+                    fa[name][y0:y1, :] = acc[name]
+            if "date" in fa:
+                del fa["date"]
+            fa.create_dataset("date", data=np.array([d.encode() for d in dates]))
+            fa.attrs["SOURCE"] = os.path.abspath(ts_file)
+            # reading does not change timeseries.h5, so this is its identity
+            # at the start of the next run unless something rewrote it
+            fa.attrs["SOURCE_IDENTITY"] = json.dumps(file_identity(os.path.abspath(ts_file)))
+
+            with h5py.File(vel_file, "a") as fv:
+                for name in ("velocity", "velocityStd"):
+                    if name not in fv:
+                        fv.create_dataset(name, shape=(ny, nx), dtype="float32")
+                for y0 in range(0, ny, row_block):
+                    y1 = min(ny, y0 + row_block)
+                    a = {name: fa[name][y0:y1, :] for name in names}
+                    n = a["n"]
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        sxx = a["s_tt"] - a["s_t"] ** 2 / n
+                        sxy = a["s_ty"] - a["s_t"] * a["s_y"] / n
+                        syy = a["s_yy"] - a["s_y"] ** 2 / n
+                        vel = sxy / sxx
+                        ssr = np.maximum(syy - vel * sxy, 0.0)
+                        std = np.sqrt(ssr / (n - 2) / sxx)
+                    vel[n < 2] = np.nan
+                    std[n < 3] = np.nan
+                    fv["velocity"][y0:y1, :] = vel.astype("float32")
+                    fv["velocityStd"][y0:y1, :] = std.astype("float32")
+                if "FILE_TYPE" not in fv.attrs:
+                    for k, v in ts_atr.items():
+                        fv.attrs[k] = v
+                    fv.attrs["FILE_TYPE"] = "velocity"
+                    fv.attrs["UNIT"] = "m/year"
+                first, last = min(dates), max(dates)
+                fv.attrs["START_DATE"] = first
+                fv.attrs["END_DATE"] = last
+                fv.attrs["DATE12"] = f"{first[2:]}_{last[2:]}"
+    print(f"  velocity: updated {vel_file}")
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Incremental MintPy stack update for newly arrived SLC dates."
+    )
+    p.add_argument("--work-dir", default=".",
+                   help="ISCE / MintPy project directory (default: current dir).")
+    p.add_argument("--cfg", required=True, help="MintPy smallbaselineApp cfg.")
+    p.add_argument("--slc-dir", default=None,
+                   help="SLC folder (default: <work-dir>/../SLC).")
+    p.add_argument("--num-conn", type=int, default=None,
+                   help="Connections per date of the sequential network "
+                        "(default: mintpy.network.connNumMax or 3).")
+    p.add_argument("--ts-file", default="timeseries.h5",
+                   help="Time-series file to extend (default: timeseries.h5).")
+    p.add_argument("--vel-file", default="velocity.h5",
+                   help="Velocity file to update (default: velocity.h5). Its velocity / "
+                        "velocityStd are replaced by a plain linear fit of the raw time "
+                        "series, not the cfg's timeFunc / DEM-error-corrected product; "
+                        "pass another name to keep MintPy's velocity.h5.")
+    p.add_argument("--row-block", type=int, default=256,
+                   help="Rows processed per block (default: 256).")
+    p.add_argument("--detect-only", action="store_true",
+                   help="Only list new dates and required interferograms.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    import h5py
+
+    work_dir = os.path.abspath(args.work_dir)
+    cfg = read_cfg(args.cfg)
+    slc_dir = args.slc_dir or os.path.join(os.path.dirname(work_dir), "SLC")
+    stack_file = os.path.join(work_dir, "inputs", "ifgramStack.h5")
+    ts_file = os.path.join(work_dir, args.ts_file)
+    vel_file = os.path.join(work_dir, args.vel_file)
+
+    net_type = cfg.get("mintpy.network.type", "sequential")
+    if net_type != "sequential":
+        raise RuntimeError(f"Only mintpy.network.type = sequential is supported, got {net_type}")
+    num_conn = args.num_conn
+    if num_conn is None:
+        val = cfg.get("mintpy.network.connNumMax", "auto")
+        num_conn = int(val) if val.isdigit() else 3
+
+    print("WORK DIR:", work_dir)
+    print("SLC DIR :", slc_dir)
+
+    _, old_dates = stack_dates(stack_file)
+    new_dates = [d for d in slc_dates(slc_dir) if d not in set(old_dates)]
+    print(f"Stack dates: {len(old_dates)} ({old_dates[0]} .. {old_dates[-1]})")
+    if not new_dates:
+        print("No new acquisitions; nothing to do.")
+        return
+    print("New dates:", ", ".join(new_dates))
+    if new_dates[0] < old_dates[0]:
+        raise RuntimeError(f"New date {new_dates[0]} precedes the stack reference date "
+                           f"{old_dates[0]}; rerun the full MintPy chain instead.")
+
+    pairs = sequential_pairs(old_dates, new_dates, num_conn)
+    list_file = os.path.join(work_dir, "date12_new.txt")
+    with open(list_file, "w") as f:
+        f.writelines(f"{d1}_{d2}\n" for d1, d2 in pairs)
+    print(f"Required interferograms ({len(pairs)}), written to {list_file}:")
+    for d1, d2 in pairs:
+        print(f"  {d1}_{d2}")
+    if args.detect_only:
+        return
+
+    def pattern(key):
+        value = cfg[key]
+        return value if os.path.isabs(value) else os.path.join(work_dir, value)
+
+    missing = [f"{d1}_{d2}" for d1, d2 in pairs
+               if not glob.glob(pattern("mintpy.load.unwFile").replace("*", f"{d1}_{d2}") + "*")]
+    if missing:
+        raise RuntimeError("Interferograms not formed yet: " + ", ".join(missing)
+                           + "\nProcess them with ISCE first (see date12_new.txt).")
+
+    min_coh = 0.0
+    if cfg.get("mintpy.network.coherenceBased", "no") == "yes":
+        val = cfg.get("mintpy.network.minCoherence", "auto")
+        min_coh = 0.7 if val == "auto" else float(val)
+    baseline_dir = cfg.get("mintpy.load.baselineDir")
+    if baseline_dir and not os.path.isabs(baseline_dir):
+        baseline_dir = os.path.join(work_dir, baseline_dir)
+
+    # per-date baselines, checked before anything is written: timeseries.h5
+    # bperp feeds correct_topography and must not be guessed
+    baselines = date_baselines(baseline_dir, old_dates[0], new_dates)
+    if os.path.exists(ts_file):
+        with h5py.File(ts_file, "r") as ft:
+            has_bperp = "bperp" in ft
+        missing = [d for d in new_dates if baselines[d] is None]
+        if has_bperp and missing:
+            raise RuntimeError(f"No baseline for {', '.join(missing)} (mintpy.load.baselineDir); "
+                               f"{args.ts_file} has per-date bperp that would be wrong.")
+
+    print("\n== Appending interferograms ==")
+    rows = append_ifgrams(stack_file, pairs, pattern("mintpy.load.unwFile"),
+                          pattern("mintpy.load.corFile"), baseline_dir, min_coh, baselines)
+
+    # identity the velocity running sums must have been synced with
+    ts_identity = file_identity(os.path.abspath(ts_file)) if os.path.exists(ts_file) else None
+
+    print("\n== Updating time series ==")
+    update_timeseries(stack_file, ts_file, rows, new_dates, args.row_block, baselines)
+
+    print("\n== Updating velocity ==")
+    sums_file = os.path.join(os.path.dirname(vel_file), "velocity_sums.h5")
+    update_velocity(ts_file, vel_file, sums_file, args.row_block, ts_identity)
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+invert_roi.py
+
+SBAS network inversion of a spatial window of inputs/ifgramStack.h5, for
+trying network choices on one district in seconds instead of rerunning
+invert_network over the whole frame.
+
+Only the window (plus the reference pixel) is read.  Pixels are grouped by
+their pattern of valid interferograms (after masking); the design matrix
+of each pattern is factored once (pseudo-inverse, minimum-norm for
+disconnected networks) and all pixels of the group are solved with one
+matrix multiply.
+
+As in MintPy, the phase is referenced to REF_Y/REF_X, the default
+formulation solves minimum-norm velocities between dates
+(mintpy.networkInversion.minNormVelocity = yes; --min-norm-phase for the
+phase formulation) and temporal coherence is |mean(exp(j * residual))|.
+The inversion is unweighted (weightFunc = no): per-pixel weights would
+give every pixel its own system.
+
+Output (HDF5): timeseries (m), temporalCoherence, numInvIfgram and a linear
+velocity, with MintPy attributes of the subset.  --compare checks the
+result against a full-frame timeseries.h5 / velocity.h5 over the window.
+
+Example (inside the MintPy work dir):
+
+python scripts/py/invert_roi.py inputs/ifgramStack.h5 --roi 1200,1800,400,900 \
+    --max-tbase 120 --mask-coh 0.4 -o timeseries_roi.h5 --compare timeseries.h5
+"""
+
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from fit_timeseries_model import PatternSolver, design_matrix, pattern_groups
+from raster_io import attrs_geotransform
+
+
+# --------------------- network ------------------------
+
+def read_network(f):
+    date12 = [(d1.decode(), d2.decode()) for d1, d2 in f["date"][:]]
+    keep = f["dropIfgram"][:] if "dropIfgram" in f else np.ones(len(date12), dtype=bool)
+    bperp = f["bperp"][:] if "bperp" in f else np.zeros(len(date12))
+    return date12, np.asarray(keep, dtype=bool), bperp
+
+
+def select_ifgrams(date12, keep, bperp, args):
+    """Indices of the interferograms used, after the network options."""
+    exclude12 = {s.strip() for s in args.exclude_date12.split(",") if s.strip()}
+    exclude = {s.strip() for s in args.exclude_date.split(",") if s.strip()}
+    used = []
+    for k, (d1, d2) in enumerate(date12):
+        if not keep[k] and not args.ignore_drop:
+            continue
+        if f"{d1}_{d2}" in exclude12 or f"{d1[2:]}_{d2[2:]}" in exclude12:
+            continue
+        if d1 in exclude or d2 in exclude:
+            continue
+        days = (datetime.strptime(d2, "%Y%m%d") - datetime.strptime(d1, "%Y%m%d")).days
+        if args.max_tbase is not None and days > args.max_tbase:
+            continue
+        if args.max_bperp is not None and abs(bperp[k]) > args.max_bperp:
+            continue
+        used.append(k)
+    if not used:
+        raise RuntimeError("No interferogram left after the network selection.")
+    return used
+
+
+def sbas_matrices(date12, dates):
+    """A (phase formulation) and B (velocity formulation) with the first date
+    as reference, plus the date intervals (years) used by B."""
+    index = {d: i for i, d in enumerate(dates)}
+    t = np.array([(datetime.strptime(d, "%Y%m%d") - datetime.strptime(dates[0], "%Y%m%d")).days
+                  for d in dates]) / 365.25
+    dt = np.diff(t)
+    A = np.zeros((len(date12), len(dates)))
+    B = np.zeros((len(date12), len(dates) - 1))
+    for k, (d1, d2) in enumerate(date12):
+        i, j = index[d1], index[d2]
+        A[k, i], A[k, j] = -1.0, 1.0
+        B[k, i:j] = dt[i:j]
+    return A[:, 1:], B, dt
+
+
+# --------------------- inversion ------------------------
+
+class GroupInverter:
+    """Minimum-norm least squares per valid-ifg pattern, factors cached."""
+
+    def __init__(self, G):
+        self.G = G
+        self.cache = {}
+
+    def solve(self, obs):
+        """obs: (n_ifg, n_pix) radians with NaN gaps -> (x, residual phase, n used)."""
+        valid = np.isfinite(obs)
+        x = np.full((self.G.shape[1], obs.shape[1]), np.nan)
+        tcoh = np.full(obs.shape[1], np.nan, dtype="float32")
+        n_used = valid.sum(axis=0).astype("int16")
+        for key, rows, pix in pattern_groups(valid):
+            if not rows.any():
+                continue
+            if key not in self.cache:
+                Gg = self.G[rows]
+                self.cache[key] = (Gg, np.linalg.pinv(Gg))
+            Gg, pinv = self.cache[key]
+            if len(pix) == obs.shape[1]:
+                pix = slice(None)
+                y = obs if rows.all() else obs[rows]
+            else:
+                y = obs[np.ix_(rows, pix)]
+            xg = pinv @ y
+            x[:, pix] = xg
+            res = (y - Gg @ xg).astype("float32")
+            # |mean(exp(j r))| without complex temporaries
+            tcoh[pix] = np.hypot(np.cos(res).mean(axis=0), np.sin(res).mean(axis=0))
+        return x, tcoh, n_used
+
+
+def parse_window(args, attrs, ny, nx):
+    if args.lalo:
+        s, n, w, e = (float(v) for v in args.lalo.split(","))
+        gt = attrs_geotransform(attrs)
+        if gt is None:
+            raise ValueError("--lalo needs a geocoded stack (X_FIRST / Y_FIRST attributes)")
+        x0, dx, _, y0, _, dy = gt
+        x1, x2 = sorted(int(round((v - x0) / dx)) for v in (w, e))
+        y1, y2 = sorted(int(round((v - y0) / dy)) for v in (n, s))
+    elif args.roi:
+        x1, x2, y1, y2 = (int(v) for v in args.roi.split(","))
+    else:
+        x1, x2, y1, y2 = 0, nx, 0, ny
+    x1, x2 = max(0, x1), min(nx, x2)
+    y1, y2 = max(0, y1), min(ny, y2)
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError(f"Empty window x={x1}:{x2} y={y1}:{y2} for a {ny} x {nx} stack")
+    return x1, x2, y1, y2
+
+
+def invert(stack_file, args):
+    import h5py
+
+    with h5py.File(stack_file, "r") as f:
+        attrs = dict(f.attrs)
+        n_all, ny, nx = f["unwrapPhase"].shape
+        date12, keep, bperp = read_network(f)
+        used = select_ifgrams(date12, keep, bperp, args)
+        date12 = [date12[k] for k in used]
+        dates = sorted({d for pair in date12 for d in pair})
+        x1, x2, y1, y2 = parse_window(args, attrs, ny, nx)
+        ref_y, ref_x = int(attrs["REF_Y"]), int(attrs["REF_X"])
+        phase2range = -float(attrs["WAVELENGTH"]) / (4.0 * np.pi)
+
+        A, B, dt = sbas_matrices(date12, dates)
+        inverter = GroupInverter(A if args.min_norm_phase else B)
+
+        # unwrapPhase is read once per window strip; fancy indexing on the
+        # ifg axis only if some were excluded (h5py reads them one by one)
+        sel = slice(None) if len(used) == n_all else used
+        ref = f["unwrapPhase"][sel, ref_y, ref_x].astype("float64")
+        if not np.all(np.isfinite(ref)):
+            raise RuntimeError("Reference pixel is NaN in a selected interferogram.")
+
+        h, w = y2 - y1, x2 - x1
+        ts = np.zeros((len(dates), h, w), dtype="float32")
+        tcoh = np.zeros((h, w), dtype="float32")
+        n_inv = np.zeros((h, w), dtype="int16")
+        strip = max(1, int(args.mem_mb * 1024 ** 2 // (len(used) * w * 8 * 4)))
+
+        t0 = time.perf_counter()
+        for r0 in range(y1, y2, strip):
+            r1 = min(y2, r0 + strip)
+            obs = f["unwrapPhase"][sel, r0:r1, x1:x2].astype("float64")
+            obs[obs == 0] = np.nan      # ISCE / MintPy no-data
+            if args.mask_coh > 0:
+                coh = f["coherence"][sel, r0:r1, x1:x2]
+                obs[coh < args.mask_coh] = np.nan
+            obs = (obs - ref[:, None, None]).reshape(len(used), -1)
+
+            x, tc, n = inverter.solve(obs)
+            if not args.min_norm_phase:
+                x = np.cumsum(x * dt[:, None], axis=0)
+            rows = slice(r0 - y1, r1 - y1)
+            ts[1:, rows, :] = (x * phase2range).reshape(len(dates) - 1, r1 - r0, w)
+            tcoh[rows] = tc.reshape(r1 - r0, w)
+            n_inv[rows] = n.reshape(r1 - r0, w)
+        dt_inv = time.perf_counter() - t0
+
+    sub = {"LENGTH": h, "WIDTH": w, "SUBSET_XMIN": x1, "SUBSET_XMAX": x2,
+           "SUBSET_YMIN": y1, "SUBSET_YMAX": y2, "REF_DATE": dates[0]}
+    gt = attrs_geotransform(attrs)
+    if gt is not None:
+        sub["X_FIRST"] = gt[0] + x1 * gt[1]
+        sub["Y_FIRST"] = gt[3] + y1 * gt[5]
+    if y1 <= ref_y < y2 and x1 <= ref_x < x2:
+        sub["REF_Y"], sub["REF_X"] = ref_y - y1, ref_x - x1
+    else:
+        attrs.pop("REF_Y", None)
+        attrs.pop("REF_X", None)
+    attrs.update(sub)
+    info = {"window": (x1, x2, y1, y2), "n_ifg": len(used), "n_date": len(dates),
+            "patterns": len(inverter.cache), "seconds": dt_inv}
+    return ts, tcoh, n_inv, dates, attrs, info
+
+
+# --------------------- output / comparison ------------------------
+
+def linear_velocity(ts, dates):
+    A, _, _ = design_matrix(dates, polynomial=1)
+    x, std, _ = PatternSolver(A).solve(ts.reshape(len(dates), -1).astype("float64"))
+    return x[1].reshape(ts.shape[1:]), std[1].reshape(ts.shape[1:])
+
+
+def write_output(path, ts, tcoh, n_inv, vel, vel_std, dates, attrs):
+    import h5py
+
+    with h5py.File(path, "w") as f:
+        f.create_dataset("timeseries", data=ts, chunks=True)
+        f.create_dataset("date", data=np.array([d.encode() for d in dates]))
+        f.create_dataset("temporalCoherence", data=tcoh)
+        f.create_dataset("numInvIfgram", data=n_inv)
+        f.create_dataset("velocity", data=vel.astype("float32"))
+        f.create_dataset("velocityStd", data=vel_std.astype("float32"))
+        for k, v in attrs.items():
+            f.attrs[k] = v
+        f.attrs["FILE_TYPE"] = "timeseries"
+        f.attrs["UNIT"] = "m"
+
+
+def compare(path, ts, vel, dates, window):
+    """Print differences to a full-frame timeseries / velocity file."""
+    import h5py
+
+    x1, x2, y1, y2 = window
+    with h5py.File(path, "r") as f:
+        if "timeseries" in f:
+            ref_dates = [d.decode() for d in f["date"][:]]
+            common = [d for d in dates if d in ref_dates]
+            if len(common) < 2:
+                print("  no common dates")
+                return
+            full = f["timeseries"][[ref_dates.index(d) for d in common], y1:y2, x1:x2]
+            mine = ts[[dates.index(d) for d in common]]
+            # both relative to the first common date
+            diff = (mine - mine[0]) - (full - full[0])
+            print(f"  {'date':<10s} {'RMS diff (mm)':>14s} {'max |diff| (mm)':>16s}")
+            for k, d in enumerate(common):
+                dk = diff[k][np.isfinite(diff[k])] * 1000.0
+                if dk.size:
+                    print(f"  {d:<10s} {np.sqrt(np.mean(dk ** 2)):14.2f} {np.abs(dk).max():16.2f}")
+            full_vel, _ = linear_velocity(full - full[0], common)
+        else:
+            full_vel = f["velocity"][y1:y2, x1:x2]
+    dv = (vel - full_vel)[np.isfinite(vel - full_vel)] * 1000.0
+    if dv.size:
+        print(f"  velocity: RMS diff {np.sqrt(np.mean(dv ** 2)):.2f} mm/yr, "
+              f"max |diff| {np.abs(dv).max():.2f} mm/yr over {dv.size} pixels")
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Fast SBAS inversion of a window of ifgramStack.h5, grouped by ifg pattern."
+    )
+    p.add_argument("stack", help="MintPy ifgramStack.h5 (after reference_point).")
+    p.add_argument("-o", "--output", default="timeseries_roi.h5", help="Output HDF5 file.")
+    p.add_argument("--roi", default=None, help="Pixel window x1,x2,y1,y2.")
+    p.add_argument("--lalo", default=None, help="Geographic window S,N,W,E (geocoded stacks).")
+    net = p.add_argument_group("network")
+    net.add_argument("--max-tbase", type=float, default=None, help="Max temporal baseline (days).")
+    net.add_argument("--max-bperp", type=float, default=None, help="Max |bperp| (m).")
+    net.add_argument("--exclude-date12", default="", help="Comma-separated YYYYMMDD_YYYYMMDD.")
+    net.add_argument("--exclude-date", default="", help="Comma-separated dates to drop.")
+    net.add_argument("--ignore-drop", action="store_true",
+                     help="Also use interferograms marked in dropIfgram.")
+    inv = p.add_argument_group("inversion")
+    inv.add_argument("--mask-coh", type=float, default=0.0,
+                     help="Mask observations with coherence below this (maskThreshold).")
+    inv.add_argument("--min-norm-phase", action="store_true",
+                     help="Minimum-norm phase instead of minimum-norm velocity.")
+    inv.add_argument("--mem-mb", type=float, default=512, help="Working memory per strip (MB).")
+    p.add_argument("--compare", default=None,
+                   help="Full-frame timeseries.h5 or velocity.h5 to compare with.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    ts, tcoh, n_inv, dates, attrs, info = invert(args.stack, args)
+    x1, x2, y1, y2 = info["window"]
+    n_pix = (x2 - x1) * (y2 - y1)
+    print(f"Window x={x1}:{x2} y={y1}:{y2} ({n_pix} pixels), {info['n_ifg']} ifgrams, "
+          f"{info['n_date']} dates")
+    print(f"Inverted in {info['seconds']:.2f} s ({n_pix / max(info['seconds'], 1e-9) / 1e6:.2f} "
+          f"Mpix/s, {info['patterns']} distinct ifg patterns)")
+
+    vel, vel_std = linear_velocity(ts, dates)
+    write_output(args.output, ts, tcoh, n_inv, vel, vel_std, dates, attrs)
+    print("Output:", args.output)
+
+    if args.compare:
+        print("\n== Comparison with", args.compare, "==")
+        compare(args.compare, ts, vel, dates, info["window"])
+
+
+if __name__ == "__main__":
+    main()
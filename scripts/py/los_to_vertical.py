@@ -8,24 +8,27 @@ visualize_los.py
 
 اگر نام فایل شامل "vertical" باشد → Vertical displacement (mm)
 در غیر این صورت → LOS displacement (mm)
+
+اگر --inc-path داده شود، ابتدا LOS به vertical تبدیل می‌شود
+(فرض جابجایی غالباً قائم: d_v = d_los / cos(incidence)) و
+در --out ذخیره می‌شود، سپس نقشه vertical نمایش داده می‌شود.
 """
 
 import os
 import argparse
 import numpy as np
-from osgeo import gdal
-import matplotlib.pyplot as plt
+
+from raster_io import read_band, resolve_path, save_geotiff
+from step_cache import StepCache, add_cache_args, read_input
 
 
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open {path}")
-    arr = ds.ReadAsArray()
-    gt = ds.GetGeoTransform()
-    proj = ds.GetProjection()
-    ds = None
-    return arr, gt, proj
+def los_to_vertical(los, inc_deg):
+    """تبدیل LOS به vertical با فرض جابجایی قائم؛ زاویه‌های نامعتبر → NaN."""
+    inc = np.deg2rad(np.asarray(inc_deg, dtype="float32"))
+    valid = np.isfinite(inc) & (inc > 0) & (inc < np.deg2rad(89.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        vert = np.where(valid, los / np.cos(inc), np.nan)
+    return vert.astype("float32")
 
 
 def parse_args():
@@ -48,6 +51,36 @@ def parse_args():
         default="5,95",
         help="پرسنتایل برای تعیین min/max رنگ، مثلاً 5,95",
     )
+    p.add_argument(
+        "--inc-path",
+        default=None,
+        help="مسیر زاویه incidence (درجه)، مثلاً mintpy_inputs/geometry/incidenceAngle.geo؛ "
+             "اگر داده شود LOS به vertical تبدیل می‌شود.",
+    )
+    p.add_argument(
+        "--inc-band",
+        type=int,
+        default=1,
+        help="شماره باند incidence (برای los.rdr.geo ایزس باند ۱).",
+    )
+    p.add_argument(
+        "--out",
+        default="merged/vertical_displacement_mm.tif",
+        help="فایل خروجی vertical (mm) هنگام تبدیل (نسبی نسبت به isce-dir).",
+    )
+    p.add_argument(
+        "--quantize",
+        type=float,
+        default=None,
+        help="ذخیره به صورت int16 با گام کوانتش (mm)، مثلاً 0.01؛ "
+             "حداکثر خطا نصف گام است و خواننده‌ها خودکار به float32 برمی‌گردانند.",
+    )
+    add_cache_args(
+        p,
+        help_dir="فولدر cache مراحل (step_cache.py)؛ پیش‌فرض متغیر محیطی "
+                 "POSTPROCESS_CACHE_DIR، و بدون آن cache خاموش است.",
+        help_mb="سقف حجم cache بر حسب MB (حذف LRU).",
+    )
     return p.parse_args()
 
 
@@ -55,22 +88,52 @@ def main():
     args = parse_args()
 
     isce_dir = os.path.abspath(args.isce_dir)
-    los_path = args.los_path
-    if not os.path.isabs(los_path):
-        los_path = os.path.join(isce_dir, los_path)
+    los_path = resolve_path(isce_dir, args.los_path)
 
     print("ISCE DIR:", isce_dir)
     print("LOS file:", los_path)
 
-    data, gt, proj = read_gdal_array(los_path)
-    if data.ndim == 3:
-        data = data[0]
+    # خروجی postprocess_ifg در صورت وجود از cache (memmap) خوانده می‌شود
+    cache = StepCache.from_args(args)
+    data, gt, proj = read_input(cache, los_path, band=1)
 
     ny, nx = data.shape
     print("اندازه تصویر:", (ny, nx))
 
-    # تعیین نوع داده از روی نام فایل
     fname = os.path.basename(los_path).lower()
+
+    # ---------- تبدیل LOS → vertical (اختیاری) ----------
+    if args.inc_path is not None:
+        inc_path = resolve_path(isce_dir, args.inc_path)
+        out_path = resolve_path(isce_dir, args.out)
+        print("Incidence file:", inc_path)
+
+        los = data
+
+        def compute():
+            inc, _, _ = read_band(inc_path, band=args.inc_band)
+            if inc.shape != los.shape:
+                raise RuntimeError(f"Shape mismatch: LOS {los.shape} vs incidence {inc.shape}")
+            return los_to_vertical(los, inc), {"geotransform": gt, "projection": proj}
+
+        if cache is None:
+            data, meta = compute()
+        else:
+            data, meta, hit = cache.cached("los_to_vertical", [__file__, los_path, inc_path],
+                                           {"inc_band": args.inc_band}, compute)
+            print("cache:", "استفاده از نتیجه ذخیره‌شده" if hit else "محاسبه و ذخیره", meta["key"][:12])
+        print("ذخیره vertical displacement (mm) در:", out_path)
+
+        def write():
+            save_geotiff(out_path, data, gt, proj, nodata=np.nan, quantize_step=args.quantize)
+
+        if cache is None or args.quantize is not None:
+            write()
+        else:
+            cache.write_output(out_path, meta, write)
+        fname = os.path.basename(out_path).lower()
+
+    # تعیین نوع داده از روی نام فایل
     if "vertical" in fname:
         title = "Vertical displacement (mm)"
         cbar_label = "Vertical displacement (mm)"
@@ -88,6 +151,8 @@ def main():
     vmax = np.percentile(data[finite], p_hi)
     print(f"Color scale vmin/vmax based on P{p_lo}/P{p_hi}: {vmin} {vmax}")
 
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(6, 6))
     im = plt.imshow(data, cmap="jet", vmin=vmin, vmax=vmax)
     plt.colorbar(im, label=cbar_label)
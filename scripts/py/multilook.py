@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+multilook.py
+
+NaN-aware multilooking (block averaging) of a geocoded product, so that
+post-processing and figures can run on the delivery grid (e.g. 50 m)
+instead of the full geocoded resolution.
+
+Modes (over each ly x lx block, NaNs ignored):
+
+- mean    : plain mean
+- median  : median
+- cohmean : coherence-weighted mean, weights from --coh-path
+
+Blocks are reduced by reshaping (rows, ly, cols, lx) views, so no Python
+loop runs over pixels, and the input is streamed in row strips that are a
+multiple of ly.  Trailing rows / columns that do not fill a block are
+dropped (as mintpy.multilook does).  Output pixels with less than
+--min-valid of their block valid are NaN.
+
+The geotransform keeps the upper-left corner and scales the pixel size by
+the looks.  Output is a raw float32 file with ISCE .xml/.vrt headers
+(written strip by strip; readable by every script), or a GeoTIFF if --out
+ends with .tif.
+
+Example (15 x 15 looks of a ~3.3 m grid ~ 50 m):
+
+python scripts/py/multilook.py --isce-dir . --in-path merged/filt_topophase.unw.geo.vrt \
+    --band 2 --looks 15 --mode cohmean --coh-path merged/topophase.cor.geo.vrt \
+    --out merged/filt_topophase.unw.ml15.geo
+"""
+
+import os
+import math
+import time
+import warnings
+import argparse
+
+import numpy as np
+
+from raster_io import open_band, resolve_path, save_geotiff, write_isce_headers
+
+
+MODES = ("mean", "median", "cohmean")
+
+
+# --------------------- block reductions ------------------------
+
+def blocks(arr, ly, lx):
+    """(rows // ly, ly, cols // lx, lx) view of the part covered by whole blocks."""
+    ny, nx = arr.shape[0] // ly * ly, arr.shape[1] // lx * lx
+    return arr[:ny, :nx].reshape(ny // ly, ly, nx // lx, lx)
+
+
+def multilook(arr, ly, lx, mode="mean", weights=None, min_valid=0.0):
+    """Multilook a 2D array by ly x lx, ignoring NaNs."""
+    data = blocks(np.asarray(arr, dtype="float32"), ly, lx)
+    valid = np.isfinite(data)
+    if mode == "cohmean":
+        w = blocks(np.asarray(weights, dtype="float32"), ly, lx)
+        valid &= np.isfinite(w) & (w > 0)
+        w = np.where(valid, w, 0.0)
+        num = (np.where(valid, data, 0.0) * w).sum(axis=(1, 3))
+        den = w.sum(axis=(1, 3))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = num / den
+    elif mode == "median":
+        stacked = data.transpose(0, 2, 1, 3).reshape(data.shape[0], data.shape[2], ly * lx)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN blocks
+            out = np.nanmedian(stacked, axis=2)
+    else:
+        count = valid.sum(axis=(1, 3))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = np.where(valid, data, 0.0).sum(axis=(1, 3)) / count
+    if min_valid > 0:
+        frac = valid.sum(axis=(1, 3)) / float(ly * lx)
+        out = np.where(frac >= min_valid, out, np.nan)
+    return out.astype("float32")
+
+
+def multilook_geotransform(gt, ly, lx):
+    if gt is None:
+        return None
+    x0, dx, rx, y0, ry, dy = gt
+    return (x0, dx * lx, rx * lx, y0, ry * ly, dy * ly)
+
+
+def pixel_spacing_m(gt):
+    """(row, column) pixel spacing in metres of a geotransform."""
+    x0, dx, _, y0, _, dy = gt
+    if abs(x0) <= 360.0 and abs(y0) <= 90.0:
+        # geographic grid: degrees -> metres at the grid's latitude
+        m_per_deg = 111320.0
+        return abs(dy) * m_per_deg, abs(dx) * m_per_deg * math.cos(math.radians(y0))
+    return abs(dy), abs(dx)
+
+
+def looks_for_resolution(gt, resolution_m):
+    """(ly, lx) giving about resolution_m metres per pixel."""
+    px_y, px_x = pixel_spacing_m(gt)
+    return max(1, round(resolution_m / px_y)), max(1, round(resolution_m / px_x))
+
+
+# --------------------- streaming ------------------------
+
+def run(src, ly, lx, mode, weights=None, coh_scale=1.0, zero_as_nan=False,
+        min_valid=0.0, strip_rows=None, mem_mb=256):
+    """Yield (output row offset, multilooked strip) for consecutive strips."""
+    ny, nx = src.shape
+    if strip_rows is None:
+        strip_rows = max(1, int(mem_mb * 1024 ** 2 // (nx * 4 * 6)))
+    strip_rows = max(ly, strip_rows // ly * ly)
+    for y0 in range(0, ny // ly * ly, strip_rows):
+        y1 = min(ny // ly * ly, y0 + strip_rows)
+        data = np.asarray(src[y0:y1, :], dtype="float32")
+        if zero_as_nan:
+            data = np.where(data == 0, np.nan, data)
+        w = None
+        if weights is not None:
+            w = np.asarray(weights[y0:y1, :], dtype="float32") / coh_scale
+        yield y0 // ly, multilook(data, ly, lx, mode, w, min_valid)
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(description="NaN-aware multilooking of a geocoded product.")
+    p.add_argument("--isce-dir", default=".", help="ISCE project directory.")
+    p.add_argument("--in-path", required=True, help="Input raster (relative to --isce-dir).")
+    p.add_argument("--band", type=int, default=1, help="Input band (default 1).")
+    p.add_argument("--out", required=True,
+                   help="Output: raw float32 + ISCE headers, or GeoTIFF if it ends with .tif.")
+    p.add_argument("--looks", type=int, default=None, help="Looks in both directions.")
+    p.add_argument("--looks-y", type=int, default=None, help="Looks in azimuth / rows.")
+    p.add_argument("--looks-x", type=int, default=None, help="Looks in range / columns.")
+    p.add_argument("--resolution", type=float, default=None,
+                   help="Target pixel size in metres (looks derived from the geotransform).")
+    p.add_argument("--mode", choices=MODES, default="mean", help="Block reduction.")
+    p.add_argument("--coh-path", default=None, help="Coherence raster (weights for cohmean).")
+    p.add_argument("--coh-band", type=int, default=1, help="Coherence band (default 1).")
+    p.add_argument("--coh-scale", type=float, default=1.0,
+                   help="Divide coherence by this (1000 if stored *1000).")
+    p.add_argument("--zero-as-nan", action="store_true",
+                   help="Treat exact zeros as no-data (ISCE outside the swath).")
+    p.add_argument("--min-valid", type=float, default=0.0,
+                   help="Minimum fraction of valid pixels per block (0-1).")
+    p.add_argument("--mem-mb", type=float, default=256, help="Working memory per strip (MB).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    isce_dir = os.path.abspath(args.isce_dir)
+    in_path = resolve_path(isce_dir, args.in_path)
+    out_path = resolve_path(isce_dir, args.out)
+    src, gt, proj = open_band(in_path, args.band)
+
+    if args.resolution is not None:
+        if gt is None:
+            raise ValueError("--resolution needs a georeferenced input.")
+        ly, lx = looks_for_resolution(gt, args.resolution)
+    else:
+        ly = args.looks_y or args.looks or 1
+        lx = args.looks_x or args.looks or 1
+    weights = None
+    if args.mode == "cohmean":
+        if args.coh_path is None:
+            raise ValueError("--mode cohmean needs --coh-path.")
+        weights, _, _ = open_band(resolve_path(isce_dir, args.coh_path), args.coh_band)
+        if weights.shape != src.shape:
+            raise RuntimeError(f"Shape mismatch: input {src.shape} vs coherence {weights.shape}")
+
+    ny, nx = src.shape
+    out_shape = (ny // ly, nx // lx)
+    out_gt = multilook_geotransform(gt, ly, lx)
+    print("Input :", in_path, f"band {args.band}, {ny} x {nx}")
+    print(f"Looks : {ly} x {lx} ({args.mode}) -> {out_shape[0]} x {out_shape[1]}")
+
+    t0 = time.perf_counter()
+    strips = run(src, ly, lx, args.mode, weights, args.coh_scale, args.zero_as_nan,
+                 args.min_valid, mem_mb=args.mem_mb)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    if out_path.lower().endswith((".tif", ".tiff")):
+        out = np.full(out_shape, np.nan, dtype="float32")
+        for r0, ml in strips:
+            out[r0:r0 + ml.shape[0]] = ml
+        save_geotiff(out_path, out, out_gt, proj, nodata=np.nan)
+    else:
+        with open(out_path, "wb") as f:
+            for _, ml in strips:
+                f.write(ml.astype("<f4").tobytes())
+        write_isce_headers(out_path, out_shape[1], out_shape[0], 1, out_gt)
+    print(f"Done in {time.perf_counter() - t0:.1f} s")
+    print("Output:", out_path)
+
+
+if __name__ == "__main__":
+    main()
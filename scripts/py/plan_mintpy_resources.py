@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+plan_mintpy_resources.py
+
+Choose mintpy.compute.* settings from the stack size and the host, instead
+of the fixed "auto" defaults (4 GB, 4 workers, no cluster).
+
+The stack dimensions (dates, pairs, rows, cols) are read from
+inputs/ifgramStack.h5 if it exists, otherwise from the interferograms
+matched by mintpy.load.unwFile (after mintpy.multilook.*).  The host's
+usable cores and memory honour CPU affinity and cgroup limits.
+
+Per-step memory is estimated like MintPy splits its work into patches
+(ifgram_inversion: (2 * pairs + dates + 5) float32 layers, x1.5), then
+
+- maxMemory  : half of the usable memory (the main process holds a patch
+               while the Dask workers hold their share of it)
+- numWorker  : cores, limited by memory per worker and patch size
+- cluster    : local if more than one worker is useful, else none
+
+Keys that are not "auto" in the cfg are kept unless --override is given.
+The result is written as
+
+    <out-dir>/mintpy_resources.cfg    overlay: only the compute keys + plan
+    <out-dir>/<cfg name>              the cfg with the overlay applied
+
+and the planned cfg is the one to pass to run_mintpy_steps.py.  The compute
+keys are not part of the step fingerprints, so re-planning does not rerun
+up-to-date steps.
+
+Example (inside the ISCE project directory):
+
+python scripts/py/plan_mintpy_resources.py configs/smallbaselineApp.cfg --out-dir planned_cfg
+"""
+
+import os
+import re
+import glob
+import math
+import time
+import argparse
+
+from raster_io import raw_layout
+from run_mintpy_steps import read_cfg
+
+
+GB = 1024.0 ** 3
+COMPUTE_KEYS = ["mintpy.compute.maxMemory", "mintpy.compute.cluster",
+                "mintpy.compute.numWorker", "mintpy.compute.config"]
+PAIR_DIR = re.compile(r"(\d{8})[_-](\d{8})")
+
+# float32 layers held per pixel by each step (MintPy's own patch heuristics)
+STEP_LAYERS = {
+    "load_data": lambda n_ifg, n_date: 3,
+    "modify_network": lambda n_ifg, n_date: n_ifg,
+    "invert_network": lambda n_ifg, n_date: (2 * n_ifg + n_date + 5) * 1.5,
+    "correct_topography": lambda n_ifg, n_date: 3 * n_date + 4,
+    "residual_RMS": lambda n_ifg, n_date: 2 * n_date,
+    "velocity": lambda n_ifg, n_date: 2 * n_date + 4,
+}
+WORKER_OVERHEAD_GB = 0.5         # interpreter + numpy/dask per worker
+MIN_PIXELS_PER_WORKER = 100000   # below this a worker costs more than it saves
+
+
+# --------------------- stack / host ------------------------
+
+def stack_from_h5(path):
+    import h5py
+
+    with h5py.File(path, "r") as f:
+        n_ifg, rows, cols = f["unwrapPhase"].shape
+        if "dropIfgram" in f:
+            n_ifg = int(f["dropIfgram"][:].sum())
+        dates = {d for pair in f["date"][:] for d in pair}
+        dtype = str(f["unwrapPhase"].dtype)
+    return {"source": path, "n_date": len(dates), "n_ifg": n_ifg,
+            "rows": rows, "cols": cols, "dtype": dtype}
+
+
+def stack_from_cfg(cfg, work_dir):
+    pattern = cfg.get("mintpy.load.unwFile", "")
+    if not os.path.isabs(pattern):
+        pattern = os.path.join(work_dir, pattern)
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise RuntimeError(f"No interferograms match mintpy.load.unwFile: {pattern}")
+
+    dates = set()
+    for path in files:
+        m = PAIR_DIR.search(path)
+        if m:
+            dates.update(m.groups())
+
+    layout = raw_layout(files[0])
+    if layout is None:
+        from osgeo import gdal
+        ds = gdal.Open(files[0])
+        rows, cols = ds.RasterYSize, ds.RasterXSize
+    else:
+        rows, cols = layout["shape"]
+
+    def step(key):
+        value = cfg.get(key, "auto")
+        return 1 if value in ("auto", "") else max(1, int(value))
+
+    return {"source": pattern, "n_date": len(dates) or len(files) + 1, "n_ifg": len(files),
+            "rows": rows // step("mintpy.multilook.ystep"),
+            "cols": cols // step("mintpy.multilook.xstep"), "dtype": "float32"}
+
+
+def host_resources():
+    """(usable cores, available memory in GB), honouring affinity and cgroups."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    mem = None
+    try:
+        with open("/proc/meminfo") as f:
+            info = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f}
+        mem = info.get("MemAvailable", info.get("MemTotal"))
+    except OSError:
+        pass
+    for limit_file in ("/sys/fs/cgroup/memory.max",
+                       "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(limit_file) as f:
+                text = f.read().strip()
+        except OSError:
+            continue
+        if text.isdigit() and int(text) < (1 << 60):
+            mem = min(mem, int(text)) if mem else int(text)
+    if mem is None:
+        mem = 4 * GB
+    return cores, mem / GB
+
+
+# --------------------- plan ------------------------
+
+def plan(stack, cores, mem_gb, mem_fraction=0.8):
+    """mintpy.compute.* values and per-step estimates for this stack and host."""
+    pixels = stack["rows"] * stack["cols"]
+    usable = max(1.0, mem_gb * mem_fraction - 1.0)
+    max_memory = max(1.0, math.floor(usable) / 2.0)   # GB, in 0.5 steps
+
+    steps = {}
+    for step, layers in STEP_LAYERS.items():
+        need = layers(stack["n_ifg"], stack["n_date"]) * pixels * 4 / GB
+        n_patch = max(1, math.ceil(need / max_memory))
+        steps[step] = {"memory_gb": round(need, 2), "patches": n_patch,
+                       "patch_rows": math.ceil(stack["rows"] / n_patch)}
+
+    patch_pixels = min(pixels, max(1, pixels // steps["invert_network"]["patches"]))
+    by_memory = int((usable - max_memory) // WORKER_OVERHEAD_GB)
+    by_size = max(1, patch_pixels // MIN_PIXELS_PER_WORKER)
+    workers = max(1, min(cores, by_memory, by_size))
+
+    settings = {
+        "mintpy.compute.maxMemory": f"{max_memory:g}",
+        "mintpy.compute.cluster": "local" if workers > 1 else "none",
+        "mintpy.compute.numWorker": str(workers),
+        "mintpy.compute.config": "none",
+    }
+    return settings, steps
+
+
+def apply_overlay(cfg_path, settings, out_path, origin="plan_mintpy_resources.py"):
+    """Copy cfg_path to out_path with the given keys replaced (or appended)."""
+    pending = dict(settings)
+    lines = []
+    with open(cfg_path) as f:
+        for line in f:
+            body, sep, comment = line.rstrip("\n").partition("#")
+            key = body.split("=", 1)[0].strip() if "=" in body else None
+            if key in pending:
+                line = f"{key} = {pending.pop(key)}" + (f" #{comment}" if sep else "") + "\n"
+            lines.append(line)
+    if pending:
+        lines.append(f"\n## added by {origin}\n")
+        lines.extend(f"{k} = {v}\n" for k, v in pending.items())
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w") as f:
+        f.writelines(lines)
+
+
+def write_overlay(path, settings, steps, stack, cores, mem_gb):
+    with open(path, "w") as f:
+        f.write(f"## generated by plan_mintpy_resources.py on {time.strftime('%Y-%m-%d %H:%M')}\n")
+        f.write(f"## host : {cores} cores, {mem_gb:.1f} GB available\n")
+        f.write(f"## stack: {stack['n_date']} dates, {stack['n_ifg']} pairs, "
+                f"{stack['rows']} x {stack['cols']} {stack['dtype']}\n")
+        for step, est in steps.items():
+            f.write(f"## {step:<20s} ~{est['memory_gb']:8.2f} GB -> {est['patches']:4d} patch(es)"
+                    f" of ~{est['patch_rows']} rows\n")
+        for key in COMPUTE_KEYS:
+            if key in settings:
+                f.write(f"{key} = {settings[key]}\n")
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Plan mintpy.compute.* settings from the stack size and host resources."
+    )
+    p.add_argument("cfg", help="MintPy smallbaselineApp cfg file.")
+    p.add_argument("--work-dir", default=".",
+                   help="MintPy working directory (default: current dir, as in run_all.sh).")
+    p.add_argument("--out-dir", default="planned_cfg",
+                   help="Folder for the overlay and the planned cfg (relative to --work-dir).")
+    p.add_argument("--mem-fraction", type=float, default=0.8,
+                   help="Fraction of the available memory MintPy may use (default 0.8).")
+    p.add_argument("--override", action="store_true",
+                   help="Replace compute keys that are already set (not auto) in the cfg.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    out_dir = os.path.join(work_dir, args.out_dir)
+    cfg = read_cfg(args.cfg)
+
+    stack_file = os.path.join(work_dir, "inputs", "ifgramStack.h5")
+    if os.path.exists(stack_file):
+        stack = stack_from_h5(stack_file)
+    else:
+        stack = stack_from_cfg(cfg, work_dir)
+    cores, mem_gb = host_resources()
+    settings, steps = plan(stack, cores, mem_gb, args.mem_fraction)
+
+    if not args.override:
+        for key in COMPUTE_KEYS:
+            if cfg.get(key, "auto") not in ("auto", ""):
+                settings[key] = cfg[key]
+
+    os.makedirs(out_dir, exist_ok=True)
+    overlay = os.path.join(out_dir, "mintpy_resources.cfg")
+    planned = os.path.join(out_dir, os.path.basename(args.cfg))
+    write_overlay(overlay, settings, steps, stack, cores, mem_gb)
+    apply_overlay(args.cfg, settings, planned)
+
+    print("Stack :", f"{stack['n_date']} dates, {stack['n_ifg']} pairs, "
+                     f"{stack['rows']} x {stack['cols']} ({stack['source']})")
+    print("Host  :", f"{cores} cores, {mem_gb:.1f} GB available")
+    for step, est in steps.items():
+        print(f"  {step:<20s} ~{est['memory_gb']:8.2f} GB  {est['patches']:4d} patch(es)")
+    for key in COMPUTE_KEYS:
+        print(f"{key} = {settings[key]}")
+    print("Overlay    :", overlay)
+    print("Planned cfg:", planned)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+postprocess_dag.py
+
+Run the post-processing scripts as a declarative dependency graph.
+
+The graph (configs/postprocess_dag.json) lists, for every node, the script
+it runs, its arguments, its inputs and the products it writes.  "@node" in
+args / inputs is replaced by the first output of that node, which also
+makes it a dependency.  "{var}" is replaced by the graph "vars", which can
+be overridden with --set key=value.
+
+Nodes whose dependencies are done run concurrently on a process pool.
+A node is rebuilt only if its fingerprint (command line, script, input file
+identities and upstream fingerprints) changed since its last successful run
+or one of its outputs is missing.  A failing node only blocks the nodes
+that depend on it.
+
+Example:
+
+python scripts/py/postprocess_dag.py --dag configs/postprocess_dag.json \
+    --set isce_dir=/mnt/data/work/tehran/ISCE --set out_dir=/mnt/data/outputs \
+    --set roi=100,400,200,500 --workers 4
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from file_utils import file_identity
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NODE_REF = re.compile(r"^@([A-Za-z0-9_]+)(?:\.(\d+))?$")
+
+
+# --------------------- graph ------------------------
+
+def load_dag(path, overrides):
+    with open(path) as f:
+        dag = json.load(f)
+    variables = dict(dag.get("vars", {}))
+    variables.update(overrides)
+    for key in ("isce_dir", "out_dir"):
+        if key in variables:
+            variables[key] = os.path.abspath(variables[key])
+    return dag["nodes"], variables
+
+
+def node_deps(node):
+    deps = set()
+    for value in node.get("args", []) + node.get("inputs", []):
+        m = NODE_REF.match(value)
+        if m:
+            deps.add(m.group(1))
+    return deps
+
+
+def topo_order(nodes):
+    order, done, visiting = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise RuntimeError(f"Cycle in post-processing graph at node '{name}'")
+        if name not in nodes:
+            raise RuntimeError(f"Unknown node referenced: '@{name}'")
+        visiting.add(name)
+        for dep in sorted(node_deps(nodes[name])):
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in nodes:
+        visit(name)
+    return order
+
+
+def resolve(nodes, variables):
+    """Substitute {vars} and @node references; returns name -> resolved node."""
+    resolved = {}
+    for name in topo_order(nodes):
+        node = nodes[name]
+
+        def sub(value):
+            m = NODE_REF.match(value)
+            if m:
+                ref = resolved[m.group(1)]
+                idx = int(m.group(2) or 0)
+                if idx >= len(ref["outputs"]):
+                    raise RuntimeError(f"Node '{m.group(1)}' has no output #{idx} "
+                                       f"(referenced by '{name}')")
+                return ref["outputs"][idx]
+            return value.format(**variables)
+
+        resolved[name] = {
+            "script": os.path.join(SCRIPT_DIR, node["script"]),
+            "args": [sub(a) for a in node.get("args", [])],
+            "inputs": [sub(a) for a in node.get("inputs", [])],
+            "outputs": [sub(a) for a in node.get("outputs", [])],
+            "stdout": sub(node["stdout"]) if "stdout" in node else None,
+            "deps": sorted(node_deps(node)),
+        }
+        if resolved[name]["stdout"]:
+            resolved[name]["outputs"].append(resolved[name]["stdout"])
+    return resolved
+
+
+# --------------------- fingerprints ------------------------
+
+def identity(path):
+    try:
+        return file_identity(path)
+    except OSError:
+        return [path, None, None]
+
+
+def fingerprint(node, upstream):
+    payload = {
+        "script": identity(node["script"]),
+        "args": node["args"],
+        "inputs": [identity(p) for p in node["inputs"]],
+        "upstream": upstream,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# --------------------- execution ------------------------
+
+def run_node(name, command, stdout_path):
+    """Worker: run one node as a subprocess; returns (name, exit code, seconds)."""
+    env = dict(os.environ, MPLBACKEND="Agg")
+    t0 = time.perf_counter()
+    if stdout_path:
+        os.makedirs(os.path.dirname(stdout_path), exist_ok=True)
+        with open(stdout_path, "w") as out:
+            code = subprocess.call(command, stdout=out, env=env)
+    else:
+        code = subprocess.call(command, env=env)
+    return name, code, time.perf_counter() - t0
+
+
+def build_command(name, node, metrics_dir):
+    command = [sys.executable, node["script"]] + node["args"]
+    if metrics_dir:
+        command = [sys.executable, os.path.join(SCRIPT_DIR, "stage_metrics.py"),
+                   "--stage", f"post.{name}", "--record-dir", metrics_dir,
+                   "--inputs"] + node["inputs"] + ["--"] + command
+    return command
+
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Run post-processing scripts as a dependency graph on a process pool."
+    )
+    p.add_argument("--dag", default=os.path.join(SCRIPT_DIR, "..", "..", "configs",
+                                                 "postprocess_dag.json"),
+                   help="Graph definition (default: configs/postprocess_dag.json).")
+    p.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                   help="Override a graph variable; repeatable.")
+    p.add_argument("--workers", type=int, default=os.cpu_count(),
+                   help="Parallel nodes (default: number of CPUs).")
+    p.add_argument("--nodes", default=None,
+                   help="Comma-separated target nodes (with their dependencies); default: all.")
+    p.add_argument("--force", action="store_true", help="Rebuild every selected node.")
+    p.add_argument("--dry-run", action="store_true", help="Only report what would run.")
+    p.add_argument("--metrics-dir", default=None,
+                   help="Record each node with stage_metrics.py into this folder.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    overrides = {}
+    for item in args.set:
+        if "=" not in item:
+            raise ValueError(f"--set expects KEY=VALUE, got: {item}")
+        k, v = item.split("=", 1)
+        overrides[k] = v
+
+    nodes, variables = load_dag(args.dag, overrides)
+    graph = resolve(nodes, variables)
+
+    selected = set(graph)
+    if args.nodes:
+        selected = set()
+        stack = [n.strip() for n in args.nodes.split(",") if n.strip()]
+        while stack:
+            n = stack.pop()
+            if n not in graph:
+                raise ValueError(f"Unknown node: {n}")
+            if n not in selected:
+                selected.add(n)
+                stack.extend(graph[n]["deps"])
+
+    state_path = os.path.join(variables.get("out_dir", "."), "postprocess_dag_state.json")
+    state = load_state(state_path)
+
+    print("DAG     :", os.path.abspath(args.dag))
+    print("ISCE DIR:", variables.get("isce_dir"))
+    print("Nodes   :", ", ".join(n for n in topo_order(nodes) if n in selected))
+
+    status = {}   # name -> done / skipped / failed / blocked
+    prints = {}   # name -> fingerprint of this run
+    pending = [n for n in topo_order(nodes) if n in selected]
+    running = {}
+    t_start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        while pending or running:
+            for name in list(pending):
+                deps = graph[name]["deps"]
+                if any(status.get(d) in ("failed", "blocked") for d in deps):
+                    status[name] = "blocked"
+                    pending.remove(name)
+                    print(f"[BLOCK] {name}: dependency failed")
+                    continue
+                if not all(status.get(d) in ("done", "skipped") for d in deps):
+                    continue
+
+                upstream = [prints.get(d) or state.get(d, {}).get("fingerprint") for d in deps]
+                fp = fingerprint(graph[name], upstream)
+                prints[name] = fp
+                pending.remove(name)
+
+                up_to_date = (state.get(name, {}).get("fingerprint") == fp
+                              and all(os.path.exists(p) for p in graph[name]["outputs"]))
+                if up_to_date and not args.force:
+                    status[name] = "skipped"
+                    print(f"[SKIP ] {name}: up to date")
+                    continue
+                if args.dry_run:
+                    status[name] = "done"
+                    print(f"[RUN  ] {name}: would run")
+                    continue
+
+                print(f"[START] {name}")
+                command = build_command(name, graph[name], args.metrics_dir)
+                running[pool.submit(run_node, name, command, graph[name]["stdout"])] = name
+
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                _, code, dt = fut.result()
+                missing = [p for p in graph[name]["outputs"] if not os.path.exists(p)]
+                if code == 0 and not missing:
+                    status[name] = "done"
+                    state[name] = {"fingerprint": prints[name], "seconds": round(dt, 3),
+                                   "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                    save_state(state_path, state)
+                    print(f"[DONE ] {name} ({dt:.1f} s)")
+                else:
+                    status[name] = "failed"
+                    why = f"exit code {code}" if code else f"missing outputs {missing}"
+                    print(f"[WARN ] Node failed: {name} ({why})")
+
+    n_failed = sum(1 for s in status.values() if s in ("failed", "blocked"))
+    print(f"\nFinished in {time.perf_counter() - t_start:.1f} s: "
+          + ", ".join(f"{k}={sum(1 for s in status.values() if s == k)}"
+                      for k in ("done", "skipped", "failed", "blocked")))
+    sys.exit(1 if n_failed else 0)
+
+
+if __name__ == "__main__":
+    main()
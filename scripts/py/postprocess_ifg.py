@@ -25,47 +25,28 @@ python scripts/postprocess_ifg.py \
 import os
 import argparse
 import numpy as np
-from osgeo import gdal
 
+from blockwise import Stats, map_row_blocks
+from raster_io import read_band, save_geotiff
+from step_cache import StepCache, add_cache_args, read_input
 
-# --------------------- توابع کمکی ------------------------
 
-def read_gdal_array(path):
-    """خواندن یک raster با GDAL و برگرداندن (آرایه، GeoTransform، Projection)."""
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open {path}")
-    arr = ds.ReadAsArray()
-    gt = ds.GetGeoTransform()
-    proj = ds.GetProjection()
-    ds = None
-    return arr, gt, proj
-
-
-def save_geotiff(path, array, geotransform, projection, nodata=None):
-    """ذخیره یک آرایه ۲بعدی به صورت GeoTIFF float32."""
-    driver = gdal.GetDriverByName("GTiff")
-    ny, nx = array.shape
-    ds = driver.Create(path, nx, ny, 1, gdal.GDT_Float32)
-    ds.SetGeoTransform(geotransform)
-    ds.SetProjection(projection)
-    band = ds.GetRasterBand(1)
-    if nodata is not None:
-        band.SetNoDataValue(nodata)
-    band.WriteArray(array.astype("float32"))
-    band.FlushCache()
-    ds = None
+# طول موج Sentinel-1
+S1_WAVELENGTH = 0.055465  # متر
+
 
+# --------------------- توابع کمکی ------------------------
 
 def stats_from_array(arr, name=""):
-    finite = np.isfinite(arr)
-    if not finite.any():
+    print_stats(Stats.of(arr), name)
+
+
+def print_stats(st, name=""):
+    """چاپ آمار (Stats ادغام‌شده از بلوک‌ها) با همان قالب stats_from_array."""
+    if st.count == 0:
         print(f"{name} : همه مقادیر NaN هستند!")
         return
-    print(f"{name} min / mean / max :",
-          float(arr[finite].min()),
-          float(arr[finite].mean()),
-          float(arr[finite].max()))
+    print(f"{name} min / mean / max :", st.vmin, st.mean, st.vmax)
 
 
 def parse_roi(roi_str):
@@ -98,6 +79,18 @@ def parse_args():
         default=None,
         help="مسیر coherence. پیش‌فرض: merged/topophase.cor.geo.vrt",
     )
+    p.add_argument(
+        "--unw-band",
+        type=int,
+        default=1,
+        help="شماره باند فاز در فایل unw (پیش‌فرض ۱؛ در فایل دوباندی ISCE فاز باند ۲ است).",
+    )
+    p.add_argument(
+        "--coh-band",
+        type=int,
+        default=1,
+        help="شماره باند coherence (پیش‌فرض ۱).",
+    )
     p.add_argument(
         "--coh-scale",
         type=float,
@@ -127,6 +120,25 @@ def parse_args():
         default="los_displacement_mm.tif",
         help="نام فایل خروجی LOS (mm) داخل فولدر merged.",
     )
+    p.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="تعداد threadها برای پردازش بلوک‌های سطری (پیش‌فرض: همه هسته‌های در دسترس).",
+    )
+    p.add_argument(
+        "--quantize",
+        type=float,
+        default=None,
+        help="ذخیره به صورت int16 با گام کوانتش (mm)، مثلاً 0.01؛ "
+             "حداکثر خطا نصف گام است و خواننده‌ها خودکار به float32 برمی‌گردانند.",
+    )
+    add_cache_args(
+        p,
+        help_dir="فولدر cache مراحل (step_cache.py)؛ پیش‌فرض متغیر محیطی "
+                 "POSTPROCESS_CACHE_DIR، و بدون آن cache خاموش است.",
+        help_mb="سقف حجم cache بر حسب MB (حذف LRU).",
+    )
     return p.parse_args()
 
 
@@ -165,90 +177,117 @@ def main():
     if roi is not None:
         print("ROI (x1,x2,y1,y2):", roi)
 
-    # طول موج Sentinel-1
-    S1_WAVELENGTH = 0.055465  # متر
-
-    # ---------- خواندن coherence ----------
+    # ---------- خواندن coherence و فاز ----------
+    # فقط یک باند؛ برای فایل‌های خام ISCE به صورت memmap (بدون کپی).
+    # همه کرنل‌های پیکسلی (scale، کلیپ، LOS، ماسک‌ها، آمار) روی بلوک‌های
+    # سطری در thread pool اجرا می‌شوند و نتایج جزئی به ترتیب بلوک ادغام می‌شوند.
+    # با --cache-dir فاز خروجی remove_ramp مستقیم از cache (memmap .npy) خوانده
+    # می‌شود و اگر ورودی‌ها و پارامترها تغییر نکرده باشند کل محاسبه هم تکرار نمی‌شود.
+    cache = StepCache.from_args(args)
     print("\n== خواندن coherence ==")
-    coh_raw, gt_coh, proj_coh = read_gdal_array(coh_path)
+    coh_raw, gt_coh, proj_coh = read_band(coh_path, band=args.coh_band)
+    coh_scale = float(args.coh_scale)
+    print("اندازه تصویر coherence:", coh_raw.shape)
 
-    # اگر چندباندی بود -> باند اول
-    if coh_raw.ndim == 3:
-        coh_raw = coh_raw[0]
+    print("\n== خواندن فاز ==")
+    # باند انتخابی (پیش‌فرض اول، مانند قبل)؛ بدون کپی اضافه برای astype
+    unw, gt_unw, proj_unw = read_input(cache, unw_path, band=args.unw_band)
+    ny, nx = unw.shape
+    print("اندازه تصویر فاز:", (ny, nx))
 
-    coh = coh_raw.astype("float32") / float(args.coh_scale)
-    print("اندازه تصویر coherence:", coh.shape)
+    # طول موج Sentinel-1 → ضریب فاز به میلی‌متر
+    phase_clip = float(args.phase_clip)
+    phase2mm = np.float32(S1_WAVELENGTH / (4.0 * np.pi) * 1000.0)
+    coh_thr = float(args.coh_threshold)
+    stat_names = ("coh", "unw", "unw_clipped", "los", "final")
+    count_names = ("n_good_phase", "n_swath", "n_mask")
+
+    def kernel(y0, y1):
+        coh = coh_raw[y0:y1] / coh_scale
+        u = unw[y0:y1]
+        good_phase = np.isfinite(u) & (np.abs(u) <= phase_clip)
+        u_clipped = np.where(good_phase, u, np.nan)
+        los_mm = u_clipped * phase2mm
+        swath = np.isfinite(coh) & (coh > 0.0)
+        keep = swath & (coh >= coh_thr) if coh_thr > 0.0 else swath
+        los_buf[y0:y1] = np.where(keep, los_mm, np.nan)
+        return {
+            "coh": Stats.of(coh), "unw": Stats.of(u), "unw_clipped": Stats.of(u_clipped),
+            "los": Stats.of(los_mm), "final": Stats.of(los_buf[y0:y1]),
+            "n_good_phase": int(good_phase.sum()), "n_swath": int(swath.sum()),
+            "n_mask": int(keep.sum()),
+        }
+
+    def swath_only(y0, y1):
+        # fallback وقتی هیچ پیکسلی از آستانه coherence عبور نکند
+        coh = coh_raw[y0:y1] / coh_scale
+        u = unw[y0:y1]
+        good_phase = np.isfinite(u) & (np.abs(u) <= phase_clip)
+        swath = np.isfinite(coh) & (coh > 0.0)
+        los_buf[y0:y1] = np.where(good_phase & swath, u * phase2mm, np.nan)
+        return Stats.of(los_buf[y0:y1])
+
+    def compute():
+        parts = map_row_blocks(kernel, ny, nx, threads=args.threads)
+        merged = {k: Stats.merge(p[k] for p in parts) for k in stat_names}
+        counts = {k: sum(p[k] for p in parts) for k in count_names}
+        if coh_thr > 0.0 and counts["n_mask"] == 0:
+            merged["final"] = Stats.merge(map_row_blocks(swath_only, ny, nx, threads=args.threads))
+        stats = {k: [st.count, st.total, st.vmin, st.vmax] for k, st in merged.items()}
+        return los_buf, {"stats": stats, "counts": counts,
+                         "geotransform": gt_unw, "projection": proj_unw}
+
+    los_buf = np.empty((ny, nx), dtype="float32")
+    if cache is None:
+        los_final, meta = compute()
+    else:
+        params = {"unw_band": args.unw_band, "coh_band": args.coh_band, "coh_scale": coh_scale,
+                  "coh_threshold": coh_thr, "phase_clip": phase_clip}
+        # خود اسکریپت هم جزو ورودی‌هاست تا تغییر کد، cache قدیمی را باطل کند
+        los_final, meta, hit = cache.cached("postprocess_ifg", [__file__, unw_path, coh_path],
+                                            params, compute)
+        print("\ncache:", "استفاده از نتیجه ذخیره‌شده" if hit else "محاسبه و ذخیره", meta["key"][:12])
+    merged = {k: Stats(*v) for k, v in meta["stats"].items()}
+    counts = meta["counts"]
 
     print("\n== آمار global coherence ==")
-    stats_from_array(coh, "Global coherence")
+    print_stats(merged["coh"], "Global coherence")
 
     if roi is not None:
         x1, x2, y1, y2 = roi
-        roi_coh = coh[y1:y2, x1:x2]
+        roi_coh = coh_raw[y1:y2, x1:x2] / coh_scale
         print("\nROI shape:", roi_coh.shape)
         stats_from_array(roi_coh, "ROI coherence")
 
-    # ---------- خواندن فاز ----------
-    print("\n== خواندن فاز ==")
-    unw_raw, gt_unw, proj_unw = read_gdal_array(unw_path)
-
-    # اگر چندباندی بود → باند اول
-    if unw_raw.ndim == 3:
-        unw_raw = unw_raw[0]
-
-    unw = unw_raw.astype("float32")
-    ny, nx = unw.shape
-    print("اندازه تصویر فاز:", (ny, nx))
-
     # ---------- برش فازهای غیرواقعی ----------
-    phase_clip = float(args.phase_clip)
     print(f"\nبرش فاز با |phi| <= {phase_clip} rad")
-
-    mask_good_phase = np.isfinite(unw) & (np.abs(unw) <= phase_clip)
-    n_good_phase = int(mask_good_phase.sum())
-    print("تعداد پیکسل با فاز معقول برای LOS:", n_good_phase)
-
-    unw_clipped = np.where(mask_good_phase, unw, np.nan)
+    print("تعداد پیکسل با فاز معقول برای LOS:", counts["n_good_phase"])
 
     print("\n== آمار فاز قبل از کلیپ ==")
-    stats_from_array(unw, "UNW (rad)")
+    print_stats(merged["unw"], "UNW (rad)")
     print("\n== آمار فاز بعد از کلیپ ==")
-    stats_from_array(unw_clipped, f"UNW clipped |phi|<={phase_clip}rad")
+    print_stats(merged["unw_clipped"], f"UNW clipped |phi|<={phase_clip}rad")
 
     # ---------- محاسبه LOS ----------
     print("\n== محاسبه LOS displacement (mm) از فاز کلیپ شده ==")
-    los_m = unw_clipped * (S1_WAVELENGTH / (4.0 * np.pi))
-    los_mm = los_m * 1000.0
-
     print("\n== آمار global LOS displacement (mm) (قبل از ماسک) ==")
-    stats_from_array(los_mm, "Global LOS mm")
+    print_stats(merged["los"], "Global LOS mm")
 
     # ---------- ماسک swath: حذف نواحی بیرون از پوشش ----------
-    mask_swath = np.isfinite(coh) & (coh > 0.0)
-    n_swath = int(mask_swath.sum())
-    print("تعداد پیکسل داخل swath (coh>0):", n_swath)
-
-    los_swath = np.where(mask_swath, los_mm, np.nan)
+    print("تعداد پیکسل داخل swath (coh>0):", counts["n_swath"])
 
     # ---------- ماسک coherence (اختیاری) ----------
-    coh_thr = float(args.coh_threshold)
+    final_stats = merged["final"]
     if coh_thr > 0.0:
-        mask_coh = mask_swath & (coh >= coh_thr)
-        n_mask = int(mask_coh.sum())
-        print("تعداد پیکسل عبورکرده از آستانه coherence:", n_mask)
-
-        if n_mask == 0:
+        print("تعداد پیکسل عبورکرده از آستانه coherence:", counts["n_mask"])
+        if counts["n_mask"] == 0:
             print("هشدار: هیچ پیکسل عبور از آستانه coherence پیدا نشد؛ "
                   "فقط ماسک swath اعمال می‌شود.")
-            los_final = los_swath
-        else:
-            los_final = np.where(mask_coh, los_mm, np.nan)
     else:
         print("coh-threshold = 0.0 → فقط swath mask اعمال می‌شود.")
-        los_final = los_swath
 
     print("\n== آمار LOS پس از ماسک‌های نهایی ==")
-    stats_from_array(los_final, "LOS final mm")
+    print_stats(final_stats, "LOS final mm")
 
     if roi is not None:
         x1, x2, y1, y2 = roi
@@ -259,7 +298,15 @@ def main():
     # ---------- ذخیره GeoTIFF ----------
     print("\n== ذخیره GeoTIFF جابجایی LOS (mm) در:")
     print(out_path)
-    save_geotiff(out_path, los_final, gt_unw, proj_unw, nodata=np.nan)
+    def write():
+        save_geotiff(out_path, los_final, gt_unw, proj_unw, nodata=np.nan,
+                     quantize_step=args.quantize)
+
+    # فایل کوانتیزه‌شده با آرایه cache برابر نیست، پس alias فقط برای float32
+    if cache is None or args.quantize is not None:
+        write()
+    elif not cache.write_output(out_path, meta, write):
+        print("(فایل خروجی از همین نتیجه cache نوشته شده و تغییری نکرده است)")
     print("تمام شد.")
 
 
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+product_cube.py
+
+Collect the derived products of a project (deramped unw, LOS / vertical
+displacement, coherence, incidence, masks, ...) into one chunked,
+compressed HDF5 cube on a single grid:
+
+- every layer is a 2D dataset at the root, all with the same shape and the
+  same chunk grid (--chunk, default 256 x 256, clamped to the grid shape;
+  the manifest records the chunk used), gzip + shuffle compressed
+- the georeferencing is stored once (X_FIRST/X_STEP/Y_FIRST/Y_STEP as in
+  MintPy, plus the projection WKT)
+- a JSON manifest (root attribute MANIFEST and <cube>.json next to it)
+  lists the grid and, per layer, source file / band / mtime, dtype,
+  nodata and summary statistics
+
+Sources whose shape or geotransform do not match the grid are rejected
+when the cube is built, so readers no longer check shapes by hand.  A
+layer is re-imported only if its source changed (size / mtime), so the
+build can run after every post-processing run.
+
+Any script reads a layer through raster_io with 'products.h5:<layer>' as
+path (lazy h5py dataset, windowed reads); ProductCube.blocks() iterates
+several layers window by window on the shared chunk grid.
+
+Example:
+
+python scripts/py/product_cube.py build --isce-dir . --out outputs/products.h5 --defaults \
+    --layer mask=merged/waterMask.geo.tif
+python scripts/py/product_cube.py info outputs/products.h5
+python scripts/py/scatter_coh_vs_vertical.py --vert-path outputs/products.h5:vertical_mm \
+    --coh-path outputs/products.h5:coherence
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from raster_io import attrs_geotransform, open_band, resolve_path
+
+
+# layers picked up by --defaults when the file exists: name -> (path, band, unit)
+DEFAULT_LAYERS = {
+    "unw_rampcorr": ("merged/filt_topophase.unw_rampcorr.geo.tif", 1, "radian"),
+    "los_mm": ("merged/los_displacement_mm.tif", 1, "mm"),
+    "vertical_mm": ("merged/vertical_displacement_mm.tif", 1, "mm"),
+    "coherence": ("merged/topophase.cor.geo.vrt", 1, "1"),
+    "incidence": ("mintpy_inputs/geometry/incidenceAngle.geo", 1, "degree"),
+}
+
+
+def manifest_path(cube_path):
+    return os.path.splitext(cube_path)[0] + ".json"
+
+
+# --------------------- reading ------------------------
+
+class ProductCube:
+    """Read access to a product cube: ``cube["vertical_mm"][y0:y1, x0:x1]``."""
+
+    def __init__(self, path):
+        import h5py
+
+        self.path = path
+        self.f = h5py.File(path, "r")
+        self.manifest = json.loads(self.f.attrs["MANIFEST"])
+        self.shape = tuple(self.manifest["grid"]["shape"])
+        self.chunk = tuple(self.manifest["grid"]["chunk"])
+        self.geotransform = attrs_geotransform(self.f.attrs)
+        self.projection = self.manifest["grid"]["projection"]
+
+    @property
+    def layers(self):
+        return list(self.manifest["layers"])
+
+    def __getitem__(self, name):
+        return self.f[name]
+
+    def window(self, names, y0, y1, x0, x1):
+        """{name: array} of the same window of several layers."""
+        return {n: self.f[n][y0:y1, x0:x1] for n in names}
+
+    def blocks(self, names, rows=None, cols=None):
+        """Yield ((y0, y1, x0, x1), {name: array}) over the chunk grid.
+
+        rows / cols default to one chunk and are rounded up to whole chunks,
+        so every block reads complete chunks of each layer.
+        """
+        cy, cx = self.chunk
+        rows = -(-(rows or cy) // cy) * cy
+        cols = -(-(cols or self.shape[1]) // cx) * cx
+        ny, nx = self.shape
+        for y0 in range(0, ny, rows):
+            for x0 in range(0, nx, cols):
+                y1, x1 = min(ny, y0 + rows), min(nx, x0 + cols)
+                yield (y0, y1, x0, x1), self.window(names, y0, y1, x0, x1)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --------------------- building ------------------------
+
+def source_identity(path):
+    # ISCE rasters are data + .vrt/.xml headers; a change to either is a new layer
+    base = path[:-4] if path.endswith((".vrt", ".xml")) else path
+    files = [p for p in (base, base + ".vrt", base + ".xml") if os.path.exists(p)] or [path]
+    stats = [os.stat(p) for p in files]
+    return {"size": sum(st.st_size for st in stats), "mtime": max(st.st_mtime for st in stats)}
+
+
+def same_grid(gt_a, gt_b, shape_a, shape_b, tol=1e-6):
+    if shape_a != shape_b:
+        return False
+    if gt_a is None or gt_b is None:
+        return gt_a is gt_b
+    # tolerance relative to the pixel size (text headers round differently)
+    px = max(abs(gt_a[1]), abs(gt_a[5]))
+    return all(abs(a - b) <= tol * px for a, b in zip(gt_a, gt_b))
+
+
+def layer_stats(ds, chunk_rows):
+    vmin, vmax, total, count = np.inf, -np.inf, 0.0, 0
+    for y0 in range(0, ds.shape[0], chunk_rows):
+        a = ds[y0:y0 + chunk_rows].astype("float64")
+        a = a[np.isfinite(a)]
+        if a.size:
+            vmin, vmax = min(vmin, a.min()), max(vmax, a.max())
+            total += a.sum()
+            count += a.size
+    n = ds.shape[0] * ds.shape[1]
+    return {"min": float(vmin) if count else None, "max": float(vmax) if count else None,
+            "mean": total / count if count else None, "valid_fraction": count / n}
+
+
+def grid_chunk(chunk, shape):
+    """--chunk clamped to the grid shape (h5py refuses chunks larger than the data)."""
+    return tuple(max(1, min(int(c), int(n))) for c, n in zip(chunk, shape))
+
+
+def import_layer(f, name, src, chunk, level):
+    """Copy a lazily opened band into dataset ``name``, one chunk row at a time."""
+    if name in f:
+        del f[name]
+    dtype = src.dtype if src.dtype.kind in "iub" else np.dtype("float32")
+    ds = f.create_dataset(name, shape=src.shape, dtype=dtype, chunks=chunk,
+                          compression="gzip", compression_opts=level, shuffle=True)
+    for y0 in range(0, src.shape[0], chunk[0]):
+        y1 = min(src.shape[0], y0 + chunk[0])
+        ds[y0:y1] = np.asarray(src[y0:y1, :], dtype=dtype)
+    return ds
+
+
+def build(out_path, layers, chunk=(256, 256), level=4, force=False):
+    """layers: {name: (path, band, unit)}.  Returns the manifest."""
+    import h5py
+
+    mode = "a" if os.path.exists(out_path) else "w"
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with h5py.File(out_path, mode) as f:
+        manifest = json.loads(f.attrs["MANIFEST"]) if "MANIFEST" in f.attrs else None
+        if (manifest is not None
+                and tuple(manifest["grid"]["chunk"]) != grid_chunk(chunk, manifest["grid"]["shape"])):
+            raise ValueError(f"{out_path} uses chunks {manifest['grid']['chunk']}; "
+                             f"rebuild it to change --chunk")
+        for name, (path, band, unit) in layers.items():
+            src, gt, proj = open_band(path, band)
+            gt = tuple(gt) if gt is not None else None
+            shape = tuple(src.shape)
+            if manifest is None:
+                manifest = {"grid": {"shape": list(shape), "geotransform": gt,
+                                     "projection": proj or "",
+                                     "chunk": list(grid_chunk(chunk, shape))},
+                            "layers": {}}
+            grid = manifest["grid"]
+            chunk = tuple(grid["chunk"])
+            grid_gt = tuple(grid["geotransform"]) if grid["geotransform"] else None
+            if not same_grid(grid_gt, gt, tuple(grid["shape"]), shape):
+                raise ValueError(f"Layer {name} ({path}) is {shape} with geotransform {gt}; "
+                                 f"the cube grid is {tuple(grid['shape'])} with {grid_gt}")
+
+            ident = source_identity(path)
+            entry = manifest["layers"].get(name)
+            if (not force and entry is not None and name in f
+                    and entry["source"] == os.path.abspath(path) and entry["band"] == band
+                    and {k: entry[k] for k in ident} == ident):
+                print(f"  {name:<14s} up to date")
+                continue
+            t0 = time.perf_counter()
+            ds = import_layer(f, name, src, chunk, level)
+            ds.attrs["UNIT"] = unit
+            nodata = getattr(src, "nodata", None)
+            manifest["layers"][name] = {
+                "source": os.path.abspath(path), "band": band, **ident,
+                "dtype": ds.dtype.name, "unit": unit, "nodata": nodata,
+                "stats": layer_stats(ds, chunk[0]),
+            }
+            print(f"  {name:<14s} imported in {time.perf_counter() - t0:.1f} s from {path}")
+
+        if manifest is None:
+            raise ValueError("No layer to import.")
+        ny, nx = manifest["grid"]["shape"]
+        f.attrs.update({"FILE_TYPE": "productCube", "LENGTH": ny, "WIDTH": nx,
+                        "PROJECTION": manifest["grid"]["projection"]})
+        gt = manifest["grid"]["geotransform"]
+        if gt:
+            f.attrs.update({"X_FIRST": gt[0], "X_STEP": gt[1], "Y_FIRST": gt[3], "Y_STEP": gt[5]})
+        manifest["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        f.attrs["MANIFEST"] = json.dumps(manifest)
+
+    with open(manifest_path(out_path), "w") as fj:
+        json.dump(manifest, fj, indent=2)
+    return manifest
+
+
+# --------------------- CLI ------------------------
+
+def parse_layer(spec, isce_dir):
+    """'name=path[:band][@unit]' -> (name, (path, band, unit))."""
+    name, rest = spec.split("=", 1)
+    rest, _, unit = rest.partition("@")
+    path, band = rest, 1
+    head, sep, tail = rest.rpartition(":")
+    if sep and tail.isdigit():
+        path, band = head, int(tail)
+    return name.strip(), (resolve_path(isce_dir, path), band, unit or "")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Consolidate derived products into one chunked HDF5 cube with a manifest."
+    )
+    sub = p.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Create or update a cube.")
+    b.add_argument("--isce-dir", default=".", help="ISCE project directory.")
+    b.add_argument("--out", default="outputs/products.h5",
+                   help="Cube file (relative to --isce-dir).")
+    b.add_argument("--layer", action="append", default=[],
+                   help="name=path[:band][@unit], repeatable.")
+    b.add_argument("--defaults", action="store_true",
+                   help="Add the standard products that exist: " + ", ".join(DEFAULT_LAYERS))
+    b.add_argument("--chunk", default="256,256", help="Chunk rows,cols (default 256,256).")
+    b.add_argument("--level", type=int, default=4, help="gzip level (default 4).")
+    b.add_argument("--force", action="store_true", help="Re-import unchanged layers too.")
+    i = sub.add_parser("info", help="Print the manifest of a cube.")
+    i.add_argument("cube")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.command == "info":
+        with ProductCube(args.cube) as cube:
+            grid = cube.manifest["grid"]
+            print(f"Grid   : {grid['shape'][0]} x {grid['shape'][1]}, chunks {grid['chunk']}, "
+                  f"geotransform {grid['geotransform']}")
+            for name, e in cube.manifest["layers"].items():
+                st = e["stats"]
+                rng = f"[{st['min']:.4g}, {st['max']:.4g}]" if st["min"] is not None else "[empty]"
+                print(f"  {name:<14s} {e['dtype']:<8s} {e['unit']:<7s} {rng:<24s} "
+                      f"valid {st['valid_fraction']:6.1%}  <- {e['source']}")
+        return
+
+    isce_dir = os.path.abspath(args.isce_dir)
+    layers = {}
+    if args.defaults:
+        for name, (path, band, unit) in DEFAULT_LAYERS.items():
+            full = resolve_path(isce_dir, path)
+            if os.path.exists(full):
+                layers[name] = (full, band, unit)
+    layers.update(parse_layer(s, isce_dir) for s in args.layer)
+    if not layers:
+        raise SystemExit("Nothing to import: give --layer and/or --defaults.")
+
+    out = resolve_path(isce_dir, args.out)
+    chunk = tuple(int(v) for v in args.chunk.split(","))
+    print("Cube:", out)
+    manifest = build(out, layers, chunk, args.level, args.force)
+    print(f"{len(manifest['layers'])} layers, manifest: {manifest_path(out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,8 @@
 import os
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from osgeo import gdal
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open file: {path}")
-    arr = ds.ReadAsArray()
-    ds = None
-    return arr
+from raster_io import read_band, resolve_path
 
 
 def parse_args():
@@ -34,21 +25,13 @@ def main():
 
     isce_dir = os.path.abspath(args.isce_dir)
 
-    los_path = args.los_path
-    if not os.path.isabs(los_path):
-        los_path = os.path.join(isce_dir, los_path)
+    los_path = resolve_path(isce_dir, args.los_path)
 
-    vert_path = args.vert_path
-    if not os.path.isabs(vert_path):
-        vert_path = os.path.join(isce_dir, vert_path)
+    vert_path = resolve_path(isce_dir, args.vert_path)
 
-    los = read_gdal_array(los_path)
-    if los.ndim == 3:
-        los = los[0]
+    los, _, _ = read_band(los_path, band=1)
 
-    vert = read_gdal_array(vert_path)
-    if vert.ndim == 3:
-        vert = vert[0]
+    vert, _, _ = read_band(vert_path, band=1)
 
     if los.shape != vert.shape:
         raise RuntimeError(f"Shape mismatch: LOS {los.shape} vs vertical {vert.shape}")
@@ -70,6 +53,8 @@ def main():
     vert_prof = vert[y_mid, x_min:x_max+1]
     x_idx = np.arange(x_min, x_max+1)
 
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(8, 4))
     ax.plot(x_idx, los_prof, label="LOS displacement (mm)", alpha=0.7)
     ax.plot(x_idx, vert_prof, label="Vertical displacement (mm)", alpha=0.7)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+query_service.py
+
+Long-running localhost service for velocity / displacement lookups.
+
+The rasters (vertical / LOS GeoTIFFs, MintPy velocity.h5, ...) are opened
+once at start-up and read in fixed-size tiles.  Decoded tiles are kept in an
+LRU cache, so repeated questions about the same area are answered from
+memory instead of re-reading the whole file.
+
+Endpoints (GET, JSON responses):
+
+    /layers                               list of loaded layers
+    /point?layer=vert&x=120&y=340         value at a pixel
+    /point?layer=vert&lat=35.6&lon=51.3   value at a geographic position
+    /roi?layer=vert&roi=x1,x2,y1,y2       ROI statistics (as analyze_vertical_roi.py)
+    /crop?layer=vert&roi=x1,x2,y1,y2&step=2   small map crop (nested lists)
+    /metrics                              request counters and cache hit rate
+
+Example:
+
+python scripts/py/query_service.py \
+    --isce-dir . \
+    --layer vert=merged/vertical_displacement_mm.tif \
+    --layer los=merged/los_displacement_mm.tif \
+    --layer vel=inputs/velocity.h5:velocity \
+    --port 8765
+
+curl "http://127.0.0.1:8765/roi?layer=vert&roi=100,400,200,500"
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from raster_io import attrs_geotransform, open_band
+
+
+# --------------------- raster sources ------------------------
+
+class RasterSource:
+    """Single band of a raster opened through raster_io.
+
+    Raw ISCE products are memory-mapped views; other formats are read by
+    GDAL window.
+    """
+
+    def __init__(self, path, band=1):
+        self.arr, self.geotransform, _ = open_band(path, band)
+        self.shape = self.arr.shape
+        self.nodata = getattr(self.arr, "nodata", None)
+        self.lock = threading.Lock()
+
+    def read(self, y0, y1, x0, x1):
+        # GDAL dataset handles are not thread-safe
+        with self.lock:
+            arr = self.arr[y0:y1, x0:x1]
+        arr = np.asarray(arr, dtype="float32")
+        if self.nodata is not None and np.isfinite(self.nodata):
+            arr = np.where(arr == self.nodata, np.nan, arr)
+        return arr
+
+
+class H5Source:
+    """2D dataset of a MintPy HDF5 file (e.g. velocity.h5:velocity).
+
+    Contiguous, uncompressed datasets are memory-mapped directly; chunked or
+    compressed ones fall back to h5py slicing.
+    """
+
+    def __init__(self, path, dataset):
+        import h5py
+
+        self.file = h5py.File(path, "r")
+        if dataset not in self.file:
+            raise RuntimeError(f"Dataset '{dataset}' not found in {path}")
+        dset = self.file[dataset]
+        if dset.ndim != 2:
+            raise RuntimeError(f"Dataset '{dataset}' in {path} is not 2D: {dset.shape}")
+        self.dset = dset
+        self.shape = dset.shape
+        self.geotransform = attrs_geotransform(self.file.attrs)
+        self.lock = threading.Lock()
+
+        self.mmap = None
+        offset = dset.id.get_offset()
+        if dset.chunks is None and dset.compression is None and offset is not None:
+            self.mmap = np.memmap(path, mode="r", dtype=dset.dtype,
+                                  offset=offset, shape=dset.shape)
+
+    def read(self, y0, y1, x0, x1):
+        if self.mmap is not None:
+            return np.asarray(self.mmap[y0:y1, x0:x1], dtype="float32")
+        with self.lock:
+            arr = self.dset[y0:y1, x0:x1]
+        return arr.astype("float32", copy=False)
+
+
+def open_source(spec, isce_dir):
+    """Open a layer given as 'path' or 'path.h5:dataset'."""
+    path, dataset = spec, None
+    if ".h5:" in spec:
+        path, dataset = spec.rsplit(":", 1)
+    if not os.path.isabs(path):
+        path = os.path.join(isce_dir, path)
+    if path.endswith(".h5"):
+        return H5Source(path, dataset or os.path.splitext(os.path.basename(path))[0])
+    return RasterSource(path)
+
+
+# --------------------- tile cache ------------------------
+
+class TileCache:
+    """Thread-safe LRU cache of decoded tiles, bounded in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.tiles = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+            self.misses += 1
+
+        # decode outside the lock; a concurrent miss on the same tile only
+        # costs one duplicate read
+        tile = loader()
+        tile.setflags(write=False)
+
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = tile
+                self.nbytes += tile.nbytes
+                while self.nbytes > self.max_bytes and len(self.tiles) > 1:
+                    _, old = self.tiles.popitem(last=False)
+                    self.nbytes -= old.nbytes
+                    self.evictions += 1
+        return tile
+
+    def metrics(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "tiles": len(self.tiles),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else None,
+            }
+
+
+class Layer:
+    """A raster source plus tiled, cached access by pixel window."""
+
+    def __init__(self, name, source, cache, tile_size):
+        self.name = name
+        self.source = source
+        self.cache = cache
+        self.tile = int(tile_size)
+        self.shape = source.shape
+
+    def _tile(self, ty, tx):
+        ny, nx = self.shape
+        y0, x0 = ty * self.tile, tx * self.tile
+        y1, x1 = min(ny, y0 + self.tile), min(nx, x0 + self.tile)
+        return self.cache.get((self.name, ty, tx),
+                              lambda: self.source.read(y0, y1, x0, x1))
+
+    def window(self, y0, y1, x0, x1):
+        """Assemble the window [y0:y1, x0:x1] from cached tiles."""
+        out = np.empty((y1 - y0, x1 - x0), dtype="float32")
+        t = self.tile
+        for ty in range(y0 // t, (y1 - 1) // t + 1):
+            for tx in range(x0 // t, (x1 - 1) // t + 1):
+                tile = self._tile(ty, tx)
+                ty0, tx0 = ty * t, tx * t
+                sy0, sy1 = max(y0, ty0), min(y1, ty0 + tile.shape[0])
+                sx0, sx1 = max(x0, tx0), min(x1, tx0 + tile.shape[1])
+                out[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = \
+                    tile[sy0 - ty0:sy1 - ty0, sx0 - tx0:sx1 - tx0]
+        return out
+
+    def lonlat_to_pixel(self, lon, lat):
+        gt = self.source.geotransform
+        if gt is None or gt[2] != 0.0 or gt[4] != 0.0:
+            raise ValueError(f"Layer '{self.name}' has no north-up geotransform")
+        x = int(np.floor((lon - gt[0]) / gt[1]))
+        y = int(np.floor((lat - gt[3]) / gt[5]))
+        return x, y
+
+
+# --------------------- queries ------------------------
+
+def roi_stats(arr):
+    """Same statistics as analyze_vertical_roi.py, as a dict."""
+    vals = arr[np.isfinite(arr)]
+    if vals.size == 0:
+        return {"valid_pixels": 0}
+    p5, p50, p95 = np.percentile(vals, [5, 50, 95])
+    return {
+        "min": float(vals.min()),
+        "mean": float(vals.mean()),
+        "max": float(vals.max()),
+        "std": float(vals.std()),
+        "p5": float(p5),
+        "p50": float(p50),
+        "p95": float(p95),
+        "valid_pixels": int(vals.size),
+    }
+
+
+def parse_roi(roi_str, shape):
+    parts = [int(p) for p in roi_str.split(",")]
+    if len(parts) != 4:
+        raise ValueError("ROI must be x1,x2,y1,y2")
+    ny, nx = shape
+    x1, x2, y1, y2 = parts
+    x1, x2 = max(0, min(nx, x1)), max(0, min(nx, x2))
+    y1, y2 = max(0, min(ny, y1)), max(0, min(ny, y2))
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError("ROI is empty after clamping to the image")
+    return x1, x2, y1, y2
+
+
+def value_or_none(v):
+    return float(v) if np.isfinite(v) else None
+
+
+class QueryService:
+    """Request dispatch and counters, independent of the HTTP layer."""
+
+    def __init__(self, layers, cache, max_crop_pixels):
+        self.layers = layers
+        self.cache = cache
+        self.max_crop_pixels = int(max_crop_pixels)
+        self.started = time.time()
+        self.counts = {}
+        self.errors = 0
+        self.latency_ms = {}
+        self.lock = threading.Lock()
+
+    def layer(self, q):
+        name = q.get("layer")
+        if name not in self.layers:
+            raise KeyError(f"Unknown layer: {name}")
+        return self.layers[name]
+
+    def handle(self, endpoint, q):
+        t0 = time.perf_counter()
+        try:
+            if endpoint == "/layers":
+                result = {
+                    name: {"shape": list(lyr.shape),
+                           "geotransform": lyr.source.geotransform}
+                    for name, lyr in self.layers.items()
+                }
+            elif endpoint == "/point":
+                result = self.point(q)
+            elif endpoint == "/roi":
+                result = self.roi(q)
+            elif endpoint == "/crop":
+                result = self.crop(q)
+            elif endpoint == "/metrics":
+                result = self.metrics()
+            else:
+                raise KeyError(f"Unknown endpoint: {endpoint}")
+            status = 200
+        except (KeyError, ValueError) as e:
+            result, status = {"error": str(e).strip("'\"")}, 400
+        except Exception as e:  # keep serving after unexpected failures
+            result, status = {"error": f"{type(e).__name__}: {e}"}, 500
+
+        dt = (time.perf_counter() - t0) * 1000.0
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            self.latency_ms[endpoint] = self.latency_ms.get(endpoint, 0.0) + dt
+            if status != 200:
+                self.errors += 1
+        if status == 200 and endpoint != "/metrics":
+            result["elapsed_ms"] = round(dt, 3)
+        return status, result
+
+    def point(self, q):
+        lyr = self.layer(q)
+        if "lat" in q and "lon" in q:
+            x, y = lyr.lonlat_to_pixel(float(q["lon"]), float(q["lat"]))
+        else:
+            x, y = int(q["x"]), int(q["y"])
+        ny, nx = lyr.shape
+        if not (0 <= x < nx and 0 <= y < ny):
+            raise ValueError(f"Pixel ({x},{y}) outside image of shape {lyr.shape}")
+        v = lyr.window(y, y + 1, x, x + 1)[0, 0]
+        return {"layer": lyr.name, "x": x, "y": y, "value": value_or_none(v)}
+
+    def roi(self, q):
+        lyr = self.layer(q)
+        x1, x2, y1, y2 = parse_roi(q["roi"], lyr.shape)
+        out = roi_stats(lyr.window(y1, y2, x1, x2))
+        out.update({"layer": lyr.name, "roi": [x1, x2, y1, y2]})
+        return out
+
+    def crop(self, q):
+        lyr = self.layer(q)
+        x1, x2, y1, y2 = parse_roi(q["roi"], lyr.shape)
+        step = max(1, int(q.get("step", 1)))
+        n_out = ((y2 - y1 + step - 1) // step) * ((x2 - x1 + step - 1) // step)
+        if n_out > self.max_crop_pixels:
+            raise ValueError(f"Crop of {n_out} pixels exceeds limit "
+                             f"{self.max_crop_pixels}; increase step")
+        arr = lyr.window(y1, y2, x1, x2)[::step, ::step]
+        data = [[v if v == v else None for v in row] for row in arr.tolist()]
+        return {"layer": lyr.name, "roi": [x1, x2, y1, y2], "step": step,
+                "shape": list(arr.shape), "data": data}
+
+    def metrics(self):
+        with self.lock:
+            requests = dict(self.counts)
+            mean_ms = {k: self.latency_ms[k] / self.counts[k] for k in self.counts}
+            errors = self.errors
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "requests": requests,
+            "requests_total": sum(requests.values()),
+            "errors": errors,
+            "mean_latency_ms": mean_ms,
+            "cache": self.cache.metrics(),
+        }
+
+
+def make_handler(service):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            status, result = service.handle(url.path.rstrip("/") or "/", q)
+            body = json.dumps(result).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            # per-request access logs are replaced by /metrics
+            pass
+
+    return Handler
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Localhost JSON service for point / ROI / crop lookups "
+                    "on displacement and velocity products."
+    )
+    p.add_argument("--isce-dir", default=".", help="Path to ISCE project directory.")
+    p.add_argument(
+        "--layer",
+        action="append",
+        required=True,
+        help="Layer as name=path (GeoTIFF/VRT) or name=file.h5:dataset; repeatable.",
+    )
+    p.add_argument("--host", default="127.0.0.1",
+                   help="Bind address (default: 127.0.0.1, localhost only).")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--tile-size", type=int, default=256,
+                   help="Tile edge in pixels (default: 256).")
+    p.add_argument("--cache-mb", type=float, default=512.0,
+                   help="Tile cache size in MB (default: 512).")
+    p.add_argument("--max-crop-pixels", type=int, default=250000,
+                   help="Largest crop returned by /crop (default: 250000).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    isce_dir = os.path.abspath(args.isce_dir)
+    cache = TileCache(args.cache_mb * 1024 * 1024)
+
+    layers = {}
+    for spec in args.layer:
+        if "=" not in spec:
+            raise ValueError(f"Layer must be name=path: {spec}")
+        name, path = spec.split("=", 1)
+        layers[name] = Layer(name, open_source(path, isce_dir), cache, args.tile_size)
+        print(f"Layer {name}: {path} shape={layers[name].shape}")
+
+    service = QueryService(layers, cache, args.max_crop_pixels)
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving on http://{args.host}:{args.port} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+raster_io.py
+
+Shared raster I/O for the post-processing scripts.
+
+ISCE products (e.g. merged/filt_topophase.unw.geo + .vrt/.xml) are flat
+binary files, usually band-interleaved by line (BIL).  Instead of
+``ds.ReadAsArray()`` (all bands into a fresh array) followed by
+``.astype("float32")`` (a second copy), the header is parsed and the
+requested band is exposed as a read-only ``np.memmap`` view with the correct
+offset, line stride and dtype.  Opening a product therefore costs no copy
+and no I/O until pixels are touched.
+
+Anything that is not raw binary (GeoTIFF, compressed formats, ...) falls
+back to windowed GDAL reads through ``WindowedBand``.
+
+Usage from a script in scripts/py:
+
+    from raster_io import read_band, save_geotiff
+
+    unw, gt, proj = read_band("merged/filt_topophase.unw.geo.vrt", band=1)
+"""
+
+import os
+
+import numpy as np
+
+
+# GDAL / ISCE type names -> numpy dtype
+GDAL_DTYPES = {
+    "Byte": "u1", "Int8": "i1", "UInt16": "u2", "Int16": "i2",
+    "UInt32": "u4", "Int32": "i4", "UInt64": "u8", "Int64": "i8",
+    "Float32": "f4", "Float64": "f8", "CFloat32": "c8", "CFloat64": "c16",
+}
+ISCE_DTYPES = {
+    "BYTE": "u1", "CHAR": "i1", "SHORT": "i2", "INT": "i4", "LONG": "i8",
+    "FLOAT": "f4", "DOUBLE": "f8", "CFLOAT": "c8", "CDOUBLE": "c16",
+}
+
+# quantised storage (save_geotiff(..., quantize=step)): int16 codes, this one = nodata
+QUANT_NODATA = -32768
+QUANT_MAX_CODE = 32767
+
+WGS84_WKT = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+    'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+    'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,'
+    'AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]'
+)
+
+
+# --------------------- ISCE header parsing ------------------------
+
+def _xml_property(root, name):
+    for prop in root.iter("property"):
+        if prop.get("name", "").lower() == name:
+            value = prop.find("value")
+            if value is not None and value.text is not None:
+                return value.text.strip()
+    return None
+
+
+def _xml_coordinate(root, name):
+    """(startingvalue, delta) of an ISCE <component name="coordinateN">."""
+    for comp in root.iter("component"):
+        if comp.get("name", "").lower() == name:
+            start = _xml_property(comp, "startingvalue")
+            delta = _xml_property(comp, "delta")
+            if start is not None and delta is not None:
+                return float(start), float(delta)
+    return None
+
+
+def parse_isce_xml(xml_path):
+    """Raw layout of every band described by an ISCE .xml header.
+
+    Returns dict with data_file, shape, dtype, geotransform, projection and
+    bands = [(image_offset, line_offset, pixel_offset), ...].
+    """
+    import xml.etree.ElementTree as ET
+
+    root = ET.parse(xml_path).getroot()
+    width = int(_xml_property(root, "width"))
+    length = int(_xml_property(root, "length"))
+    nbands = int(_xml_property(root, "number_bands") or 1)
+    dtype_name = (_xml_property(root, "data_type") or "FLOAT").upper()
+    scheme = (_xml_property(root, "scheme") or "BIL").upper()
+    byte_order = (_xml_property(root, "byte_order") or "l").lower()
+
+    if dtype_name not in ISCE_DTYPES:
+        raise RuntimeError(f"Unsupported ISCE data_type {dtype_name} in {xml_path}")
+    dtype = np.dtype(ISCE_DTYPES[dtype_name]).newbyteorder(
+        ">" if byte_order.startswith("b") else "<")
+    item = dtype.itemsize
+
+    bands = []
+    for b in range(nbands):
+        if scheme == "BIP":
+            bands.append((b * item, width * nbands * item, nbands * item))
+        elif scheme == "BSQ":
+            bands.append((b * width * length * item, width * item, item))
+        else:  # BIL
+            bands.append((b * width * item, width * nbands * item, item))
+
+    data_file = _xml_property(root, "file_name")
+    base = xml_path[:-len(".xml")]
+    if data_file is None or not os.path.exists(data_file):
+        data_file = base
+
+    geotransform, projection = None, None
+    c1 = _xml_coordinate(root, "coordinate1")
+    c2 = _xml_coordinate(root, "coordinate2")
+    if c1 is not None and c2 is not None:
+        geotransform = (c1[0], c1[1], 0.0, c2[0], 0.0, c2[1])
+        if abs(c1[0]) <= 360.0 and abs(c2[0]) <= 90.0:
+            projection = WGS84_WKT
+
+    return {
+        "data_file": data_file,
+        "shape": (length, width),
+        "dtype": dtype,
+        "bands": bands,
+        "geotransform": geotransform,
+        "projection": projection,
+    }
+
+
+def _srs_to_wkt(srs):
+    if not srs or srs.lstrip().startswith(("GEOGCS", "PROJCS", "GEOGCRS", "PROJCRS")):
+        return srs
+    try:
+        from osgeo import osr
+    except ImportError:
+        return WGS84_WKT if srs.upper() in ("EPSG:4326", "WGS84") else srs
+    ref = osr.SpatialReference()
+    if ref.SetFromUserInput(srs) != 0:
+        return srs
+    return ref.ExportToWkt()
+
+
+def parse_raw_vrt(vrt_path):
+    """Raw layout from a GDAL VRT made of VRTRawRasterBand entries.
+
+    Returns None if any band is not a raw band (then GDAL has to be used).
+    """
+    import xml.etree.ElementTree as ET
+
+    root = ET.parse(vrt_path).getroot()
+    if root.tag != "VRTDataset":
+        return None
+    width = int(root.get("rasterXSize"))
+    length = int(root.get("rasterYSize"))
+
+    data_file, dtype, bands = None, None, []
+    for band in root.findall("VRTRasterBand"):
+        if band.get("subClass") != "VRTRawRasterBand":
+            return None
+        src = band.find("SourceFilename")
+        fname = src.text.strip()
+        if src.get("relativeToVRT", "0") == "1":
+            fname = os.path.join(os.path.dirname(os.path.abspath(vrt_path)), fname)
+        if data_file is None:
+            data_file = fname
+        elif os.path.abspath(fname) != os.path.abspath(data_file):
+            return None
+        order = (band.findtext("ByteOrder") or "LSB").upper()
+        band_dtype = np.dtype(GDAL_DTYPES[band.get("dataType", "Float32")]).newbyteorder(
+            ">" if order == "MSB" else "<")
+        if dtype is None:
+            dtype = band_dtype
+        elif band_dtype != dtype:
+            return None
+        item = dtype.itemsize
+        bands.append((
+            int(band.findtext("ImageOffset") or 0),
+            int(band.findtext("LineOffset") or width * item),
+            int(band.findtext("PixelOffset") or item),
+        ))
+    if not bands:
+        return None
+
+    geotransform = None
+    gt_text = root.findtext("GeoTransform")
+    if gt_text:
+        geotransform = tuple(float(v) for v in gt_text.split(","))
+
+    return {
+        "data_file": data_file,
+        "shape": (length, width),
+        "dtype": dtype,
+        "bands": bands,
+        "geotransform": geotransform,
+        "projection": _srs_to_wkt((root.findtext("SRS") or "").strip()) or None,
+    }
+
+
+def raw_layout(path):
+    """Raw binary layout of an ISCE product, or None if it is not raw.
+
+    Accepts the data file itself, its .vrt or its .xml.
+    """
+    candidates = []
+    if path.endswith(".vrt"):
+        candidates = [path, path[:-len(".vrt")] + ".xml"]
+    elif path.endswith(".xml"):
+        candidates = [path]
+    else:
+        candidates = [path + ".vrt", path + ".xml"]
+
+    for cand in candidates:
+        if not os.path.exists(cand):
+            continue
+        layout = parse_raw_vrt(cand) if cand.endswith(".vrt") else parse_isce_xml(cand)
+        if layout is not None and os.path.exists(layout["data_file"]):
+            return layout
+        if cand.endswith(".vrt"):
+            # a VRT that is not raw (or whose source is missing): let GDAL decide
+            return None
+    return None
+
+
+def memmap_band(layout, band=1):
+    """Read-only zero-copy view of one band described by ``raw_layout``."""
+    nbands = len(layout["bands"])
+    if not 1 <= band <= nbands:
+        raise ValueError(f"Band {band} out of range (file has {nbands} bands)")
+    offset, line_stride, pixel_stride = layout["bands"][band - 1]
+    length, width = layout["shape"]
+    dtype = layout["dtype"]
+
+    needed = offset + (length - 1) * line_stride + (width - 1) * pixel_stride + dtype.itemsize
+    size = os.path.getsize(layout["data_file"])
+    if size < needed:
+        raise RuntimeError(f"{layout['data_file']} is truncated: "
+                           f"{size} bytes < {needed} expected from header")
+
+    buf = np.memmap(layout["data_file"], mode="r", dtype="u1")
+    arr = np.ndarray(shape=(length, width), dtype=dtype, buffer=buf,
+                     offset=offset, strides=(line_stride, pixel_stride))
+    arr.flags.writeable = False
+    return arr
+
+
+# --------------------- GDAL fallback ------------------------
+
+class WindowedBand:
+    """Lazy single-band GDAL raster; pixels are read only when sliced.
+
+    Supports ``band[y0:y1, x0:x1]`` (windowed ReadAsArray), ``.shape``,
+    ``.dtype`` and ``np.asarray(band)`` (full read).
+    """
+
+    def __init__(self, path, band=1):
+        from osgeo import gdal
+
+        self.path = path
+        self.ds = gdal.Open(path)
+        if self.ds is None:
+            raise RuntimeError(f"Cannot open {path}")
+        if not 1 <= band <= self.ds.RasterCount:
+            raise ValueError(f"Band {band} out of range "
+                             f"({path} has {self.ds.RasterCount} bands)")
+        self.band = self.ds.GetRasterBand(band)
+        self.shape = (self.ds.RasterYSize, self.ds.RasterXSize)
+        self.ndim = 2
+        self.geotransform = self.ds.GetGeoTransform()
+        self.projection = self.ds.GetProjection()
+        self.nodata = self.band.GetNoDataValue()
+        self.block_shape = tuple(reversed(self.band.GetBlockSize()))
+        self.dtype = np.dtype(GDAL_DTYPES[gdal.GetDataTypeName(self.band.DataType)])
+
+        # scaled integer bands (GDAL scale/offset) are decoded to float32 on
+        # read, with the nodata code -> NaN
+        scale, offset = self.band.GetScale(), self.band.GetOffset()
+        self.scale = 1.0 if scale is None else scale
+        self.offset = 0.0 if offset is None else offset
+        self.quantized = self.dtype.kind in "iu" and (self.scale, self.offset) != (1.0, 0.0)
+        if self.quantized:
+            self.code_nodata = self.nodata
+            self.nodata = np.nan
+            self.dtype = np.dtype("float32")
+
+    def read(self, y0=0, y1=None, x0=0, x1=None):
+        ny, nx = self.shape
+        y1 = ny if y1 is None else y1
+        x1 = nx if x1 is None else x1
+        arr = self.band.ReadAsArray(x0, y0, x1 - x0, y1 - y0)
+        if self.quantized:
+            arr = dequantize(arr, self.scale, self.offset, self.code_nodata)
+        return arr
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2 or not all(isinstance(k, (slice, int, np.integer)) for k in key):
+            # fancy / boolean indexing: read everything
+            return np.asarray(self)[key]
+        ny, nx = self.shape
+        sl = []
+        for k, n in zip(key, (ny, nx)):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(n)
+                sl.append((start, max(start, stop), step, False))
+            else:
+                k = int(k) + (n if k < 0 else 0)
+                sl.append((k, k + 1, 1, True))
+        (y0, y1, ys, ydrop), (x0, x1, xs, xdrop) = sl
+        arr = self.read(y0, y1, x0, x1)[::ys, ::xs]
+        if ydrop and xdrop:
+            return arr[0, 0]
+        if ydrop:
+            return arr[0]
+        if xdrop:
+            return arr[:, 0]
+        return arr
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.read()
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+
+# --------------------- public helpers ------------------------
+
+def open_band(path, band=1):
+    """Open one band lazily.
+
+    Returns (array_like, geotransform, projection).  ``array_like`` is a
+    read-only ``np.memmap`` view for raw ISCE products, otherwise a
+    ``WindowedBand``.  'cube.h5:layer' opens a layer of a product cube
+    (product_cube.py) as a lazy h5py dataset.  No pixel I/O happens here.
+    """
+    if ".h5:" in path:
+        return open_h5_layer(path)
+    layout = raw_layout(path)
+    if layout is not None:
+        return memmap_band(layout, band), layout["geotransform"], layout["projection"]
+    wb = WindowedBand(path, band)
+    return wb, wb.geotransform, wb.projection
+
+
+def attrs_geotransform(attrs):
+    """GDAL-style geotransform from MintPy X/Y_FIRST/STEP attributes (or None)."""
+    keys = ("X_FIRST", "X_STEP", "Y_FIRST", "Y_STEP")
+    if not all(k in attrs for k in keys):
+        return None
+    x0, dx, y0, dy = (float(attrs[k]) for k in keys)
+    return (x0, dx, 0.0, y0, 0.0, dy)
+
+
+def open_h5_layer(spec):
+    """(h5py dataset, geotransform, projection) of 'file.h5:dataset'."""
+    import h5py
+
+    path, name = spec.rsplit(":", 1)
+    f = h5py.File(path, "r")
+    ds = f[name]
+    attrs = f.attrs
+    gt = attrs_geotransform(attrs)
+    proj = attrs.get("PROJECTION", "")
+    return ds, gt, proj.decode() if isinstance(proj, bytes) else proj
+
+
+def band_count(path):
+    """Number of bands of a raster, from the ISCE header when available."""
+    layout = raw_layout(path)
+    if layout is not None:
+        return len(layout["bands"])
+    from osgeo import gdal
+
+    ds = gdal.Open(path)
+    if ds is None:
+        raise RuntimeError(f"Cannot open {path}")
+    return ds.RasterCount
+
+
+def read_band(path, band=1, dtype="float32"):
+    """Band as an ndarray of ``dtype`` with as few copies as possible.
+
+    Raw products already stored as ``dtype`` come back as the memmap view
+    itself (no copy).  Byte-swapped or differently typed data are converted
+    once; GDAL rasters are read with a single ReadAsArray of that band.
+    Returns (array, geotransform, projection).
+    """
+    arr, gt, proj = open_band(path, band)
+    if not isinstance(arr, np.ndarray):
+        arr = arr.read() if isinstance(arr, WindowedBand) else arr[()]
+        if dtype is not None:
+            arr = arr.astype(dtype, copy=False)
+        return arr, gt, proj
+    if dtype is not None and arr.dtype != np.dtype(dtype):
+        arr = arr.astype(dtype)
+    return arr, gt, proj
+
+
+def read_gdal_array(path, band=1):
+    """Compatibility wrapper: (array, geotransform, projection) of one band in
+    its stored dtype (as the per-script helpers used to return)."""
+    return read_band(path, band=band, dtype=None)
+
+
+def quantize(array, step):
+    """Encode ``array`` as int16 codes with resolution ``step``.
+
+    value = code * step + offset, with the offset centred on the finite
+    range so the span covered is 65534 * step; NaN -> QUANT_NODATA.
+    Returns (codes, offset, max_error): the decoded float32 value is within
+    step / 2 plus half a float32 ulp of the largest |value| of the input.
+    """
+    array = np.asarray(array, dtype="float32")
+    finite = np.isfinite(array)
+    if not finite.any():
+        return np.full(array.shape, QUANT_NODATA, dtype="int16"), 0.0, 0.0
+    vmin, vmax = float(array[finite].min()), float(array[finite].max())
+    offset = round((vmin + vmax) / 2.0 / step) * step
+    if max(vmax - offset, offset - vmin) / step > QUANT_MAX_CODE:
+        need = max(vmax - offset, offset - vmin) / QUANT_MAX_CODE
+        raise ValueError(f"Range [{vmin:.6g}, {vmax:.6g}] does not fit int16 at step {step:g}; "
+                         f"use a step of at least {need:.3g}")
+    with np.errstate(invalid="ignore"):
+        codes = np.rint((array - offset) / step)
+    codes = np.where(finite, codes, QUANT_NODATA).astype("int16")
+    max_error = step / 2.0 + max(abs(vmin), abs(vmax)) * 2.0 ** -24
+    return codes, offset, max_error
+
+
+def dequantize(codes, scale, offset, nodata=QUANT_NODATA):
+    """Decode scaled integer codes to float32 (nodata -> NaN)."""
+    arr = (codes * float(scale) + float(offset)).astype("float32")
+    if nodata is not None:
+        arr[codes == nodata] = np.nan
+    return arr
+
+
+def save_geotiff(path, array, geotransform, projection, nodata=None, quantize_step=None):
+    """Save a 2D array as a float32 GeoTIFF.
+
+    With ``quantize_step`` the band is stored as deflate-compressed int16
+    codes with GDAL scale/offset (nodata code -32768) instead; readers
+    going through raster_io (and GDAL tools honouring scale/offset) get
+    float32 back, within QUANTIZATION_MAX_ERROR (~ step / 2) of the input,
+    which is returned.
+    """
+    from osgeo import gdal
+
+    driver = gdal.GetDriverByName("GTiff")
+    ny, nx = array.shape
+    if quantize_step:
+        codes, offset, max_error = quantize(array, quantize_step)
+        ds = driver.Create(path, nx, ny, 1, gdal.GDT_Int16,
+                           options=["COMPRESS=DEFLATE", "PREDICTOR=2", "TILED=YES"])
+    else:
+        ds = driver.Create(path, nx, ny, 1, gdal.GDT_Float32)
+    if geotransform is not None:
+        ds.SetGeoTransform(geotransform)
+    if projection:
+        ds.SetProjection(projection)
+    band = ds.GetRasterBand(1)
+    if quantize_step:
+        band.SetScale(float(quantize_step))
+        band.SetOffset(float(offset))
+        band.SetNoDataValue(QUANT_NODATA)
+        band.SetMetadata({"QUANTIZATION_STEP": repr(float(quantize_step)),
+                          "QUANTIZATION_MAX_ERROR": repr(max_error)})
+        band.WriteArray(codes)
+    else:
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        band.WriteArray(np.asarray(array, dtype="float32"))
+        max_error = 0.0
+    band.FlushCache()
+    ds = None
+    return max_error
+
+
+def write_isce_headers(data_path, width, length, nbands=1, geotransform=None, dtype="float32"):
+    """Write ISCE .xml and raw GDAL .vrt headers for a little-endian BIL file."""
+    dtype = np.dtype(dtype)
+    isce_type = {np.dtype(v).name: k for k, v in ISCE_DTYPES.items()}[dtype.name]
+    gdal_type = {np.dtype(v).name: k for k, v in GDAL_DTYPES.items()}[dtype.name]
+    name = os.path.basename(data_path)
+    item = dtype.itemsize
+
+    coords = ""
+    if geotransform is not None:
+        x0, dx, _, y0, _, dy = geotransform
+        for comp, start, delta, size in (("coordinate1", x0, dx, width),
+                                         ("coordinate2", y0, dy, length)):
+            coords += (f'    <component name="{comp}">\n'
+                       f'        <property name="startingvalue"><value>{start!r}</value></property>\n'
+                       f'        <property name="delta"><value>{delta!r}</value></property>\n'
+                       f'        <property name="size"><value>{size}</value></property>\n'
+                       f"    </component>\n")
+    props = [("width", width), ("length", length), ("number_bands", nbands),
+             ("data_type", isce_type), ("scheme", "BIL"), ("byte_order", "l"),
+             ("file_name", name), ("access_mode", "read")]
+    with open(data_path + ".xml", "w") as f:
+        f.write("<imageFile>\n")
+        for key, value in props:
+            f.write(f'    <property name="{key}"><value>{value}</value></property>\n')
+        f.write(coords + "</imageFile>\n")
+
+    with open(data_path + ".vrt", "w") as f:
+        f.write(f'<VRTDataset rasterXSize="{width}" rasterYSize="{length}">\n')
+        if geotransform is not None:
+            f.write("    <SRS>EPSG:4326</SRS>\n" if abs(geotransform[0]) <= 360.0 else "")
+            f.write(f"    <GeoTransform>{', '.join(repr(float(v)) for v in geotransform)}"
+                    f"</GeoTransform>\n")
+        for b in range(nbands):
+            f.write(f'    <VRTRasterBand dataType="{gdal_type}" band="{b + 1}" '
+                    f'subClass="VRTRawRasterBand">\n'
+                    f'        <SourceFilename relativeToVRT="1">{name}</SourceFilename>\n'
+                    f"        <ByteOrder>LSB</ByteOrder>\n"
+                    f"        <ImageOffset>{b * width * item}</ImageOffset>\n"
+                    f"        <PixelOffset>{item}</PixelOffset>\n"
+                    f"        <LineOffset>{nbands * width * item}</LineOffset>\n"
+                    f"    </VRTRasterBand>\n")
+        f.write("</VRTDataset>\n")
+
+
+def resolve_path(isce_dir, path):
+    """Resolve a path relative to the ISCE project directory (``--isce-dir``)."""
+    if path is None or os.path.isabs(path):
+        return path
+    return os.path.join(os.path.abspath(isce_dir), path)
@@ -11,36 +11,11 @@
 
 import os
 import argparse
-from osgeo import gdal
 import numpy as np
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open {path}")
-    arr = ds.ReadAsArray()
-    gt = ds.GetGeoTransform()
-    proj = ds.GetProjection()
-    ds = None
-    # اگر چندباندی بود، باند اول
-    if arr.ndim == 3:
-        arr = arr[0]
-    return arr.astype("float32"), gt, proj
-
-
-def save_geotiff(path, array, geotransform, projection, nodata=None):
-    driver = gdal.GetDriverByName("GTiff")
-    ny, nx = array.shape
-    ds = driver.Create(path, nx, ny, 1, gdal.GDT_Float32)
-    ds.SetGeoTransform(geotransform)
-    ds.SetProjection(projection)
-    band = ds.GetRasterBand(1)
-    if nodata is not None:
-        band.SetNoDataValue(nodata)
-    band.WriteArray(array.astype("float32"))
-    band.FlushCache()
-    ds = None
+from blockwise import Stats, map_row_blocks
+from raster_io import save_geotiff
+from step_cache import StepCache, add_cache_args, read_input
 
 
 def build_design_matrix(x, y, degree=2):
@@ -88,6 +63,18 @@ def parse_args():
         default=None,
         help="مسیر coherence (پیش‌فرض: merged/topophase.cor.geo.vrt).",
     )
+    p.add_argument(
+        "--unw-band",
+        type=int,
+        default=1,
+        help="شماره باند فاز در فایل unw (پیش‌فرض ۱؛ در فایل دوباندی ISCE فاز باند ۲ است).",
+    )
+    p.add_argument(
+        "--coh-band",
+        type=int,
+        default=1,
+        help="شماره باند coherence (پیش‌فرض ۱).",
+    )
     p.add_argument(
         "--coh-scale",
         type=float,
@@ -106,11 +93,23 @@ def parse_args():
         default=2,
         help="درجه چندجمله‌ای ramp (۱ یا ۲). پیش‌فرض: ۲.",
     )
+    p.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="تعداد threadها برای پردازش بلوک‌های سطری (پیش‌فرض: همه هسته‌های در دسترس).",
+    )
     p.add_argument(
         "--out-unw",
         default="filt_topophase.unw_rampcorr.geo.tif",
         help="نام فایل خروجی فاز اصلاح‌شده (در صورت نسبی بودن در merged ذخیره می‌شود).",
     )
+    add_cache_args(
+        p,
+        help_dir="فولدر cache مراحل (step_cache.py)؛ پیش‌فرض متغیر محیطی "
+                 "POSTPROCESS_CACHE_DIR، و بدون آن cache خاموش است.",
+        help_mb="سقف حجم cache بر حسب MB (حذف LRU).",
+    )
     return p.parse_args()
 
 
@@ -141,67 +140,128 @@ def main():
     print("Output corrected unw:", out_unw)
 
     # ---------- خواندن داده ----------
-    unw, gt, proj = read_gdal_array(unw_path)
-    coh_raw, _, _ = read_gdal_array(coh_path)
-    coh = coh_raw / float(args.coh_scale)
+    # باند انتخابی، به صورت memmap فقط‌خواندنی (بدون کپی) در صورت امکان
+    cache = StepCache.from_args(args)
+    unw, gt, proj = read_input(cache, unw_path, band=args.unw_band)
+    coh, _, _ = read_input(cache, coh_path, band=args.coh_band)
 
     ny, nx = unw.shape
     print("اندازه تصویر:", (ny, nx))
+    if coh.shape != unw.shape:
+        raise RuntimeError(f"ابعاد coherence {coh.shape} با فاز {unw.shape} یکسان نیست.")
+    # آستانه روی مقدار خام coherence (بدون ساخت آرایه coh / scale)
+    coh_min = args.coh_threshold * float(args.coh_scale)
 
-    # ماسک پیکسل‌های معتبر: فعلاً همه پیکسل‌های فاز که finite هستند
-    mask_valid = np.isfinite(unw)
-    n_valid = int(mask_valid.sum())
-    print("تعداد پیکسل‌های معتبر برای فیت ramp:", n_valid)
-    if n_valid < 1000:
-        raise RuntimeError("پیکسل معتبر برای فیت ramp خیلی کم است.")
-
-
-    # مختصات x,y نرمال‌شده برای پیکسل‌های معتبر
-    yy, xx = np.indices(unw.shape)
-    # نرمال‌سازی به بازه [-1, 1] برای پایداری عددی
-    x_norm = (xx - xx.mean()) / max(1.0, xx.std())
-    y_norm = (yy - yy.mean()) / max(1.0, yy.std())
-
-    xv = x_norm[mask_valid].ravel()
-    yv = y_norm[mask_valid].ravel()
-    zv = unw[mask_valid].ravel()
-
-    # ---------- ساخت ماتریس طراحی و فیت least squares ----------
-    print("در حال فیت کردن ramp درجه", args.degree)
-    G = build_design_matrix(xv, yv, degree=args.degree)
-    # حل کمترین مربعات
-    m, residuals, rank, s = np.linalg.lstsq(G, zv, rcond=None)
-    print("پارامترهای ramp:", m)
-    if residuals.size > 0:
-        print("مجموع مربعات باقیمانده:", float(residuals[0]))
+    # مختصات x,y نرمال‌شده (میانگین و انحراف معیار اندیس‌ها به صورت تحلیلی،
+    # بدون ساخت آرایه‌های کامل np.indices)
+    def norm(n):
+        return (n - 1) / 2.0, max(1.0, np.sqrt((n * n - 1) / 12.0))
+
+    (x_mean, x_std), (y_mean, y_std) = norm(nx), norm(ny)
+    x_norm = (np.arange(nx) - x_mean) / x_std
+
+    def block_coords(y0, y1):
+        y_norm = (np.arange(y0, y1) - y_mean) / y_std
+        return np.broadcast_to(x_norm, (y1 - y0, nx)), np.broadcast_to(y_norm[:, None], (y1 - y0, nx))
+
+    # ---------- معادلات نرمال به صورت بلوکی (thread pool) ----------
+    # ماسک پیکسل‌های معتبر: فاز finite و coherence >= --coh-threshold
+    # (use_coh=False: فقط فاز finite).
+    # G^T G، G^T z و z^T z هر بلوک جداگانه حساب و به ترتیب بلوک جمع می‌شوند.
+    use_coh = True
+
+    def normal_equations(y0, y1):
+        u = unw[y0:y1]
+        valid = np.isfinite(u)
+        if use_coh:
+            valid &= coh[y0:y1] >= coh_min
+        xb, yb = block_coords(y0, y1)
+        G = build_design_matrix(xb[valid], yb[valid], degree=args.degree)
+        z = u[valid].astype("float64")
+        return int(valid.sum()), G.T @ G, G.T @ z, float(z @ z), Stats.of(u)
+
+    def correct(y0, y1):
+        xb, yb = block_coords(y0, y1)
+        G = build_design_matrix(xb.ravel(), yb.ravel(), degree=args.degree)
+        ramp = (G @ m).reshape(y1 - y0, nx)
+        unw_corr[y0:y1] = unw[y0:y1] - ramp
+        return Stats.of(ramp), Stats.of(unw_corr[y0:y1])
 
-    # ---------- بازسازی ramp روی کل تصویر ----------
-    G_full = build_design_matrix(x_norm.ravel(), y_norm.ravel(), degree=args.degree)
-    ramp_full = (G_full @ m).reshape(unw.shape)
+    def as_list(st):
+        return [st.count, st.total, st.vmin, st.vmax]
 
-    # ---------- کم کردن ramp ----------
-    unw_corr = unw - ramp_full
+    def compute():
+        nonlocal m, use_coh
+        parts = map_row_blocks(normal_equations, ny, nx, threads=args.threads)
+        n_valid = sum(p[0] for p in parts)
+        print("تعداد پیکسل‌های معتبر برای فیت ramp:", n_valid)
+        if n_valid < 1000:
+            # fallback مثل postprocess_ifg: وقتی پیکسل کافی از آستانه coherence
+            # عبور نکند (مثلاً --coh-scale اشتباه) فیت روی همه پیکسل‌های finite
+            print("هشدار: پیکسل کافی از آستانه coherence عبور نکرد؛ "
+                  "فیت روی همه پیکسل‌های finite فاز (--coh-scale را بررسی کنید).")
+            use_coh = False
+            parts = map_row_blocks(normal_equations, ny, nx, threads=args.threads)
+            n_valid = sum(p[0] for p in parts)
+            print("تعداد پیکسل‌های finite برای فیت ramp:", n_valid)
+        if n_valid < 1000:
+            raise RuntimeError("پیکسل معتبر برای فیت ramp خیلی کم است.")
+        GtG = sum(p[1] for p in parts)
+        Gtz = sum(p[2] for p in parts)
+        ztz = sum(p[3] for p in parts)
+        unw_stats = Stats.merge(p[4] for p in parts)
+
+        # ---------- فیت least squares ----------
+        print("در حال فیت کردن ramp درجه", args.degree)
+        m = np.linalg.solve(GtG, Gtz)
+
+        # ---------- بازسازی ramp و کم کردن آن (بلوکی) ----------
+        parts = map_row_blocks(correct, ny, nx, threads=args.threads)
+        ramp_stats = Stats.merge(p[0] for p in parts)
+        corr_stats = Stats.merge(p[1] for p in parts)
+        return unw_corr, {
+            "m": m.tolist(), "ssr": float(ztz - m @ Gtz),
+            "stats": [as_list(unw_stats), as_list(ramp_stats), as_list(corr_stats)],
+            "geotransform": gt, "projection": proj,
+        }
+
+    # با --cache-dir نتیجه با کلید (شناسه فایل‌های فاز و coherence، درجه،
+    # تنظیمات coherence، کد اسکریپت) ذخیره می‌شود.
+    m = None
+    unw_corr = np.empty((ny, nx), dtype="float32")
+    if cache is None:
+        unw_corr, meta = compute()
+    else:
+        params = {"unw_band": args.unw_band, "degree": args.degree, "coh_band": args.coh_band,
+                  "coh_scale": args.coh_scale, "coh_threshold": args.coh_threshold}
+        unw_corr, meta, hit = cache.cached("remove_ramp", [__file__, unw_path, coh_path],
+                                           params, compute)
+        print("cache:", "استفاده از نتیجه ذخیره‌شده" if hit else "محاسبه و ذخیره", meta["key"][:12])
+    m = np.asarray(meta["m"])
+    print("پارامترهای ramp:", m)
+    print("مجموع مربعات باقیمانده:", meta["ssr"])
+    unw_stats, ramp_stats, corr_stats = (Stats(*v) for v in meta["stats"])
 
     # ---------- آمار قبل و بعد ----------
-    def stats(a, name):
-        finite = np.isfinite(a)
-        print(
-            f"{name}: min/mean/max =",
-            float(a[finite].min()),
-            float(a[finite].mean()),
-            float(a[finite].max()),
-        )
+    def stats(st, name):
+        print(f"{name}: min/mean/max =", st.vmin, st.mean, st.vmax)
 
     print("\n== آمار قبل از حذف ramp ==")
-    stats(unw, "unw (rad)")
+    stats(unw_stats, "unw (rad)")
     print("\n== آمار ramp فیت شده ==")
-    stats(ramp_full, "ramp (rad)")
+    stats(ramp_stats, "ramp (rad)")
     print("\n== آمار بعد از حذف ramp ==")
-    stats(unw_corr, "unw_corr (rad)")
+    stats(corr_stats, "unw_corr (rad)")
 
     # ---------- ذخیره فاز اصلاح‌شده ----------
     print("\nذخیره فاز اصلاح‌شده در:", out_unw)
-    save_geotiff(out_unw, unw_corr, gt, proj, nodata=np.nan)
+    def write():
+        save_geotiff(out_unw, unw_corr, gt, proj, nodata=np.nan)
+
+    if cache is None:
+        write()
+    elif not cache.write_output(out_unw, meta, write):
+        print("(فایل خروجی از همین نتیجه cache نوشته شده و تغییری نکرده است)")
     print("تمام شد.")
 
 
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+rereference.py
+
+Move the spatial reference of finished products without rerunning MintPy
+from reference_point onwards: the reference value is computed from one
+windowed read of the reference area and subtracted in place, strip by
+strip, from
+
+- LOS / vertical GeoTIFFs (any GDAL raster opened for update); for the
+  quantised int16 products (save_geotiff(..., quantize_step=...)) only the
+  GDAL offset changes, the pixels are not rewritten
+- timeseries.h5 (every date, reference value per date) and velocity.h5
+
+The reference is a pixel (--ref-yx), a lat/lon point (--ref-lalo), a pixel
+window (--ref-roi x1,x2,y1,y2) or a polygon (--ref-polygon, "lon lat" pairs
+or a GeoJSON file).  --ref-radius grows a point to a (2r+1)^2 window.  The
+value is the median of the valid pixels of the area (--ref-stat mean /
+trimmed for a plain or a 3-sigma-MAD trimmed mean).
+
+Each file records the reference: REF_Y/REF_X (area centre) and
+REF_LAT/REF_LON as in MintPy, plus REF_AREA, REF_STAT and the value just
+subtracted (REF_VALUE); GeoTIFFs keep it in the band metadata.  Use
+--out-suffix to write re-referenced copies instead.
+
+Example:
+
+python scripts/py/rereference.py --isce-dir . --ref-lalo 35.71,51.39 --ref-radius 5 \
+    --products merged/los_displacement_mm.tif merged/vertical_displacement_mm.tif \
+    --h5 mintpy/timeseries.h5 mintpy/velocity.h5
+"""
+
+import os
+import json
+import shutil
+import warnings
+import argparse
+
+import numpy as np
+
+from raster_io import attrs_geotransform, resolve_path
+
+
+STATS = ("median", "mean", "trimmed")
+
+
+# --------------------- reference area ------------------------
+
+def read_polygon(text):
+    """[(lon, lat), ...] from 'lon lat, lon lat, ...' or a GeoJSON file."""
+    if os.path.exists(text):
+        with open(text) as f:
+            geo = json.load(f)
+        if geo.get("type") == "FeatureCollection":
+            geo = geo["features"][0]
+        geom = geo.get("geometry", geo)
+        ring = geom["coordinates"][0]
+        if geom["type"] == "MultiPolygon":
+            ring = ring[0]
+        return [(float(x), float(y)) for x, y in ring]
+    return [tuple(float(v) for v in pair.split()) for pair in text.split(",")]
+
+
+def geo_to_pixel(gt, lon, lat):
+    x0, dx, _, y0, _, dy = gt
+    return int(np.floor((lat - y0) / dy)), int(np.floor((lon - x0) / dx))
+
+
+def pixel_to_geo(gt, y, x):
+    x0, dx, _, y0, _, dy = gt
+    return y0 + (y + 0.5) * dy, x0 + (x + 0.5) * dx
+
+
+class RefArea:
+    """Reference area on a grid: bounding window, optional mask, centre."""
+
+    def __init__(self, args):
+        self.args = args
+
+    def locate(self, gt, shape):
+        """(y0, y1, x0, x1, mask or None, (yc, xc), description) on this grid."""
+        a = self.args
+        ny, nx = shape
+        mask = None
+        if a.ref_polygon:
+            if gt is None:
+                raise ValueError("--ref-polygon needs a georeferenced file.")
+            from matplotlib.path import Path
+
+            poly = read_polygon(a.ref_polygon)
+            rows_cols = [geo_to_pixel(gt, lon, lat) for lon, lat in poly]
+            ys, xs = zip(*rows_cols)
+            y0, y1 = max(0, min(ys)), min(ny, max(ys) + 1)
+            x0, x1 = max(0, min(xs)), min(nx, max(xs) + 1)
+            # pixel centres inside the polygon, in (lon, lat)
+            yy, xx = np.mgrid[y0:y1, x0:x1]
+            lat, lon = pixel_to_geo(gt, yy, xx)
+            inside = Path(poly).contains_points(np.column_stack([lon.ravel(), lat.ravel()]))
+            mask = inside.reshape(yy.shape)
+            if not mask.any():
+                raise ValueError("The reference polygon contains no pixel centre of the grid.")
+            cy, cx = np.argwhere(mask).mean(axis=0)
+            centre = (y0 + int(round(cy)), x0 + int(round(cx)))
+            desc = f"polygon {a.ref_polygon}"
+        elif a.ref_roi:
+            x0, x1, y0, y1 = (int(v) for v in a.ref_roi.split(","))
+            centre = ((y0 + y1) // 2, (x0 + x1) // 2)
+            desc = f"roi x={x0}:{x1} y={y0}:{y1}"
+        else:
+            if a.ref_lalo:
+                if gt is None:
+                    raise ValueError("--ref-lalo needs a georeferenced file.")
+                lat, lon = (float(v) for v in a.ref_lalo.split(","))
+                centre = geo_to_pixel(gt, lon, lat)
+                desc = f"lalo {lat},{lon}"
+            elif a.ref_yx:
+                centre = tuple(int(v) for v in a.ref_yx.split(","))
+                desc = f"yx {centre[0]},{centre[1]}"
+            else:
+                raise ValueError("Give one of --ref-yx, --ref-lalo, --ref-roi, --ref-polygon.")
+            r = a.ref_radius
+            y0, y1 = centre[0] - r, centre[0] + r + 1
+            x0, x1 = centre[1] - r, centre[1] + r + 1
+            if r:
+                desc += f" radius {r}"
+        y0, y1, x0, x1 = max(0, y0), min(ny, y1), max(0, x0), min(nx, x1)
+        if y1 <= y0 or x1 <= x0:
+            raise ValueError(f"Reference area ({desc}) is outside the {ny} x {nx} grid.")
+        return y0, y1, x0, x1, mask, centre, desc
+
+
+def reference_value(window, mask=None, stat="median"):
+    """Robust value of the area; window is (..., h, w), one value per leading index."""
+    vals = window.reshape(window.shape[:-2] + (-1,)).astype("float64")
+    if mask is not None:
+        vals = vals[..., mask.ravel()]
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN area
+        if stat == "mean":
+            ref = np.nanmean(vals, axis=-1)
+        else:
+            ref = np.nanmedian(vals, axis=-1)
+            if stat == "trimmed":
+                mad = 1.4826 * np.nanmedian(np.abs(vals - ref[..., None]), axis=-1)
+                keep = np.abs(vals - ref[..., None]) <= 3.0 * np.maximum(mad, 1e-12)[..., None]
+                ref = np.nanmean(np.where(keep, vals, np.nan), axis=-1)
+    if not np.all(np.isfinite(ref)):
+        raise RuntimeError("Reference area has no valid pixel (in at least one layer / date).")
+    return ref
+
+
+# --------------------- GeoTIFF / GDAL rasters ------------------------
+
+def rereference_raster(path, area, stat, strip_rows=512):
+    from osgeo import gdal
+
+    ds = gdal.Open(path, gdal.GA_Update)
+    if ds is None:
+        raise RuntimeError(f"Cannot open {path} for update")
+    band = ds.GetRasterBand(1)
+    gt = ds.GetGeoTransform()
+    ny, nx = ds.RasterYSize, ds.RasterXSize
+    y0, y1, x0, x1, mask, centre, desc = area.locate(gt, (ny, nx))
+
+    scale, offset = band.GetScale() or 1.0, band.GetOffset() or 0.0
+    nodata = band.GetNoDataValue()
+    quantized = band.DataType in (gdal.GDT_Int16, gdal.GDT_UInt16) and (scale, offset) != (1.0, 0.0)
+
+    win = band.ReadAsArray(x0, y0, x1 - x0, y1 - y0).astype("float64")
+    if nodata is not None:
+        win[win == nodata] = np.nan
+    win = win * scale + offset
+    ref = float(reference_value(win, mask, stat))
+
+    if quantized:
+        # value = code * scale + offset: moving the offset re-references exactly
+        band.SetOffset(offset - ref)
+    else:
+        for r0 in range(0, ny, strip_rows):
+            rows = min(strip_rows, ny - r0)
+            a = band.ReadAsArray(0, r0, nx, rows)
+            if nodata is not None and np.isfinite(nodata):
+                a = np.where(a == nodata, a, a - ref).astype(a.dtype)
+            else:
+                a = (a - ref).astype(a.dtype)
+            band.WriteArray(a, 0, r0)
+
+    lat, lon = pixel_to_geo(gt, *centre)
+    meta = band.GetMetadata()
+    total = float(meta.get("REF_TOTAL_SUBTRACTED", 0.0)) + ref
+    meta.update({"REF_Y": str(centre[0]), "REF_X": str(centre[1]),
+                 "REF_LAT": repr(lat), "REF_LON": repr(lon), "REF_AREA": desc,
+                 "REF_STAT": stat, "REF_VALUE": repr(ref), "REF_TOTAL_SUBTRACTED": repr(total)})
+    band.SetMetadata(meta)
+    band.FlushCache()
+    ds = None
+    return ref, desc
+
+
+# --------------------- HDF5 (timeseries / velocity) ------------------------
+
+def rereference_h5(path, area, stat, mem_mb=512):
+    import h5py
+
+    with h5py.File(path, "r+") as f:
+        name = "timeseries" if "timeseries" in f else "velocity"
+        ds = f[name]
+        gt = attrs_geotransform(f.attrs)
+        y0, y1, x0, x1, mask, centre, desc = area.locate(gt, ds.shape[-2:])
+
+        # one windowed read for all dates
+        win = ds[..., y0:y1, x0:x1]
+        ref = np.atleast_1d(reference_value(win, mask, stat))
+
+        # strips aligned to the HDF5 chunks, all dates at once
+        ny, nx = ds.shape[-2:]
+        n_layer = ds.shape[0] if ds.ndim == 3 else 1
+        rows = max(1, int(mem_mb * 1024 ** 2 // (n_layer * nx * 4 * 2)))
+        if ds.chunks:
+            rows = max(ds.chunks[-2], rows // ds.chunks[-2] * ds.chunks[-2])
+        for r0 in range(0, ny, rows):
+            r1 = min(ny, r0 + rows)
+            if ds.ndim == 3:
+                ds[:, r0:r1, :] = ds[:, r0:r1, :] - ref[:, None, None].astype(ds.dtype)
+            else:
+                ds[r0:r1, :] = ds[r0:r1, :] - ref[0].astype(ds.dtype)
+
+        f.attrs["REF_Y"], f.attrs["REF_X"] = centre
+        if gt is not None:
+            f.attrs["REF_LAT"], f.attrs["REF_LON"] = pixel_to_geo(gt, *centre)
+        f.attrs["REF_AREA"] = desc
+        f.attrs["REF_STAT"] = stat
+        f.attrs["REF_VALUE"] = ref if ds.ndim == 3 else float(ref[0])
+    return ref, desc
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Re-reference products and timeseries.h5 to a new point or area in place."
+    )
+    p.add_argument("--isce-dir", default=".", help="Base for relative paths.")
+    p.add_argument("--products", nargs="*", default=[], help="GeoTIFFs (LOS / vertical, ...).")
+    p.add_argument("--h5", nargs="*", default=[], help="timeseries.h5 / velocity.h5 files.")
+    ref = p.add_argument_group("reference")
+    ref.add_argument("--ref-yx", default=None, help="Reference pixel y,x.")
+    ref.add_argument("--ref-lalo", default=None, help="Reference point lat,lon.")
+    ref.add_argument("--ref-roi", default=None, help="Reference window x1,x2,y1,y2 (pixels).")
+    ref.add_argument("--ref-polygon", default=None,
+                     help="'lon lat, lon lat, ...' or a GeoJSON polygon file.")
+    ref.add_argument("--ref-radius", type=int, default=0,
+                     help="Use a (2r+1)^2 window around --ref-yx / --ref-lalo.")
+    ref.add_argument("--ref-stat", choices=STATS, default="median",
+                     help="Reference value of the area (default median).")
+    p.add_argument("--out-suffix", default=None,
+                   help="Write copies named <name><suffix><ext> instead of updating in place.")
+    p.add_argument("--mem-mb", type=float, default=512, help="Working memory per strip (MB).")
+    return p.parse_args()
+
+
+def target(path, suffix):
+    if not suffix:
+        return path
+    root, ext = os.path.splitext(path)
+    out = root + suffix + ext
+    shutil.copyfile(path, out)
+    return out
+
+
+def main():
+    args = parse_args()
+    isce_dir = os.path.abspath(args.isce_dir)
+    area = RefArea(args)
+    if not args.products and not args.h5:
+        raise SystemExit("Nothing to do: give --products and/or --h5.")
+
+    for path in args.products:
+        path = target(resolve_path(isce_dir, path), args.out_suffix)
+        ref, desc = rereference_raster(path, area, args.ref_stat)
+        print(f"{path}: subtracted {ref:.4f} ({args.ref_stat} of {desc})")
+
+    for path in args.h5:
+        path = target(resolve_path(isce_dir, path), args.out_suffix)
+        ref, desc = rereference_h5(path, area, args.ref_stat, args.mem_mb)
+        if ref.size > 1:
+            print(f"{path}: subtracted per date {ref.min():.4f} .. {ref.max():.4f} "
+                  f"({args.ref_stat} of {desc}, {ref.size} dates)")
+        else:
+            print(f"{path}: subtracted {ref[0]:.4f} ({args.ref_stat} of {desc})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+roi_uncertainty.py
+
+Uncertainty of ROI / zonal statistics, used by analyze_vertical_roi.py.
+
+- bootstrap_ci: bootstrap confidence intervals of the mean and percentiles
+  of a set of pixel values.  Replicates are drawn as index matrices
+  (replicates x samples) in chunks sized by mem_mb and reduced with
+  vectorised bincount / cumsum / searchsorted over values sorted once, so
+  thousands of replicates over large ROIs or zones need no Python loop over
+  replicates and no per-replicate sort.
+  With block > 1 whole block x block tiles are resampled instead of pixels
+  (spatially correlated noise makes the pixel bootstrap too optimistic).
+
+- propagate_std: velocityStd (LOS) -> vertical, sigma_v = sigma_los / cos(inc),
+  with the same incidence validity as los_to_vertical.py, and the standard
+  error of the ROI mean for independent (sqrt(sum sigma^2) / n) and fully
+  correlated (mean sigma) pixel errors.
+
+Example (via analyze_vertical_roi.py):
+
+python scripts/py/analyze_vertical_roi.py --isce-dir . \
+    --vert-path merged/vertical_displacement_mm.tif --roi 100,400,200,500 \
+    --bootstrap 2000 --block 8 \
+    --std-path mintpy/velocity.h5:velocityStd --std-scale 1000 \
+    --inc-path mintpy_inputs/geometry/incidenceAngle.geo
+"""
+
+import numpy as np
+
+
+DEFAULT_PERCENTILES = (5.0, 50.0, 95.0)
+
+
+def tiles(roi, block):
+    """Tile id of every pixel of a 2D ROI (block x block tiles), raveled."""
+    ny, nx = roi.shape
+    tx = -(-nx // block)
+    rows = np.arange(ny) // block
+    cols = np.arange(nx) // block
+    return (rows[:, None] * tx + cols[None, :]).ravel()
+
+
+def _order_stats(cw, ranks):
+    """Indices (into the sorted values) of order statistics of every replicate.
+
+    ``cw`` is the (b, m) cumulative resample count of the sorted values and
+    ``ranks`` a (r, b) array of zero-based ranks.  All r x b positions are
+    bisected together (searchsorted side="right" per row, log2(m) steps that
+    each gather r x b counts).  Returns (r, b) indices clipped to m - 1.
+    """
+    b, m = cw.shape
+    cols = np.arange(b)[None, :]
+    lo = np.zeros(ranks.shape, dtype=np.int64)
+    hi = np.full(ranks.shape, m, dtype=np.int64)
+    for _ in range(int(m).bit_length()):
+        mid = (lo + hi) // 2
+        right = cw[cols, np.minimum(mid, m - 1)] <= ranks
+        open_ = lo < hi
+        lo = np.where(open_ & right, mid + 1, lo)
+        hi = np.where(open_ & ~right, mid, hi)
+    return np.minimum(lo, m - 1)
+
+
+def bootstrap_ci(values, n_boot=1000, percentiles=DEFAULT_PERCENTILES, ci=95.0,
+                 block=1, seed=0, mem_mb=256, groups=None):
+    """Bootstrap distribution summary of mean and percentiles.
+
+    ``values`` is a 2D ROI (block > 1 resamples tiles) or any array of pixel
+    values (NaNs dropped); ``groups`` (unit id per value, e.g. image tiles of
+    the pixels of a zone) resamples whole units instead.  Returns
+    {name: (estimate, std error, ci_low, ci_high)} with names 'mean' and 'p<q>'.
+
+    The values are sorted once.  A chunk of replicates is drawn as one
+    (replicates x units) index matrix and turned into resample counts per
+    unit with a single bincount; means are count-weighted sums and
+    percentiles are read from the cumulative counts over the sorted values
+    (same linear interpolation as np.percentile of the resample), so no
+    replicate is materialised or partitioned.
+    """
+    rng = np.random.default_rng(seed)
+    v = np.asarray(values, dtype="float32")
+    if groups is not None:
+        group = np.asarray(groups).ravel()
+    elif block > 1 and v.ndim == 2:
+        group = tiles(v, block)
+    else:
+        group = None
+    tiled = group is not None
+    v = v.ravel()
+    finite = np.isfinite(v)
+    v = v[finite]
+    if v.size == 0:
+        raise ValueError("No valid pixels to resample.")
+    order = np.argsort(v, kind="stable")
+    v_sorted = v[order].astype("float64")
+    if tiled:
+        # units = tiles / groups holding at least one valid pixel
+        _, group = np.unique(group[finite], return_inverse=True)
+        n = int(group.max()) + 1
+        g_sorted = group[order]
+        unit_sum = np.bincount(group, weights=v, minlength=n)
+        unit_size = np.bincount(group, minlength=n)
+    else:
+        # units = pixels, drawn directly as positions in sorted order
+        n = v.size
+    q = np.asarray(percentiles, dtype="float64") / 100.0
+    names = ["mean"] + [f"p{p:g}" for p in percentiles]
+
+    estimate = np.concatenate([[v.mean(dtype="float64")], np.percentile(v, percentiles)])
+
+    # index matrix + unit counts + cumulative counts of the sorted pixels per replicate
+    per_rep = n * (8 + 8) + v.size * (4 + 4)
+    chunk = int(max(1, min(n_boot, mem_mb * 1024 ** 2 // per_rep)))
+    reps = np.empty((len(names), n_boot), dtype="float64")
+    for r0 in range(0, n_boot, chunk):
+        b = min(chunk, n_boot - r0)
+        idx = rng.integers(0, n, size=(b, n), dtype=np.int64)
+        idx += (np.arange(b, dtype=np.int64) * n)[:, None]
+        counts = np.bincount(idx.ravel(), minlength=b * n).reshape(b, n).astype(np.int32)
+        del idx
+        if tiled:
+            total = counts @ unit_size
+            reps[0, r0:r0 + b] = (counts @ unit_sum) / total
+            counts = counts[:, g_sorted]
+        else:
+            total = np.full(b, n)
+            reps[0, r0:r0 + b] = (counts @ v_sorted) / n
+        cw = np.cumsum(counts, axis=1, dtype=np.int32)
+        del counts
+        pos = q[:, None] * (total - 1)[None, :]
+        low = np.floor(pos).astype(np.int64)
+        frac = pos - low
+        both = _order_stats(cw, np.concatenate([low, low + 1]))
+        a, c = v_sorted[both[:len(q)]], v_sorted[both[len(q):]]
+        reps[1:, r0:r0 + b] = a + frac * (c - a)
+
+    alpha = (100.0 - ci) / 2.0
+    lo, hi = np.percentile(reps, [alpha, 100.0 - alpha], axis=1)
+    se = reps.std(axis=1, ddof=1) if n_boot > 1 else np.full(len(names), np.nan)
+    return {name: (float(estimate[k]), float(se[k]), float(lo[k]), float(hi[k]))
+            for k, name in enumerate(names)}
+
+
+def propagate_std(std_los, inc_deg=None):
+    """Vertical standard deviation from LOS std and incidence (degrees)."""
+    std_los = np.asarray(std_los, dtype="float32")
+    if inc_deg is None:
+        return std_los
+    inc = np.deg2rad(np.asarray(inc_deg, dtype="float32"))
+    valid = np.isfinite(inc) & (inc > 0) & (inc < np.deg2rad(89.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(valid, std_los / np.cos(inc), np.nan).astype("float32")
+
+
+def mean_std_error(sigma):
+    """(independent, fully correlated, n) standard error of the mean of pixels with std sigma."""
+    s = np.asarray(sigma, dtype="float64")
+    s = s[np.isfinite(s)]
+    if not s.size:
+        return float("nan"), float("nan"), 0
+    return float(np.sqrt(np.sum(s * s)) / s.size), float(s.mean()), int(s.size)
+
+
+def zones(labels, nodata=0):
+    """{label: flat pixel indices} of an integer zone raster (label nodata ignored)."""
+    lab = np.asarray(labels).ravel()
+    order = np.argsort(lab, kind="stable")
+    sorted_lab = lab[order]
+    values, starts = np.unique(sorted_lab, return_index=True)
+    ends = np.append(starts[1:], lab.size)
+    return {int(v): order[s:e] for v, s, e in zip(values, starts, ends)
+            if v != nodata and np.isfinite(v)}
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+run_mintpy_steps.py
+
+Run the MintPy smallbaselineApp steps of run_all.sh in a single Python
+process, skipping steps whose inputs and configuration did not change.
+
+Each step gets a fingerprint made of:
+
+- the cfg keys of its own section (e.g. mintpy.network.* for modify_network)
+- the identity (path, size, mtime) of external input files (load_data only)
+- the fingerprint of the previous step in the chain
+
+A step is skipped when its fingerprint matches the one recorded after its
+last successful run and its main outputs still exist.  So a change to
+mintpy.timeFunc.* only redoes `velocity`, while a change to
+mintpy.network.* redoes modify_network and everything after it.
+
+The record is kept in <work-dir>/inputs/mintpy_step_state.json, so
+run_all.sh --reset-mintpy (which removes inputs/) also resets it.
+
+Example (inside the ISCE project directory, like run_all.sh):
+
+python scripts/py/run_mintpy_steps.py configs/smallbaselineApp.cfg
+python scripts/py/run_mintpy_steps.py configs/smallbaselineApp.cfg --steps velocity --force
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from contextlib import nullcontext
+
+from file_utils import file_identity
+from stage_metrics import measure
+
+
+STEP_LIST = [
+    "load_data",
+    "modify_network",
+    "reference_point",
+    "invert_network",
+    "correct_topography",
+    "residual_RMS",
+    "velocity",
+]
+
+# cfg key prefixes that affect each step
+STEP_CONFIG = {
+    "load_data": ["mintpy.load.", "mintpy.subset.", "mintpy.multilook."],
+    "modify_network": ["mintpy.network."],
+    "reference_point": ["mintpy.reference."],
+    "invert_network": ["mintpy.networkInversion."],
+    "correct_topography": ["mintpy.topographicResidual."],
+    "residual_RMS": ["mintpy.residualRMS."],
+    "velocity": ["mintpy.timeFunc.", "mintpy.velocity."],
+}
+
+# outputs (relative to the work dir) that must exist for a step to be skipped
+STEP_OUTPUTS = {
+    "load_data": ["inputs/ifgramStack.h5"],
+    "invert_network": ["timeseries.h5", "temporalCoherence.h5"],
+    "correct_topography": ["demErr.h5"],
+    "velocity": ["velocity.h5"],
+}
+
+# inputs whose size is recorded with --metrics-dir (load_data: cfg patterns)
+STEP_INPUTS = {
+    "modify_network": ["inputs/ifgramStack.h5"],
+    "reference_point": ["inputs/ifgramStack.h5"],
+    "invert_network": ["inputs/ifgramStack.h5"],
+    "correct_topography": ["timeseries.h5", "inputs/geometry*.h5"],
+    "residual_RMS": ["timeseriesResidual.h5"],
+    "velocity": ["timeseries*.h5"],
+}
+
+STATE_FILE = os.path.join("inputs", "mintpy_step_state.json")
+
+
+# --------------------- fingerprints ------------------------
+
+def read_cfg(path):
+    """key -> value of a MintPy cfg file (comments stripped, last one wins)."""
+    cfg = {}
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if "=" not in line:
+                continue
+            key, value = (s.strip() for s in line.split("=", 1))
+            cfg[key] = value
+    return cfg
+
+
+def load_data_inputs(cfg, work_dir):
+    """Identities of every external file referenced by mintpy.load.*."""
+    files = []
+    for key, value in sorted(cfg.items()):
+        if not key.startswith("mintpy.load.") or value in ("", "auto", "no", "none"):
+            continue
+        if not (key.endswith("File") or key.endswith("Dir")):
+            continue
+        pattern = value if os.path.isabs(value) else os.path.join(work_dir, value)
+        for path in sorted(glob.glob(pattern)):
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, n) for n in sorted(names))
+            else:
+                files.append(path)
+                # ISCE metadata next to the binary
+                for ext in (".xml", ".vrt"):
+                    if os.path.exists(path + ext):
+                        files.append(path + ext)
+    return [file_identity(p) for p in files]
+
+
+def step_fingerprint(step, cfg, work_dir, upstream):
+    section = {k: v for k, v in sorted(cfg.items())
+               if any(k.startswith(p) for p in STEP_CONFIG[step])}
+    payload = {"step": step, "config": section, "upstream": upstream}
+    if step == "load_data":
+        payload["inputs"] = load_data_inputs(cfg, work_dir)
+    blob = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def outputs_present(step, work_dir):
+    return all(os.path.exists(os.path.join(work_dir, p))
+               for p in STEP_OUTPUTS.get(step, []))
+
+
+def load_state(work_dir):
+    path = os.path.join(work_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(work_dir, state):
+    path = os.path.join(work_dir, STATE_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Run MintPy smallbaselineApp steps in one process with per-step caching."
+    )
+    p.add_argument("cfg", help="MintPy smallbaselineApp cfg file.")
+    p.add_argument("--work-dir", default=".",
+                   help="MintPy working directory (default: current dir, as in run_all.sh).")
+    p.add_argument("--steps", default=",".join(STEP_LIST),
+                   help="Comma-separated steps to consider (default: all, in order).")
+    p.add_argument("--force", action="store_true",
+                   help="Run the selected steps even if they are up to date.")
+    p.add_argument("--dry-run", action="store_true",
+                   help="Only report which steps would run.")
+    p.add_argument("--metrics-dir", default=None,
+                   help="Append per-step resource records (stage_metrics.py) to this folder.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    cfg_path = os.path.abspath(args.cfg)
+    steps = [s.strip() for s in args.steps.split(",") if s.strip()]
+    unknown = [s for s in steps if s not in STEP_LIST]
+    if unknown:
+        raise ValueError(f"Unknown step(s): {unknown}. Valid: {STEP_LIST}")
+    steps = [s for s in STEP_LIST if s in steps]
+
+    print("WORK DIR:", work_dir)
+    print("MintPy CFG:", cfg_path)
+
+    cfg = read_cfg(cfg_path)
+    state = load_state(work_dir)
+
+    app = None
+    timings = []
+    upstream = ""
+    for step in STEP_LIST:
+        fp = step_fingerprint(step, cfg, work_dir, upstream)
+        upstream = fp
+        if step not in steps:
+            # keep the chain consistent with what was recorded last time
+            upstream = state.get(step, {}).get("fingerprint", fp)
+            continue
+
+        rec = state.get(step, {})
+        current = rec.get("fingerprint") == fp and outputs_present(step, work_dir)
+        if current and not args.force:
+            print(f"[SKIP] {step}: up to date")
+            timings.append((step, "skipped", 0.0))
+            continue
+        if args.dry_run:
+            print(f"[RUN ] {step}: would run")
+            timings.append((step, "pending", 0.0))
+            continue
+
+        if app is None:
+            try:
+                from mintpy.smallbaselineApp import TimeSeriesAnalysis
+            except ImportError:
+                print("[ERROR] MintPy not importable. Activate the MintPy conda env first.")
+                sys.exit(1)
+            t0 = time.perf_counter()
+            app = TimeSeriesAnalysis(cfg_path, work_dir)
+            app.open()
+            timings.append(("(open)", "ran", time.perf_counter() - t0))
+
+        print(f"[RUN ] {step}")
+        if args.metrics_dir:
+            if step == "load_data":
+                inputs = [cfg[k] for k in ("mintpy.load.unwFile", "mintpy.load.corFile") if k in cfg]
+            else:
+                inputs = STEP_INPUTS.get(step, [])
+            metrics = measure(f"mintpy.{step}", args.metrics_dir,
+                              inputs=[os.path.join(work_dir, p) for p in inputs])
+        else:
+            metrics = nullcontext()
+        t0 = time.perf_counter()
+        with metrics:
+            app.run(steps=[step])
+        dt = time.perf_counter() - t0
+        timings.append((step, "ran", dt))
+
+        # recorded only after success, so a failed step is retried next time
+        state[step] = {"fingerprint": fp, "seconds": round(dt, 3),
+                       "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        save_state(work_dir, state)
+
+    print("\n== Step timings ==")
+    for step, status, dt in timings:
+        print(f"{step:<20s} {status:<8s} {dt:10.2f} s")
+    print(f"{'total':<20s} {'':<8s} {sum(t[2] for t in timings):10.2f} s")
+
+
+if __name__ == "__main__":
+    main()
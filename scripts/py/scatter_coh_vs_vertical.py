@@ -4,17 +4,8 @@
 import os
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from osgeo import gdal
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open file: {path}")
-    arr = ds.ReadAsArray()
-    ds = None
-    return arr
+from raster_io import read_band, resolve_path
 
 
 def parse_args():
@@ -28,6 +19,8 @@ def parse_args():
                    help="Geocoded coherence VRT (e.g. topophase.cor.geo.vrt)")
     p.add_argument("--sample", type=int, default=5000,
                    help="Max number of random samples to plot")
+    p.add_argument("--save-fig", "--savefig", dest="save_fig", default=None,
+                   help="Save the figure to this file (relative to the current directory)")
     return p.parse_args()
 
 
@@ -36,25 +29,17 @@ def main():
 
     isce_dir = os.path.abspath(args.isce_dir)
 
-    vert_path = args.vert_path
-    if not os.path.isabs(vert_path):
-        vert_path = os.path.join(isce_dir, vert_path)
+    vert_path = resolve_path(isce_dir, args.vert_path)
 
-    coh_path = args.coh_path
-    if not os.path.isabs(coh_path):
-        coh_path = os.path.join(isce_dir, coh_path)
+    coh_path = resolve_path(isce_dir, args.coh_path)
 
-    vert = read_gdal_array(vert_path)
-    if vert.ndim == 3:
-        vert = vert[0]
+    vert, _, _ = read_band(vert_path, band=1)
 
-    coh_raw = read_gdal_array(coh_path)
+    coh, _, _ = read_band(coh_path, band=1)
     # ISCE coherence is often stored with scale *1000
-    if coh_raw.ndim == 3:
-        coh_raw = coh_raw[0]
-    coh = coh_raw.astype("float32")
+    # (coh may be a read-only memmap view, so scale out of place)
     if coh.max() > 2.0:
-        coh /= 1000.0
+        coh = coh / 1000.0
 
     if vert.shape != coh.shape:
         raise RuntimeError(f"Shape mismatch: vert {vert.shape} vs coh {coh.shape}")
@@ -75,6 +60,8 @@ def main():
         v = v[idx]
         c = c[idx]
 
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(6, 5))
     plt.scatter(c, v, s=5, alpha=0.4)
     plt.xlabel("Coherence")
@@ -82,6 +69,11 @@ def main():
     plt.title("Coherence vs. vertical displacement")
     plt.grid(True)
     plt.tight_layout()
+    if args.save_fig:
+        out_fig = os.path.abspath(args.save_fig)
+        os.makedirs(os.path.dirname(out_fig), exist_ok=True)
+        plt.savefig(out_fig, dpi=300)
+        print("Figure saved to:", out_fig)
     plt.show()
 
 
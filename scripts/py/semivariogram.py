@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+semivariogram.py
+
+Empirical semivariogram / covariance of the noise in a displacement or
+residual raster, or of every date of a MintPy timeseries.h5, with fitted
+exponential and spherical models.
+
+Pairwise estimators are O(N^2).  Here the sums over all pixel pairs at lag h
+are cross-correlations of masked fields, computed with zero-padded FFTs
+(padding = maximum lag, so nothing wraps around) in O(N log N):
+
+    N(h) = sum m(x) m(x+h)                          valid pairs
+    S(h) = sum m z(x) m z(x+h)                      -> C(h) = S(h) / N(h)
+    D(h) = sum m(x) m(x+h) (z(x) - z(x+h))^2        -> gamma(h) = D(h) / (2 N(h))
+
+with D(h) = corr(m z^2, m)(h) + corr(m, m z^2)(h) - 2 S(h) and z demeaned
+(optionally deramped) over the valid pixels m.  Lags are binned radially in
+metres (pixel spacing from the geotransform, degrees converted at the grid
+latitude), pair-count weighted.
+
+Models gamma(h) = nugget + psill * f(h / range):
+
+    exponential  f = 1 - exp(-h / r)            (practical range 3 r)
+    spherical    f = 1.5 h/r - 0.5 (h/r)^3, 1 beyond r
+
+are fitted by pair-weighted least squares: nugget and partial sill are
+solved in closed form (non-negative) for a grid of ranges, the best range is
+kept.  With --roi the fitted covariance gives the standard error of the ROI
+mean, sum over pixel pairs of C(h_ij) / n^2, again from an FFT of the ROI
+mask; compare with sqrt(sill / n) for independent pixels.
+
+timeseries.h5 dates are processed by --workers processes (each opens the
+file itself); the all-zero reference date is skipped.
+
+Outputs (in --out-dir, default outputs/):
+
+    semivariogram.csv         label, lag_m, gamma, covariance, pairs
+    semivariogram_models.csv  label, model, nugget, psill, sill, range_m,
+                              practical_range_m, rmse, variance, n_valid,
+                              roi_mean_se
+    semivariogram.png         (--plot) empirical points and best models
+
+Example:
+
+python scripts/py/semivariogram.py mintpy/timeseries.h5 --scale 1000 \
+    --mask mintpy/maskTempCoh.h5:mask --deramp --max-lag-m 20000 \
+    --roi 100,400,200,500 --workers 4 --plot
+"""
+
+import os
+import csv
+import time
+import argparse
+
+import numpy as np
+
+from multilook import pixel_spacing_m
+from raster_io import open_band, read_band
+from remove_ramp import build_design_matrix
+
+
+MODELS = ("exponential", "spherical")
+RANGE_STEPS = 200
+
+
+# --------------------- FFT pair sums ------------------------
+
+def fast_len(n):
+    """Smallest 2^a 3^b 5^c >= n (fast FFT length)."""
+    best = 1 << int(np.ceil(np.log2(max(1, n))))
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            m = p35
+            while m < n:
+                m *= 2
+            best = min(best, m)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def lag_sums(z, valid, max_lag):
+    """(N, S, D) of all lags |dy| <= ly, |dx| <= lx, centred arrays of shape (2ly+1, 2lx+1).
+
+    ``z`` must already be zero (or anything) outside ``valid``; it is masked here.
+    """
+    ny, nx = valid.shape
+    ly, lx = min(max_lag[0], ny - 1), min(max_lag[1], nx - 1)
+    shape = (fast_len(ny + ly), fast_len(nx + lx))
+    m = valid.astype("float64")
+    zm = np.where(valid, z, 0.0).astype("float64")
+    fm = np.fft.rfft2(m, shape)
+    fz = np.fft.rfft2(zm, shape)
+    fq = np.fft.rfft2(zm * zm, shape)
+    del m, zm
+    take = np.ix_(np.r_[-ly:ly + 1], np.r_[-lx:lx + 1])
+    n = np.rint(np.fft.irfft2(fm * fm.conj(), shape)[take])
+    s = np.fft.irfft2(fz * fz.conj(), shape)
+    d = np.fft.irfft2(2.0 * (fq.conj() * fm).real, shape) - 2.0 * s
+    return n, s[take], d[take]
+
+
+def lag_distance(shape, spacing):
+    """Distance (m) of every lag of a centred lag array."""
+    ly, lx = (shape[0] - 1) // 2, (shape[1] - 1) // 2
+    dy = np.arange(-ly, ly + 1) * spacing[0]
+    dx = np.arange(-lx, lx + 1) * spacing[1]
+    return np.hypot(dy[:, None], dx[None, :])
+
+
+def radial_bins(n, s, d, spacing, bin_m, max_lag_m):
+    """Pair-weighted radial bins -> dict of lag_m, gamma, covariance, pairs (+ variance)."""
+    h = lag_distance(n.shape, spacing)
+    use = (h > 0) & (h <= max_lag_m) & (n > 0)
+    k = (h[use] // bin_m).astype("int64")
+    nb = int(max_lag_m // bin_m) + 1
+    pairs = np.bincount(k, n[use], nb)
+    keep = pairs > 0
+    lag = np.bincount(k, (n * h)[use], nb)[keep] / pairs[keep]
+    gamma = np.bincount(k, d[use], nb)[keep] / (2.0 * pairs[keep])
+    cov = np.bincount(k, s[use], nb)[keep] / pairs[keep]
+    centre = (n.shape[0] // 2, n.shape[1] // 2)
+    variance = s[centre] / n[centre] if n[centre] > 0 else np.nan
+    # every pair is counted at h and -h
+    return {"lag_m": lag, "gamma": gamma, "covariance": cov, "pairs": pairs[keep] / 2.0,
+            "variance": float(variance)}
+
+
+# --------------------- models ------------------------
+
+def model_shape(model, h, r):
+    """Normalised model f(h; r) (0 at h = 0, 1 at the sill)."""
+    h = np.asarray(h, dtype="float64")
+    if model == "exponential":
+        return 1.0 - np.exp(-h / r)
+    if model == "spherical":
+        t = np.minimum(h / r, 1.0)
+        return 1.5 * t - 0.5 * t ** 3
+    raise ValueError(f"Unknown model: {model}")
+
+
+def fit_model(model, lag, gamma, weight, max_range):
+    """Best pair-weighted fit of nugget + psill * f(h; r) over a grid of ranges."""
+    ranges = np.geomspace(max(lag.min(), 1e-6) / 2.0, max_range, RANGE_STEPS)
+    f = model_shape(model, lag[None, :], ranges[:, None])
+    w = weight / weight.sum()
+    sw, sf, sff = w.sum(), f @ w, (f * f) @ w
+    sg, sfg = w @ gamma, (f * gamma) @ w
+    det = sw * sff - sf * sf
+    with np.errstate(invalid="ignore", divide="ignore"):
+        c1 = np.where(det > 0, (sw * sfg - sf * sg) / det, 0.0)
+        c0 = (sg - c1 * sf) / sw
+        # non-negative nugget / partial sill: refit the other coefficient alone
+        c1 = np.where(c0 < 0, np.where(sff > 0, sfg / sff, 0.0), c1)
+        c0 = np.maximum(c0, 0.0)
+        c0 = np.where(c1 < 0, sg / sw, c0)
+        c1 = np.maximum(c1, 0.0)
+    resid = c0[:, None] + c1[:, None] * f - gamma[None, :]
+    sse = (resid * resid) @ w
+    best = int(np.nanargmin(sse))
+    r = float(ranges[best])
+    return {"model": model, "nugget": float(c0[best]), "psill": float(c1[best]),
+            "sill": float(c0[best] + c1[best]), "range_m": r,
+            "practical_range_m": 3.0 * r if model == "exponential" else r,
+            "rmse": float(np.sqrt(sse[best]))}
+
+
+def model_gamma(fit, h):
+    g = fit["nugget"] + fit["psill"] * model_shape(fit["model"], h, fit["range_m"])
+    return np.where(np.asarray(h) > 0, g, 0.0)
+
+
+def roi_mean_se(fit, roi_valid, spacing):
+    """Standard error of the mean of the ROI pixels under the fitted covariance."""
+    n0 = int(roi_valid.sum())
+    if n0 == 0:
+        return np.nan
+    ny, nx = roi_valid.shape
+    pairs = lag_sums(np.zeros(roi_valid.shape), roi_valid, (ny - 1, nx - 1))[0]
+    cov = fit["sill"] - model_gamma(fit, lag_distance(pairs.shape, spacing))
+    return float(np.sqrt(max(0.0, (pairs * cov).sum()) / n0 ** 2))
+
+
+# --------------------- one field ------------------------
+
+def deramp(z, valid, max_fit=500_000):
+    """Remove a least-squares plane fitted on (a subsample of) the valid pixels."""
+    ny, nx = z.shape
+    yy, xx = np.nonzero(valid)
+    step = max(1, len(yy) // max_fit)
+    xs, ys = (xx / max(1, nx - 1) - 0.5), (yy / max(1, ny - 1) - 0.5)
+    G = build_design_matrix(xs[::step], ys[::step], degree=1)
+    coef = np.linalg.lstsq(G, z[yy[::step], xx[::step]].astype("float64"), rcond=None)[0]
+    out = np.zeros(z.shape, dtype="float64")
+    out[yy, xx] = z[yy, xx] - build_design_matrix(xs, ys, degree=1) @ coef
+    return out
+
+
+def analyse(z, valid, spacing, params):
+    """Binned semivariogram, model fits and ROI standard error of one field."""
+    n_valid = int(valid.sum())
+    if n_valid < 2:
+        return None
+    z = np.where(valid, z, 0.0).astype("float64")
+    if params["deramp"]:
+        z = deramp(z, valid)
+    z[valid] -= z[valid].mean()
+    if not np.any(z[valid]):
+        return None
+    max_lag_m, bin_m = params["max_lag_m"], params["bin_m"]
+    max_lag = (int(np.ceil(max_lag_m / spacing[0])), int(np.ceil(max_lag_m / spacing[1])))
+    binned = radial_bins(*lag_sums(z, valid, max_lag), spacing, bin_m, max_lag_m)
+    fits = []
+    if len(binned["lag_m"]) >= 3:
+        for model in params["models"]:
+            fit = fit_model(model, binned["lag_m"], binned["gamma"], binned["pairs"],
+                            3.0 * max_lag_m)
+            if params["roi"] is not None:
+                x1, x2, y1, y2 = params["roi"]
+                fit["roi_mean_se"] = roi_mean_se(fit, valid[y1:y2, x1:x2], spacing)
+                fit["roi_n"] = int(valid[y1:y2, x1:x2].sum())
+            fits.append(fit)
+    binned["n_valid"] = n_valid
+    binned["fits"] = sorted(fits, key=lambda f: f["rmse"])
+    return binned
+
+
+def load_field(spec, index, scale, mask_spec, zero_as_nan):
+    """(z, valid) of a raster spec or of date ``index`` of a 3D dataset."""
+    src, _, _ = open_band(spec)
+    z = np.asarray(src[index] if index is not None else src[()], dtype="float64") * scale
+    valid = np.isfinite(z)
+    if zero_as_nan:
+        valid &= z != 0
+    if mask_spec is not None:
+        valid &= read_band(mask_spec, band=1, dtype=None)[0] != 0
+    return z, valid
+
+
+def date_job(spec, index, label, spacing, params):
+    """Worker: (label, result or None) of one date / raster."""
+    z, valid = load_field(spec, index, params["scale"], params["mask"], params["zero_as_nan"])
+    return label, analyse(z, valid, spacing, params)
+
+
+# --------------------- output ------------------------
+
+def write_tables(out_dir, results):
+    os.makedirs(out_dir, exist_ok=True)
+    emp_path = os.path.join(out_dir, "semivariogram.csv")
+    with open(emp_path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["label", "lag_m", "gamma", "covariance", "pairs"])
+        for label, res in results:
+            for row in zip(res["lag_m"], res["gamma"], res["covariance"], res["pairs"]):
+                w.writerow([label] + [f"{v:.6g}" for v in row])
+    cols = ["model", "nugget", "psill", "sill", "range_m", "practical_range_m", "rmse"]
+    fit_path = os.path.join(out_dir, "semivariogram_models.csv")
+    with open(fit_path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["label"] + cols + ["variance", "n_valid", "roi_mean_se"])
+        for label, res in results:
+            for fit in res["fits"]:
+                w.writerow([label] + [fit[c] if c == "model" else f"{fit[c]:.6g}" for c in cols]
+                           + [f"{res['variance']:.6g}", res["n_valid"],
+                              f"{fit['roi_mean_se']:.6g}" if "roi_mean_se" in fit else ""])
+    return emp_path, fit_path
+
+
+def plot(path, results, units):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    cmap = plt.get_cmap("viridis")
+    for k, (label, res) in enumerate(results):
+        color = cmap(k / max(1, len(results) - 1))
+        ax.plot(res["lag_m"] / 1000.0, res["gamma"], "o", ms=3, color=color,
+                label=label if len(results) <= 10 else None)
+        if res["fits"]:
+            h = np.linspace(0, res["lag_m"].max(), 200)
+            ax.plot(h / 1000.0, model_gamma(res["fits"][0], h), "-", lw=1, color=color)
+    ax.set_xlabel("Lag [km]")
+    ax.set_ylabel(f"Semivariance [{units}]")
+    ax.set_title("Empirical semivariogram (points) and best model (lines)")
+    if len(results) <= 10:
+        ax.legend(fontsize=8)
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+# --------------------- CLI ------------------------
+
+def parse_roi(text, shape):
+    """'x1,x2,y1,y2' (as analyze_vertical_roi.py) -> clamped (x1, x2, y1, y2)."""
+    x1, x2, y1, y2 = (int(v) for v in text.split(","))
+    ny, nx = shape
+    x1, x2 = max(0, min(nx, x1)), max(0, min(nx, x2))
+    y1, y2 = max(0, min(ny, y1)), max(0, min(ny, y2))
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError(f"Empty ROI: {text}")
+    return x1, x2, y1, y2
+
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="FFT empirical semivariogram / covariance of a raster or timeseries.h5.")
+    p.add_argument("input", help="Raster, 'file.h5:dataset', or MintPy timeseries.h5 (all dates).")
+    p.add_argument("--dates", default=None,
+                   help="Comma-separated dates of timeseries.h5 (default: all).")
+    p.add_argument("--scale", type=float, default=1.0,
+                   help="Multiply the data by this (1000 for MintPy m -> mm).")
+    p.add_argument("--mask", default=None,
+                   help="Mask raster or 'file.h5:dataset' (non-zero = use).")
+    p.add_argument("--zero-as-nan", action="store_true", help="Treat zeros as no-data.")
+    p.add_argument("--deramp", action="store_true",
+                   help="Remove a best-fit plane before estimating the semivariogram.")
+    p.add_argument("--max-lag-m", type=float, default=None,
+                   help="Largest lag in metres (default: half the smaller image side).")
+    p.add_argument("--bin-m", type=float, default=None,
+                   help="Radial bin width in metres (default: max lag / 40).")
+    p.add_argument("--pixel-m", type=float, default=None,
+                   help="Pixel spacing in metres when the input has no geotransform.")
+    p.add_argument("--model", default="both", choices=MODELS + ("both",),
+                   help="Model(s) to fit (default both).")
+    p.add_argument("--roi", default=None,
+                   help="ROI x1,x2,y1,y2 (pixels): standard error of its mean from the model.")
+    p.add_argument("--out-dir", default="outputs", help="Folder for the tables and plot.")
+    p.add_argument("--plot", action="store_true", help="Also write semivariogram.png.")
+    p.add_argument("--workers", type=int, default=1, help="Worker processes (default 1).")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    spec = args.input
+    jobs = []
+    if ":" not in os.path.basename(spec) and spec.endswith(".h5"):
+        import h5py
+
+        with h5py.File(spec, "r") as f:
+            dates = [d.decode() if isinstance(d, bytes) else str(d) for d in f["date"][()]]
+        wanted = args.dates.split(",") if args.dates else dates
+        missing = sorted(set(wanted) - set(dates))
+        if missing:
+            raise SystemExit(f"Dates not in {spec}: {', '.join(missing)}")
+        spec = f"{spec}:timeseries"
+        jobs = [(dates.index(d), d) for d in wanted]
+    else:
+        jobs = [(None, os.path.basename(spec))]
+
+    src, gt, _ = open_band(spec)
+    shape = src.shape[-2:]
+    if args.pixel_m is not None:
+        spacing = (args.pixel_m, args.pixel_m)
+    elif gt is not None:
+        spacing = pixel_spacing_m(gt)
+    else:
+        raise SystemExit("No geotransform in the input: give --pixel-m.")
+    max_lag_m = args.max_lag_m or 0.5 * min(shape[0] * spacing[0], shape[1] * spacing[1])
+    params = {
+        "scale": args.scale, "mask": args.mask, "zero_as_nan": args.zero_as_nan,
+        "deramp": args.deramp, "max_lag_m": max_lag_m,
+        "bin_m": args.bin_m or max_lag_m / 40.0,
+        "models": MODELS if args.model == "both" else (args.model,),
+        "roi": parse_roi(args.roi, shape) if args.roi else None,
+    }
+    print(f"Input : {spec} ({len(jobs)} field(s), {shape[0]} x {shape[1]}, "
+          f"pixel {spacing[0]:.1f} x {spacing[1]:.1f} m)")
+    print(f"Lags  : up to {max_lag_m:.0f} m in bins of {params['bin_m']:.0f} m")
+
+    t0 = time.perf_counter()
+    job_args = [(spec, index, label, spacing, params) for index, label in jobs]
+    if args.workers <= 1 or len(jobs) == 1:
+        done = [date_job(*a) for a in job_args]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            done = list(pool.map(date_job, *zip(*job_args)))
+    print(f"Estimated in {time.perf_counter() - t0:.1f} s ({args.workers} worker(s))\n")
+
+    results = []
+    for label, res in done:
+        if res is None:
+            print(f"{label}: skipped (no variation / too few valid pixels)")
+            continue
+        results.append((label, res))
+        line = f"{label}: variance {res['variance']:.4g}"
+        if res["fits"]:
+            best = res["fits"][0]
+            line += (f", {best['model']} nugget {best['nugget']:.4g} sill {best['sill']:.4g} "
+                     f"range {best['practical_range_m']:.0f} m")
+            if best.get("roi_n"):
+                line += (f", ROI mean SE {best['roi_mean_se']:.4g} "
+                         f"(independent pixels: {np.sqrt(best['sill'] / best['roi_n']):.4g})")
+        print(line)
+    if not results:
+        raise SystemExit("No field with valid, varying pixels.")
+
+    emp_path, fit_path = write_tables(args.out_dir, results)
+    print("\nTables:", emp_path, fit_path)
+    if args.plot:
+        png = os.path.join(args.out_dir, "semivariogram.png")
+        plot(png, results, "input units^2" if args.scale == 1.0 else f"(input x {args.scale:g})^2")
+        print("Plot  :", png)
+
+
+if __name__ == "__main__":
+    main()
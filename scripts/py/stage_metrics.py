@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+stage_metrics.py
+
+Resource instrumentation for the pipeline stages.
+
+For every stage a record with wall / CPU time, peak RSS, bytes read and
+written and the size of the stage inputs is appended to
+
+    <record-dir>/run_metrics.jsonl   (one JSON object per line)
+    <record-dir>/run_metrics.csv     (same fields, for spreadsheets)
+
+so the history across runs can be compared to track regressions and size
+hardware.  Records of one pipeline run share the PIPELINE_RUN_ID
+environment variable (set by run_all.sh).
+
+Two ways to use it:
+
+1. wrap an external command (topsApp, post-processing scripts):
+
+python scripts/py/stage_metrics.py --stage topsApp \
+    --record-dir outputs/paper_tables --inputs ../SLC -- topsApp.py topsApp.xml --steps
+
+2. measure a block of Python code in-process (used by run_mintpy_steps.py):
+
+    with measure("invert_network", record_dir, inputs=["inputs/ifgramStack.h5"]):
+        app.run(steps=["invert_network"])
+
+Bytes read / written come from /proc/<pid>/io (Linux); read_bytes /
+write_bytes count storage I/O, rchar / wchar include page-cache hits.
+"""
+
+import os
+import csv
+import sys
+import json
+import glob
+import time
+import socket
+import argparse
+import resource
+import subprocess
+from contextlib import contextmanager
+
+
+FIELDS = [
+    "run_id", "stage", "start", "wall_s", "cpu_user_s", "cpu_sys_s",
+    "peak_rss_mb", "read_mb", "write_mb", "rchar_mb", "wchar_mb",
+    "input_mb", "exit_code", "host", "n_cpu", "command",
+]
+
+MB = 1024.0 * 1024.0
+
+
+# --------------------- probes ------------------------
+
+def proc_io(pid="self"):
+    """Counters of /proc/<pid>/io as a dict (empty if unavailable)."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+def reset_peak_rss():
+    """Reset the VmHWM high-water mark of this process (Linux >= 4.0)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """VmHWM of this process in MB (falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def input_size_mb(paths):
+    """Total size of the given files / directories / glob patterns."""
+    total = 0
+    for pattern in paths or []:
+        for path in glob.glob(pattern) or []:
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    for n in names:
+                        try:
+                            total += os.path.getsize(os.path.join(root, n))
+                        except OSError:
+                            pass
+            elif os.path.exists(path):
+                total += os.path.getsize(path)
+    return total / MB
+
+
+def io_delta_mb(before, after):
+    return {
+        "read_mb": (after.get("read_bytes", 0) - before.get("read_bytes", 0)) / MB,
+        "write_mb": (after.get("write_bytes", 0) - before.get("write_bytes", 0)) / MB,
+        "rchar_mb": (after.get("rchar", 0) - before.get("rchar", 0)) / MB,
+        "wchar_mb": (after.get("wchar", 0) - before.get("wchar", 0)) / MB,
+    }
+
+
+def base_record(stage, command, inputs):
+    return {
+        "run_id": os.environ.get("PIPELINE_RUN_ID", time.strftime("%Y%m%dT%H%M%S")),
+        "stage": stage,
+        "start": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "input_mb": round(input_size_mb(inputs), 3),
+        "host": socket.gethostname(),
+        "n_cpu": os.cpu_count(),
+        "command": command,
+    }
+
+
+# --------------------- records ------------------------
+
+def append_record(record, record_dir):
+    """Append one record to run_metrics.jsonl and run_metrics.csv."""
+    os.makedirs(record_dir, exist_ok=True)
+    for k in ("wall_s", "cpu_user_s", "cpu_sys_s", "peak_rss_mb",
+              "read_mb", "write_mb", "rchar_mb", "wchar_mb"):
+        if k in record and record[k] is not None:
+            record[k] = round(float(record[k]), 3)
+
+    with open(os.path.join(record_dir, "run_metrics.jsonl"), "a") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    csv_path = os.path.join(record_dir, "run_metrics.csv")
+    new_file = not os.path.exists(csv_path)
+    with open(csv_path, "a", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+        if new_file:
+            w.writeheader()
+        w.writerow(record)
+
+
+def print_record(record):
+    print(f"[METRICS] {record['stage']}: wall={record['wall_s']:.1f}s "
+          f"cpu={record['cpu_user_s'] + record['cpu_sys_s']:.1f}s "
+          f"peak_rss={record['peak_rss_mb']:.0f}MB "
+          f"read={record['read_mb']:.0f}MB write={record['write_mb']:.0f}MB "
+          f"exit={record['exit_code']}")
+
+
+@contextmanager
+def measure(stage, record_dir, inputs=None):
+    """Measure a block of code running in this process.
+
+    Peak RSS is per block when the kernel allows resetting VmHWM,
+    otherwise it is the process high-water mark so far.
+    """
+    record = base_record(stage, " ".join(sys.argv), inputs)
+    reset_peak_rss()
+    io0 = proc_io()
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.perf_counter()
+    record["exit_code"] = 1
+    try:
+        yield record
+        record["exit_code"] = 0
+    finally:
+        ru1 = resource.getrusage(resource.RUSAGE_SELF)
+        record.update({
+            "wall_s": time.perf_counter() - t0,
+            "cpu_user_s": ru1.ru_utime - ru0.ru_utime,
+            "cpu_sys_s": ru1.ru_stime - ru0.ru_stime,
+            "peak_rss_mb": peak_rss_mb(),
+        })
+        record.update(io_delta_mb(io0, proc_io()))
+        append_record(record, record_dir)
+        print_record(record)
+
+
+def run_command(stage, command, record_dir, inputs=None):
+    """Run an external command and record its resource usage.
+
+    Meant to be called once per process (as the CLI does): ru_maxrss of
+    RUSAGE_CHILDREN is the peak of all children waited for so far.
+    """
+    record = base_record(stage, " ".join(command), inputs)
+    io0 = proc_io()
+    ru0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    t0 = time.perf_counter()
+    try:
+        code = subprocess.call(command)
+    except OSError as e:
+        print(f"[ERROR] {stage}: {e}")
+        code = 127
+    ru1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    record.update({
+        "wall_s": time.perf_counter() - t0,
+        "cpu_user_s": ru1.ru_utime - ru0.ru_utime,
+        "cpu_sys_s": ru1.ru_stime - ru0.ru_stime,
+        "peak_rss_mb": ru1.ru_maxrss / 1024.0,
+        "exit_code": code,
+    })
+    # I/O of waited-for children is accumulated into this process' counters
+    record.update(io_delta_mb(io0, proc_io()))
+    append_record(record, record_dir)
+    print_record(record)
+    return code
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Run a pipeline stage and append its resource usage to the run record.",
+        usage="%(prog)s --stage NAME [--record-dir DIR] [--inputs PATH ...] -- command [args ...]",
+    )
+    p.add_argument("--stage", required=True, help="Stage name stored in the record.")
+    p.add_argument("--record-dir", default="outputs/paper_tables",
+                   help="Folder of run_metrics.jsonl / .csv (default: outputs/paper_tables).")
+    p.add_argument("--inputs", nargs="*", default=[],
+                   help="Input files / folders / globs whose total size is recorded.")
+    p.add_argument("command", nargs=argparse.REMAINDER,
+                   help="Command to run, after '--'.")
+    args = p.parse_args()
+    if args.command and args.command[0] == "--":
+        args.command = args.command[1:]
+    if not args.command:
+        p.error("missing command after '--'")
+    return args
+
+
+def main():
+    args = parse_args()
+    sys.exit(run_command(args.stage, args.command, args.record_dir, args.inputs))
+
+
+if __name__ == "__main__":
+    main()
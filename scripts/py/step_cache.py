@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+step_cache.py
+
+Content-addressed cache of intermediate arrays between post-processing
+steps (remove_ramp.py -> postprocess_ifg.py -> los_to_vertical.py -> figures).
+
+An entry is keyed by the SHA-256 of (step name, identity of every input file
+(path, size, mtime), parameters that change the result) and stored as an
+uncompressed .npy file plus a small .json sidecar (geotransform, projection,
+printed statistics).  Hits are opened with np.load(mmap_mode="r"), so a
+repeated or parameter-sweep run reuses earlier stages at memory-map speed
+instead of recomputing them and decoding GeoTIFFs.
+
+When a step writes its GeoTIFF it records an alias (output path + identity
+-> entry).  The next step reads its input through StepCache.read_band: if
+the file is still the one that was written from the entry, the cached .npy
+is memory-mapped instead.  A rewritten or foreign file never matches and is
+read normally.
+
+The directory is bounded by --cache-mb: after every store the least
+recently used entries (by mtime, refreshed on each hit) are removed.
+Entries are written to a temporary name and renamed, so concurrent steps
+(postprocess_dag.py workers) only ever see complete files.
+
+Usage from a step:
+
+    cache = StepCache.from_args(args)          # None without --cache-dir
+    arr, gt, proj = read_input(cache, path, band)
+    key = cache.key("postprocess_ifg", [unw_path, coh_path], {"clip": 50.0})
+"""
+
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+from file_utils import file_identity
+from raster_io import read_band
+
+
+CACHE_ENV = "POSTPROCESS_CACHE_DIR"
+
+
+class StepCache:
+    """Size-bounded LRU directory of .npy entries addressed by content keys."""
+
+    def __init__(self, cache_dir, max_mb=4096):
+        self.dir = os.path.abspath(cache_dir)
+        self.max_bytes = int(max_mb * 1024 ** 2)
+        os.makedirs(os.path.join(self.dir, "alias"), exist_ok=True)
+
+    @classmethod
+    def from_args(cls, args):
+        """Cache of --cache-dir (or $POSTPROCESS_CACHE_DIR), None if neither is set."""
+        cache_dir = getattr(args, "cache_dir", None) or os.environ.get(CACHE_ENV)
+        if not cache_dir:
+            return None
+        return cls(cache_dir, getattr(args, "cache_mb", 4096))
+
+    # ---------- keys ----------
+
+    def key(self, step, inputs, params):
+        payload = {
+            "step": step,
+            "inputs": [self.input_identity(p) for p in inputs],
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def input_identity(self, path):
+        """Identity of an input; a file written from an entry is identified by that entry."""
+        path = os.path.abspath(path)
+        alias = self._alias(path)
+        if alias is not None:
+            return ["entry", alias]
+        return file_identity(path)
+
+    # ---------- entries ----------
+
+    def _paths(self, key):
+        base = os.path.join(self.dir, key)
+        return base + ".npy", base + ".json"
+
+    def load(self, key):
+        """(read-only memmap, meta dict) of an entry, or None."""
+        npy, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            arr = np.load(npy, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        for p in (npy, meta_path):
+            try:
+                os.utime(p, (now, now))
+            except OSError:
+                pass
+        return arr, meta
+
+    def store(self, key, array, meta):
+        """Write an entry atomically; returns (read-only memmap, meta)."""
+        npy, meta_path = self._paths(key)
+        tag = f".{os.getpid()}.tmp"
+        with open(npy + tag, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        with open(meta_path + tag, "w") as f:
+            json.dump(meta, f)
+        os.replace(npy + tag, npy)
+        os.replace(meta_path + tag, meta_path)
+        self.evict(keep=key)
+        return np.load(npy, mmap_mode="r"), meta
+
+    def cached(self, step, inputs, params, compute):
+        """(array, meta, hit): the entry of (step, inputs, params), computed on a miss.
+
+        ``compute()`` returns (array, meta) with a JSON-serialisable meta.
+        """
+        key = self.key(step, inputs, params)
+        hit = self.load(key)
+        if hit is not None:
+            return hit[0], dict(hit[1], key=key), True
+        array, meta = compute()
+        meta = dict(meta, step=step, params=params, created=time.time())
+        arr, meta = self.store(key, array, meta)
+        return arr, dict(meta, key=key), False
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the directory fits max_bytes."""
+        entries = []
+        for name in os.listdir(self.dir):
+            if not name.endswith(".npy"):
+                continue
+            key = name[:-4]
+            npy, meta_path = self._paths(key)
+            try:
+                st = os.stat(npy)
+            except OSError:
+                continue
+            size = st.st_size + (os.path.getsize(meta_path) if os.path.exists(meta_path) else 0)
+            entries.append((st.st_mtime, key, size))
+        total = sum(e[2] for e in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for p in self._paths(key):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+
+    # ---------- aliases (output files written from an entry) ----------
+
+    def _alias_path(self, path):
+        digest = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.dir, "alias", digest + ".json")
+
+    def _alias(self, path):
+        """Entry key if ``path`` is unchanged since it was written from that entry."""
+        try:
+            with open(self._alias_path(path)) as f:
+                alias = json.load(f)
+            if alias["identity"] != file_identity(os.path.abspath(path)):
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return alias["key"] if os.path.exists(self._paths(alias["key"])[0]) else None
+
+    def write_output(self, path, meta, writer):
+        """Call ``writer()`` unless ``path`` already holds this entry; then record the alias."""
+        key = meta["key"]
+        if self._alias(path) == key:
+            return False
+        writer()
+        alias = {"identity": file_identity(os.path.abspath(path)), "key": key}
+        tmp = self._alias_path(path) + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(alias, f)
+        os.replace(tmp, self._alias_path(path))
+        return True
+
+    def read_band(self, path, band=1, dtype="float32"):
+        """As raster_io.read_band, memory-mapping the entry a file was written from."""
+        key = self._alias(path) if band == 1 else None
+        hit = self.load(key) if key else None
+        if hit is not None:
+            arr, meta = hit
+            if dtype is None or arr.dtype == np.dtype(dtype):
+                gt = meta.get("geotransform")
+                return arr, tuple(gt) if gt else None, meta.get("projection", "")
+        return read_band(path, band=band, dtype=dtype)
+
+
+def read_input(cache, path, band=1, dtype="float32"):
+    """read_band through the cache when there is one."""
+    if cache is None:
+        return read_band(path, band=band, dtype=dtype)
+    return cache.read_band(path, band=band, dtype=dtype)
+
+
+def add_cache_args(p, help_dir=None, help_mb=None):
+    """--cache-dir / --cache-mb options of the cached steps."""
+    p.add_argument("--cache-dir", default=None,
+                   help=help_dir or f"Step cache directory (default: ${CACHE_ENV}; none = no cache).")
+    p.add_argument("--cache-mb", type=float, default=4096,
+                   help=help_mb or "Size bound of the step cache in MB (LRU eviction).")
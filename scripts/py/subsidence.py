@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+subsidence.py
+
+Single entry point for the scripts of scripts/py:
+
+    subsidence <command> [options]        (options of the underlying script)
+    subsidence <command> --help
+    subsidence --help                     list of commands
+
+The command table below is static: listing commands imports nothing, and a
+command imports only its own module.  The scripts keep heavy imports
+(matplotlib, GDAL, h5py, rasterio, contextily, dask) inside the functions
+that need them, so --help and non-plotting commands start in about the time
+of importing NumPy (see benchmark_scripts.py --startup).
+
+Install by linking the wrapper script into PATH:
+
+    ln -s "$PWD/scripts/subsidence" ~/.local/bin/subsidence
+
+or run it directly: python scripts/py/subsidence.py postprocess --help
+"""
+
+import os
+import sys
+import importlib
+
+
+# name -> (module in scripts/py, summary); grouped as printed by --help
+COMMANDS = {
+    # interferogram post-processing
+    "deramp": ("remove_ramp", "Fit and remove a polynomial ramp from the unwrapped phase."),
+    "postprocess": ("postprocess_ifg", "Unwrapped phase + coherence -> LOS displacement (mm)."),
+    "vertical": ("los_to_vertical", "LOS -> vertical displacement with the incidence angle."),
+    "dask-postprocess": ("dask_postprocess", "Out-of-core postprocess + vertical with dask."),
+    "multilook": ("multilook", "NaN-aware multilooking of a geocoded product."),
+    "rereference": ("rereference", "Re-reference products / time series to a new area."),
+    "geocode": ("geocode_index", "Build / apply a reusable radar-to-geo lookup index."),
+    "cube": ("product_cube", "Build / inspect the HDF5 product cube."),
+    "dag": ("postprocess_dag", "Run the post-processing DAG incrementally."),
+    # statistics and export
+    "stats": ("analyze_vertical_roi", "Vertical displacement statistics (whole image / ROI)."),
+    "export-points": ("export_points", "Export coherent points to a GeoPackage."),
+    "semivariogram": ("semivariogram", "FFT noise semivariogram / covariance models."),
+    "query": ("query_service", "Localhost lookup service for velocity / displacement."),
+    # MintPy stack tools
+    "mintpy": ("run_mintpy_steps", "Run smallbaselineApp steps with caching and metrics."),
+    "plan": ("plan_mintpy_resources", "Plan MintPy memory / worker settings."),
+    "incremental": ("incremental_update", "Append new acquisitions to an existing stack."),
+    "closure": ("closure_phase", "Triplet phase closure screening of ifgramStack.h5."),
+    "quality": ("ifg_quality", "Per-interferogram quality table and network plot."),
+    "tropo": ("tropo_dem_correction", "Stack-wide DEM-correlated tropospheric correction."),
+    "invert-roi": ("invert_roi", "SBAS inversion of a region of interest."),
+    "fit-ts": ("fit_timeseries_model", "Fit a deformation model to timeseries.h5."),
+    # figures
+    "plot-los": ("visualize_los", "LOS / vertical map with optional ROI box."),
+    "plot-los-map": ("visualize_los_map", "LOS displacement map."),
+    "plot-vertical": ("visualize_vertical_map", "Vertical displacement map."),
+    "plot-hist": ("vertical_histogram", "Histogram of vertical displacement."),
+    "plot-roi": ("vertical_roi_plots", "ROI map and histogram."),
+    "plot-valid": ("valid_pixels_heatmap", "Valid-pixel mask."),
+    "plot-scatter": ("scatter_coh_vs_vertical", "Coherence vs. vertical displacement."),
+    "plot-profile": ("profile_los_vertical", "LOS / vertical profile along a row."),
+    "plot-basemap": ("vertical_on_basemap", "Vertical displacement on a web basemap."),
+    # tooling
+    "metrics": ("stage_metrics", "Run a command and record time / memory / I/O."),
+    "bench": ("benchmark_scripts", "Benchmark the scripts on synthetic stacks."),
+    "synth": ("synthetic_stack", "Generate a synthetic ISCE / MintPy stack."),
+}
+
+
+def usage():
+    width = max(len(n) for n in COMMANDS)
+    lines = ["usage: subsidence <command> [options]", "", "commands:"]
+    lines += [f"  {name:<{width}}  {summary}" for name, (_, summary) in COMMANDS.items()]
+    lines += ["", "subsidence <command> --help shows the options of a command."]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print(usage())
+        return 0
+    name, rest = argv[0], argv[1:]
+    if name not in COMMANDS:
+        import difflib
+
+        close = difflib.get_close_matches(name, COMMANDS, n=3)
+        hint = f" (did you mean: {', '.join(close)}?)" if close else ""
+        print(f"subsidence: unknown command '{name}'{hint}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    module = importlib.import_module(COMMANDS[name][0])
+    # the scripts parse sys.argv themselves; argparse shows "subsidence <name>"
+    sys.argv = [f"subsidence {name}"] + rest
+    return module.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
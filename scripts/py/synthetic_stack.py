@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+synthetic_stack.py
+
+Generate synthetic ISCE-like inputs of any size, with a known signal, for
+benchmarks and numerical checks without real Sentinel-1 data.
+
+Layout under <out-dir> (same names as a real ISCE project):
+
+    merged/filt_topophase.unw.geo      2-band BIL float32 (amplitude, phase)
+    merged/topophase.cor.geo           coherence 0..1, 0 outside the swath
+    mintpy_inputs/geometry/incidenceAngle.geo   degrees
+    timeseries.h5                      MintPy-like, N dates, metres
+    inputs/ifgramStack.h5              optional (--num-conn), pairs of timeseries.h5
+    synthetic_stack.json               generation parameters + model
+
+Every raw file gets an ISCE .xml and a raw GDAL .vrt header, so it is read
+through raster_io (memmap) like the real products.
+
+The displacement model (metres) is, at normalised position (u, v) in [0, 1]:
+
+    d(t) = sum_k rate_k * t * exp(-r_k^2 / 2 s_k^2)      subsidence bowls
+         + season * sin(2 pi t)                          annual term
+         + ax(t) * u + ay(t) * v + c(t)                  per-date planar ramp
+
+The interferogram is d(t_last) - d(t_first) converted to radians plus
+coherence-dependent noise.  The rasters are written in row blocks, so 30k x
+30k inputs need only a few hundred MB of memory.
+
+Example:
+
+python scripts/py/synthetic_stack.py --out-dir /tmp/synth/size_2000 --size 2000
+"""
+
+import os
+import json
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+
+from raster_io import write_isce_headers
+
+
+WAVELENGTH = 0.05546576          # Sentinel-1 C-band (m)
+PHASE2RANGE = -WAVELENGTH / (4.0 * np.pi)
+X_FIRST, Y_FIRST = 51.0, 35.9    # upper-left corner (lon, lat)
+EXTENT_DEG = 0.6                 # the scene covers the same area at every size
+
+BOWLS = [
+    # (u, v, sigma, rate m/yr)
+    (0.35, 0.40, 0.06, -0.080),
+    (0.70, 0.65, 0.04, -0.045),
+    (0.55, 0.20, 0.03, -0.020),
+]
+SEASON_AMP = 0.004               # m
+REF_UV = (0.10, 0.90)            # reference pixel, far from the bowls
+
+
+# --------------------- rasters ------------------------
+
+def create_raw(data_path, size, nbands, geotransform):
+    """Allocate a BIL float32 file; returns a writable (length, nbands, width) memmap."""
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    arr = np.memmap(data_path, mode="w+", dtype="<f4", shape=(size, nbands, size))
+    write_isce_headers(data_path, size, size, nbands, geotransform)
+    return arr
+
+
+# --------------------- model ------------------------
+
+def date_list(n_dates, start=date(2020, 1, 1), step_days=12):
+    return [(start + timedelta(days=step_days * i)).strftime("%Y%m%d") for i in range(n_dates)]
+
+
+def years_since_first(dates):
+    d0 = date(int(dates[0][:4]), int(dates[0][4:6]), int(dates[0][6:]))
+    return np.array([(date(int(d[:4]), int(d[4:6]), int(d[6:])) - d0).days / 365.25
+                     for d in dates], dtype="float64")
+
+
+def ramp_coefficients(n_dates, seed):
+    """(ax, ay, c) in metres per date; the first date has no ramp."""
+    rng = np.random.default_rng(seed)
+    coef = rng.normal(0.0, 0.01, size=(n_dates, 3))
+    coef[0] = 0.0
+    return coef
+
+
+def grid(size, y0, y1):
+    v = ((np.arange(y0, y1, dtype="float32") + 0.5) / size)[:, None]
+    u = ((np.arange(size, dtype="float32") + 0.5) / size)[None, :]
+    return u, v
+
+
+def bowl_shape(u, v):
+    """Sum of bowl rates (m/yr) on the grid."""
+    rate = np.zeros(np.broadcast(u, v).shape, dtype="float32")
+    for bu, bv, sigma, r in BOWLS:
+        rate += r * np.exp(-((u - bu) ** 2 + (v - bv) ** 2) / (2.0 * sigma ** 2))
+    return rate
+
+
+def displacement(u, v, t, ramp):
+    """Model displacement (m) at time t (years) with ramp = (ax, ay, c)."""
+    return (bowl_shape(u, v) * t
+            + SEASON_AMP * np.sin(2.0 * np.pi * t)
+            + ramp[0] * u + ramp[1] * v + ramp[2]).astype("float32")
+
+
+def coherence(u, v):
+    """Smooth coherence in 0.15..0.95, zero outside a slanted swath."""
+    coh = 0.15 + 0.8 * np.exp(-((u - 0.5) ** 2 + (v - 0.5) ** 2) / 0.15)
+    coh = coh - 0.25 * np.exp(-((u - 0.8) ** 2 + (v - 0.25) ** 2) / 0.01)
+    inside = (u > 0.04 + 0.08 * v) & (u < 0.96 - 0.08 * (1.0 - v))
+    return np.where(inside, np.clip(coh, 0.05, 0.95), 0.0).astype("float32")
+
+
+# --------------------- writers ------------------------
+
+def write_rasters(out_dir, size, t, ramps, seed, block_rows):
+    step = EXTENT_DEG / size
+    gt = (X_FIRST, step, 0.0, Y_FIRST, 0.0, -step)
+
+    unw = create_raw(os.path.join(out_dir, "merged", "filt_topophase.unw.geo"), size, 2, gt)
+    cor = create_raw(os.path.join(out_dir, "merged", "topophase.cor.geo"), size, 1, gt)
+    inc = create_raw(os.path.join(out_dir, "mintpy_inputs", "geometry", "incidenceAngle.geo"),
+                     size, 1, gt)
+
+    for i, y0 in enumerate(range(0, size, block_rows)):
+        y1 = min(size, y0 + block_rows)
+        u, v = grid(size, y0, y1)
+        rng = np.random.default_rng([seed, i])
+
+        coh = coherence(u, v)
+        inside = coh > 0
+        disp = displacement(u, v, t[-1], ramps[-1]) - displacement(u, v, t[0], ramps[0])
+        noise = rng.standard_normal(coh.shape).astype("float32")
+        noise *= 0.3 * np.sqrt(1.0 - coh ** 2) / np.maximum(coh, 0.05)
+        phase = disp / PHASE2RANGE + noise
+
+        unw[y0:y1, 0, :] = np.where(inside, 100.0 + 20.0 * coh, 0.0)
+        unw[y0:y1, 1, :] = np.where(inside, phase, 0.0)
+        cor[y0:y1, 0, :] = coh
+        inc[y0:y1, 0, :] = np.broadcast_to(30.0 + 16.0 * u, coh.shape)
+
+    for arr in (unw, cor, inc):
+        arr.flush()
+    return gt
+
+
+def write_timeseries(path, size, dates, t, ramps, block_rows):
+    import h5py
+
+    step = EXTENT_DEG / size
+    ref_y, ref_x = int(REF_UV[1] * size), int(REF_UV[0] * size)
+    ref_u, ref_v = grid(size, ref_y, ref_y + 1)
+    ref_u = ref_u[:, ref_x:ref_x + 1]
+
+    with h5py.File(path, "w") as f:
+        chunk = (1, min(size, 256), min(size, 256))
+        ts = f.create_dataset("timeseries", shape=(len(dates), size, size),
+                              dtype="float32", chunks=chunk)
+        f.create_dataset("date", data=np.array(dates, dtype="S8"))
+        f.create_dataset("bperp", data=np.linspace(-60, 60, len(dates)).astype("float32"))
+        for k in range(len(dates)):
+            ref = displacement(ref_u, ref_v, t[k], ramps[k])[0, 0]
+            for y0 in range(0, size, block_rows):
+                y1 = min(size, y0 + block_rows)
+                u, v = grid(size, y0, y1)
+                ts[k, y0:y1, :] = displacement(u, v, t[k], ramps[k]) - ref
+        f.attrs.update({
+            "FILE_TYPE": "timeseries", "UNIT": "m", "WAVELENGTH": WAVELENGTH,
+            "LENGTH": size, "WIDTH": size, "REF_Y": ref_y, "REF_X": ref_x,
+            "REF_DATE": dates[0], "X_FIRST": X_FIRST, "Y_FIRST": Y_FIRST,
+            "X_STEP": step, "Y_STEP": -step, "X_UNIT": "degrees", "Y_UNIT": "degrees",
+        })
+
+
+def write_ifgram_stack(path, ts_file, num_conn, seed, block_rows):
+    """MintPy-like inputs/ifgramStack.h5 of sequential pairs (num_conn per
+    date) formed from timeseries.h5, with coherence-dependent phase noise."""
+    import h5py
+
+    with h5py.File(ts_file, "r") as ft:
+        ts = ft["timeseries"]
+        n_date, size, _ = ts.shape
+        dates = [d.decode() for d in ft["date"][:]]
+        bperp = ft["bperp"][:]
+        pairs = [(i, j) for i in range(n_date) for j in range(i + 1, min(n_date, i + num_conn + 1))]
+        attrs = dict(ft.attrs)
+
+        with h5py.File(path, "w") as fs:
+            chunk = (1, min(size, 256), min(size, 256))
+            shape = (len(pairs), size, size)
+            unw = fs.create_dataset("unwrapPhase", shape=shape, dtype="float32", chunks=chunk)
+            cor = fs.create_dataset("coherence", shape=shape, dtype="float32", chunks=chunk)
+            cc = fs.create_dataset("connectComponent", shape=shape, dtype="int16", chunks=chunk)
+            fs.create_dataset("date", data=np.array([[dates[i].encode(), dates[j].encode()]
+                                                     for i, j in pairs]))
+            fs.create_dataset("bperp", data=np.array([bperp[j] - bperp[i] for i, j in pairs],
+                                                     dtype="float32"))
+            fs.create_dataset("dropIfgram", data=np.ones(len(pairs), dtype=bool))
+            for y0 in range(0, size, block_rows):
+                y1 = min(size, y0 + block_rows)
+                u, v = grid(size, y0, y1)
+                block = ts[:, y0:y1, :]
+                for k, (i, j) in enumerate(pairs):
+                    rng = np.random.default_rng([seed, y0, k])
+                    coh = coherence(u, v) * np.exp(-(j - i) / 20.0)
+                    noise = rng.standard_normal(coh.shape).astype("float32")
+                    noise *= 0.3 * np.sqrt(1.0 - coh ** 2) / np.maximum(coh, 0.05)
+                    phase = (block[j] - block[i]) / PHASE2RANGE + noise
+                    inside = coh > 0
+                    unw[k, y0:y1, :] = np.where(inside, phase, 0.0)
+                    cor[k, y0:y1, :] = coh
+                    cc[k, y0:y1, :] = inside
+            attrs.update({"FILE_TYPE": "ifgramStack", "UNIT": "radian"})
+            fs.attrs.update(attrs)
+    return len(pairs)
+
+
+def generate(out_dir, size, n_dates=30, ts_size=None, seed=0, block_rows=512, force=False,
+             num_conn=0):
+    """Write the synthetic stack; reuse it if it exists with the same parameters.
+
+    Returns the manifest (also stored as synthetic_stack.json).
+    """
+    out_dir = os.path.abspath(out_dir)
+    ts_size = min(size, 2000) if ts_size is None else ts_size
+    params = {"size": size, "n_dates": n_dates, "ts_size": ts_size, "seed": seed}
+    if num_conn:
+        params["num_conn"] = num_conn
+    manifest_path = os.path.join(out_dir, "synthetic_stack.json")
+
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("params") == params:
+            return manifest
+
+    dates = date_list(n_dates)
+    t = years_since_first(dates)
+    ramps = ramp_coefficients(n_dates, seed)
+
+    os.makedirs(out_dir, exist_ok=True)
+    gt = write_rasters(out_dir, size, t, ramps, seed, block_rows)
+    write_timeseries(os.path.join(out_dir, "timeseries.h5"), ts_size, dates, t, ramps, block_rows)
+    if num_conn:
+        os.makedirs(os.path.join(out_dir, "inputs"), exist_ok=True)
+        write_ifgram_stack(os.path.join(out_dir, "inputs", "ifgramStack.h5"),
+                           os.path.join(out_dir, "timeseries.h5"), num_conn, seed, block_rows)
+
+    manifest = {
+        "params": params,
+        "geotransform": gt,
+        "wavelength": WAVELENGTH,
+        "dates": dates,
+        "ifg": [dates[0], dates[-1]],
+        "bowls": BOWLS,
+        "season_amp_m": SEASON_AMP,
+        "ramps_m": ramps.tolist(),
+        "ref_uv": REF_UV,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Generate a synthetic ISCE-like stack.")
+    p.add_argument("--out-dir", required=True, help="Output (ISCE-like project) folder.")
+    p.add_argument("--size", type=int, default=2000, help="Raster size in pixels (square).")
+    p.add_argument("--dates", type=int, default=30, help="Number of timeseries dates.")
+    p.add_argument("--ts-size", type=int, default=None,
+                   help="timeseries.h5 size (default: min(size, 2000)).")
+    p.add_argument("--num-conn", type=int, default=0,
+                   help="Also write inputs/ifgramStack.h5 with this many sequential pairs "
+                        "per date (default 0: no stack).")
+    p.add_argument("--seed", type=int, default=0, help="Random seed.")
+    p.add_argument("--block-rows", type=int, default=512, help="Rows written per block.")
+    p.add_argument("--force", action="store_true", help="Regenerate even if up to date.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    manifest = generate(args.out_dir, args.size, args.dates, args.ts_size,
+                        args.seed, args.block_rows, args.force, args.num_conn)
+    print("Synthetic stack:", os.path.abspath(args.out_dir))
+    print("Size:", manifest["params"]["size"], " dates:", len(manifest["dates"]),
+          " ifg:", "_".join(manifest["ifg"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+tropo_dem_correction.py
+
+Empirical stratified-troposphere correction of every interferogram of
+inputs/ifgramStack.h5 from the project DEM, for nodes without access to
+weather models.  For each pair k the phase is fitted as
+
+    phi_k(x, y) = c_k * h + a_k [+ ramp_k(x, y)]
+
+over the usable pixels (finite, non-zero, coherence >= --min-coh, outside
+--exclude-roi / --mask-file, every --fit-step pixel), and c_k * h (+ the
+ramp) is removed.
+
+All pairs share the design matrix G (DEM in km, normalised x / y), only
+their valid-pixel weights w_k differ, so the normal equations of the whole
+stack are two matrix products per row strip of one streaming pass:
+
+    N[k] = sum_p w_kp G_p G_p^T   ->  W (n_ifg x n_pix) @ [G_i G_j] (n_pix x m(m+1)/2)
+    b[k] = sum_p w_kp phi_kp G_p  ->  (W * Phi) @ G
+
+The DEM is read once and shared by both passes; the correction is then
+applied strip by strip.  The corrected phase goes to a new dataset
+(unwrapPhase_tropoDEM; --in-place overwrites unwrapPhase), the
+coefficients to tropoDEMCoeff and a per-pair table (tropo_dem_pairs.csv).
+
+Exclude deforming areas (--exclude-roi / --mask-file): subsidence that
+correlates with topography would otherwise be fitted as troposphere.
+
+Example (inside the MintPy work dir):
+
+python scripts/py/tropo_dem_correction.py inputs/ifgramStack.h5 \
+    --dem inputs/geometryGeo.h5:height --ramp linear --min-coh 0.4 \
+    --exclude-roi 1200,1800,400,900
+"""
+
+import os
+import csv
+import time
+import argparse
+
+import numpy as np
+
+from raster_io import read_band
+
+
+RAMPS = {"none": 0, "linear": 2, "quadratic": 5}
+
+
+# --------------------- model ------------------------
+
+def design(h_km, x, y, ramp):
+    """(n_pix, m) columns: DEM, offset, ramp terms."""
+    cols = [h_km, np.ones_like(h_km)]
+    if ramp in ("linear", "quadratic"):
+        cols += [x, y]
+    if ramp == "quadratic":
+        cols += [x * y, x * x, y * y]
+    return np.stack(cols, axis=1)
+
+
+def names_for(ramp):
+    return ["dem", "offset", "x", "y", "xy", "xx", "yy"][:2 + RAMPS[ramp]]
+
+
+def coords(y0, y1, nx, ny):
+    """Normalised (x, y) of the pixels of rows y0:y1, raveled."""
+    xn = (np.arange(nx) - (nx - 1) / 2.0) / max(1.0, nx / 2.0)
+    yn = (np.arange(y0, y1) - (ny - 1) / 2.0) / max(1.0, ny / 2.0)
+    return np.tile(xn, y1 - y0), np.repeat(yn, nx)
+
+
+# --------------------- passes ------------------------
+
+def usable(phase, coh, min_coh, fit_mask):
+    w = np.isfinite(phase) & (phase != 0)
+    if coh is not None:
+        w &= coh >= min_coh
+    if fit_mask is not None:
+        w &= fit_mask[None, :]
+    return w
+
+
+def accumulate(f, dem, args, fit_region):
+    """One streaming pass: stacked normal equations N (n_ifg, m, m), b, y'y, counts."""
+    unw = f["unwrapPhase"]
+    n_ifg, ny, nx = unw.shape
+    m = 2 + RAMPS[args.ramp]
+    iu = np.triu_indices(m)
+    N_packed = np.zeros((n_ifg, len(iu[0])))
+    b = np.zeros((n_ifg, m))
+    yy = np.zeros(n_ifg)
+    count = np.zeros(n_ifg, dtype=np.int64)
+
+    step = args.fit_step
+    rows = strip_rows(args.mem_mb, n_ifg, nx, step)
+    for r0 in range(0, ny, rows):
+        r1 = min(ny, r0 + rows)
+        phase = unw[:, r0:r1:step, ::step].reshape(n_ifg, -1).astype("float64")
+        coh = None
+        if args.min_coh > 0:
+            coh = f["coherence"][:, r0:r1:step, ::step].reshape(n_ifg, -1)
+        h = dem[r0:r1:step, ::step].ravel()
+        x, y = coords(r0, r1, nx, ny)
+        x = x.reshape(r1 - r0, nx)[::step, ::step].ravel()
+        y = y.reshape(r1 - r0, nx)[::step, ::step].ravel()
+        region = fit_region[r0:r1:step, ::step].ravel() & np.isfinite(h)
+
+        w = usable(phase, coh, args.min_coh, region)
+        G = design(np.where(region, h, 0.0), x, y, args.ramp)
+        pw = np.where(w, phase, 0.0)
+        wf = w.astype("float64")
+        N_packed += wf @ (G[:, iu[0]] * G[:, iu[1]])
+        b += pw @ G
+        yy += np.einsum("kp,kp->k", pw, pw)
+        count += w.sum(axis=1)
+
+    N = np.zeros((n_ifg, m, m))
+    N[:, iu[0], iu[1]] = N_packed
+    N[:, iu[1], iu[0]] = N_packed
+    return N, b, yy, count
+
+
+def solve(N, b, count, min_pixels):
+    coeff = np.full(b.shape, np.nan)
+    for k in range(len(b)):
+        if count[k] < min_pixels:
+            continue
+        try:
+            coeff[k] = np.linalg.solve(N[k], b[k])
+        except np.linalg.LinAlgError:
+            coeff[k] = np.linalg.lstsq(N[k], b[k], rcond=None)[0]
+    return coeff
+
+
+def apply(f, dem, coeff, args, out_name):
+    unw = f["unwrapPhase"]
+    n_ifg, ny, nx = unw.shape
+    if out_name == "unwrapPhase":
+        out = unw
+    else:
+        if out_name in f:
+            del f[out_name]
+        out = f.create_dataset(out_name, shape=unw.shape, dtype="float32",
+                               chunks=unw.chunks or True, compression=unw.compression)
+    c = np.nan_to_num(coeff)        # pairs without a fit are copied unchanged
+    rows = strip_rows(args.mem_mb, n_ifg, nx, 1)
+    for r0 in range(0, ny, rows):
+        r1 = min(ny, r0 + rows)
+        phase = unw[:, r0:r1, :].reshape(n_ifg, -1)
+        h = dem[r0:r1].ravel()
+        x, y = coords(r0, r1, nx, ny)
+        model = (design(np.where(np.isfinite(h), h, 0.0), x, y, args.ramp) @ c.T).T
+        keep = np.isfinite(phase) & (phase != 0) & np.isfinite(h)[None, :]
+        out[:, r0:r1, :] = np.where(keep, phase - model, phase).astype("float32").reshape(
+            n_ifg, r1 - r0, nx)
+
+
+def strip_rows(mem_mb, n_ifg, nx, step):
+    # phase, weights and products in float64 per strip
+    per_row = n_ifg * (nx / step) * 8 * 4 / step
+    rows = max(step, int(mem_mb * 1024 ** 2 // max(per_row, 1)))
+    return rows // step * step
+
+
+# --------------------- CLI ------------------------
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="DEM-correlated (stratified) tropospheric correction of ifgramStack.h5."
+    )
+    p.add_argument("stack", help="MintPy ifgramStack.h5 (modified: new dataset or --in-place).")
+    p.add_argument("--dem", default=None,
+                   help="DEM on the stack grid, e.g. inputs/geometryGeo.h5:height or "
+                        "mintpy_inputs/dem/dem_geo.tif (default: geometryGeo/Radar.h5 next to the stack).")
+    p.add_argument("--ramp", choices=list(RAMPS), default="none",
+                   help="Fit a ramp jointly with the DEM term (and remove it).")
+    p.add_argument("--min-coh", type=float, default=0.0, help="Fit only pixels with coherence >= this.")
+    p.add_argument("--exclude-roi", action="append", default=[],
+                   help="x1,x2,y1,y2 window left out of the fit (deforming area); repeatable.")
+    p.add_argument("--mask-file", default=None,
+                   help="Raster on the stack grid; only non-zero pixels are used for the fit.")
+    p.add_argument("--fit-step", type=int, default=1, help="Use every n-th pixel for the fit.")
+    p.add_argument("--min-pixels", type=int, default=1000,
+                   help="Pairs with fewer usable pixels are left uncorrected.")
+    p.add_argument("--in-place", action="store_true", help="Overwrite unwrapPhase.")
+    p.add_argument("--out-dset", default="unwrapPhase_tropoDEM", help="Output dataset name.")
+    p.add_argument("--table", default=None, help="Per-pair CSV (default: next to the stack).")
+    p.add_argument("--mem-mb", type=float, default=1024, help="Working memory per strip (MB).")
+    return p.parse_args()
+
+
+def default_dem(stack):
+    inputs = os.path.dirname(os.path.abspath(stack))
+    for name in ("geometryGeo.h5", "geometryRadar.h5"):
+        path = os.path.join(inputs, name)
+        if os.path.exists(path):
+            return path + ":height"
+    raise SystemExit("No geometry file next to the stack; give --dem.")
+
+
+def main():
+    args = parse_args()
+    import h5py
+
+    dem_path = args.dem or default_dem(args.stack)
+    out_name = "unwrapPhase" if args.in_place else args.out_dset
+
+    # the DEM is read once and shared by the fit and the correction pass
+    dem, _, _ = read_band(dem_path, band=1, dtype="float64")
+    dem_km = np.asarray(dem) / 1000.0
+
+    with h5py.File(args.stack, "r+") as f:
+        n_ifg, ny, nx = f["unwrapPhase"].shape
+        if dem_km.shape != (ny, nx):
+            raise RuntimeError(f"Shape mismatch: stack {(ny, nx)} vs DEM {dem_km.shape} ({dem_path})")
+        date12 = [f"{d1.decode()}_{d2.decode()}" for d1, d2 in f["date"][:]]
+        wavelength = float(f.attrs.get("WAVELENGTH", 0.055465))
+
+        fit_region = np.ones((ny, nx), dtype=bool)
+        for roi in args.exclude_roi:
+            x1, x2, y1, y2 = (int(v) for v in roi.split(","))
+            fit_region[y1:y2, x1:x2] = False
+        if args.mask_file:
+            mask, _, _ = read_band(args.mask_file, band=1)
+            fit_region &= np.asarray(mask) != 0
+
+        print(f"Stack: {n_ifg} pairs, {ny} x {nx}; DEM {dem_path} "
+              f"({np.nanmin(dem_km):.2f} .. {np.nanmax(dem_km):.2f} km)")
+        t0 = time.perf_counter()
+        N, b, yy, count = accumulate(f, dem_km, args, fit_region)
+        coeff = solve(N, b, count, args.min_pixels)
+        t1 = time.perf_counter()
+        print(f"Fit of {n_ifg} pairs in one pass: {t1 - t0:.1f} s")
+
+        # residual sum of squares of the fit: y'y - 2 c'b + c'Nc
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rss = yy - 2 * np.einsum("ki,ki->k", coeff, b) + np.einsum("ki,kij,kj->k", coeff, N, coeff)
+            rms_before = np.sqrt(yy / count)
+            rms_after = np.sqrt(np.maximum(rss, 0) / count)
+
+        apply(f, dem_km, coeff, args, out_name)
+        print(f"Correction applied in {time.perf_counter() - t1:.1f} s -> {out_name}")
+
+        if "tropoDEMCoeff" in f:
+            del f["tropoDEMCoeff"]
+        ds = f.create_dataset("tropoDEMCoeff", data=coeff.astype("float32"))
+        ds.attrs["COLUMNS"] = ",".join(names_for(args.ramp))
+        ds.attrs["UNIT"] = "radian per km (dem), radian (others)"
+        f.attrs["TROPO_DEM_CORRECTION"] = f"ramp={args.ramp}, dataset={out_name}"
+
+    table = args.table or os.path.join(os.path.dirname(os.path.abspath(args.stack)),
+                                       "tropo_dem_pairs.csv")
+    mm_per_rad = wavelength / (4 * np.pi) * 1000.0
+    with open(table, "w", newline="") as fc:
+        w = csv.writer(fc)
+        w.writerow(["date12", "n_pixels", "k_rad_per_km", "k_mm_per_km",
+                    "rms_before_rad", "rms_after_rad"])
+        for k in range(n_ifg):
+            w.writerow([date12[k], int(count[k]), f"{coeff[k, 0]:.4f}",
+                        f"{coeff[k, 0] * mm_per_rad:.3f}", f"{rms_before[k]:.4f}",
+                        f"{rms_after[k]:.4f}"])
+
+    fitted = np.isfinite(coeff[:, 0])
+    print(f"Fitted pairs: {int(fitted.sum())} / {n_ifg}; "
+          f"|k| median {np.nanmedian(np.abs(coeff[:, 0])):.3f} rad/km, "
+          f"RMS {np.nanmedian(rms_before):.3f} -> {np.nanmedian(rms_after):.3f} rad (median)")
+    print("Table:", table)
+    if not args.in_place:
+        print(f"Invert the corrected phase with ifgram_inversion.py --dset {out_name}, "
+              f"or rerun with --in-place.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,8 @@
 import os
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from osgeo import gdal
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open file: {path}")
-    arr = ds.ReadAsArray()
-    ds = None
-    return arr
+from raster_io import read_band, resolve_path
 
 
 def parse_args():
@@ -31,6 +22,13 @@ def parse_args():
         default=50,
         help="Number of histogram bins (default: 50).",
     )
+    p.add_argument(
+        "--save-fig",
+        "--savefig",
+        dest="save_fig",
+        default=None,
+        help="Save the figure to this file (PNG, PDF, ...; relative to the current directory).",
+    )
     return p.parse_args()
 
 
@@ -38,15 +36,11 @@ def main():
     args = parse_args()
 
     isce_dir = os.path.abspath(args.isce_dir)
-    vert_path = args.vert_path
-    if not os.path.isabs(vert_path):
-        vert_path = os.path.join(isce_dir, vert_path)
+    vert_path = resolve_path(isce_dir, args.vert_path)
 
     print("Vertical displacement file:", vert_path)
 
-    data = read_gdal_array(vert_path)
-    if data.ndim == 3:
-        data = data[0]
+    data, _, _ = read_band(vert_path, band=1)
 
     finite = np.isfinite(data)
     if not finite.any():
@@ -57,12 +51,19 @@ def main():
     print("Number of valid pixels:", vals.size)
     print("Min / Mean / Max (mm):", vals.min(), vals.mean(), vals.max())
 
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(6, 4))
     plt.hist(vals, bins=args.bins)
     plt.xlabel("Vertical displacement (mm)")
     plt.ylabel("Pixel count")
     plt.title("Histogram of vertical displacement (mm)")
     plt.tight_layout()
+    if args.save_fig:
+        out_fig = os.path.abspath(args.save_fig)
+        os.makedirs(os.path.dirname(out_fig), exist_ok=True)
+        plt.savefig(out_fig, dpi=300)
+        print("Figure saved to:", out_fig)
     plt.show()
 
 
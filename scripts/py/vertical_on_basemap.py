@@ -4,10 +4,8 @@
 import os
 import argparse
 import numpy as np
-import rasterio
-from rasterio.warp import calculate_default_transform, reproject, Resampling
-import matplotlib.pyplot as plt
-import contextily as cx
+
+from raster_io import read_band, resolve_path
 
 
 def parse_args():
@@ -31,20 +29,30 @@ def main():
     args = parse_args()
 
     isce_dir = os.path.abspath(args.isce_dir)
-    vert_path = args.vert_path
-    if not os.path.isabs(vert_path):
-        vert_path = os.path.join(isce_dir, vert_path)
+    vert_path = resolve_path(isce_dir, args.vert_path)
 
     print("Vertical file:", vert_path)
 
     # --- read vertical displacement ---
+    import rasterio
+    from rasterio.warp import calculate_default_transform, reproject, Resampling
+    import matplotlib.pyplot as plt
+    import contextily as cx
+
     with rasterio.open(vert_path) as src:
-        data = src.read(1)
         src_crs = src.crs
         src_transform = src.transform
         src_bounds = src.bounds
         src_width = src.width
         src_height = src.height
+        nodata = src.nodata
+        scaled = (src.scales[0], src.offsets[0]) != (1.0, 0.0)
+
+    # read_band decodes --quantize int16 products (GDAL scale/offset, nodata
+    # code -> NaN); an unscaled band only needs its nodata value masked
+    data, _, _ = read_band(vert_path, band=1)
+    if nodata is not None and not scaled and np.isfinite(nodata):
+        data = np.where(data == nodata, np.nan, data).astype(np.float32)
 
     if src_crs is None:
         raise RuntimeError("Input raster has no CRS. Cannot overlay on basemap.")
@@ -55,12 +63,14 @@ def main():
         src_crs, dst_crs, src_width, src_height, *src_bounds
     )
 
-    dst_data = np.empty((height, width), dtype=np.float32)
+    dst_data = np.full((height, width), np.nan, dtype=np.float32)
     reproject(
-        source=data,
+        source=np.asarray(data),
         destination=dst_data,
         src_transform=src_transform,
         src_crs=src_crs,
+        src_nodata=np.nan,
+        dst_nodata=np.nan,
         dst_transform=transform,
         dst_crs=dst_crs,
         resampling=Resampling.bilinear,
@@ -4,17 +4,8 @@
 import os
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from osgeo import gdal
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open file: {path}")
-    arr = ds.ReadAsArray()
-    ds = None
-    return arr
+from raster_io import read_band, resolve_path
 
 
 def parse_roi(roi_str):
@@ -41,14 +32,10 @@ def main():
     args = parse_args()
 
     isce_dir = os.path.abspath(args.isce_dir)
-    vert_path = args.vert_path
-    if not os.path.isabs(vert_path):
-        vert_path = os.path.join(isce_dir, vert_path)
+    vert_path = resolve_path(isce_dir, args.vert_path)
 
     print("Vertical file:", vert_path)
-    data = read_gdal_array(vert_path)
-    if data.ndim == 3:
-        data = data[0]
+    data, _, _ = read_band(vert_path, band=1)
 
     ny, nx = data.shape
     print("Image size (ny, nx):", ny, nx)
@@ -66,6 +53,8 @@ def main():
     print("ROI valid pixels:", vals.size)
     print("ROI min / mean / max (mm):", vals.min(), vals.mean(), vals.max())
 
+    import matplotlib.pyplot as plt
+
     fig, axes = plt.subplots(1, 2, figsize=(10, 4))
 
     axes[0].hist(vals, bins=args.bins)
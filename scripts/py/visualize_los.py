@@ -12,20 +12,9 @@
 
 import os
 import argparse
-from osgeo import gdal
 import numpy as np
-import matplotlib.pyplot as plt
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open {path}")
-    arr = ds.ReadAsArray()
-    # اگر چندباندی بود، باند اول
-    if arr.ndim == 3:
-        arr = arr[0]
-    return arr
+from raster_io import read_band
 
 
 def parse_roi(roi_str):
@@ -88,7 +77,7 @@ def main():
     print("LOS file:", los_path)
 
     # خواندن داده
-    los = read_gdal_array(los_path).astype("float32")
+    los, _, _ = read_band(los_path, band=1)
     print("اندازه تصویر:", los.shape)
 
     # اعمال ROI اگر داده شده
@@ -110,6 +99,8 @@ def main():
     print(f"Color scale vmin/vmax based on P{p_lo}/P{p_hi}:", vmin, vmax)
 
     # رسم
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(8, 6))
     im = plt.imshow(los_plot, cmap="jet", vmin=vmin, vmax=vmax)
     plt.colorbar(im, label="LOS displacement (mm)")
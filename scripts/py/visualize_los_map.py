@@ -4,17 +4,8 @@
 import os
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from osgeo import gdal
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open file: {path}")
-    arr = ds.ReadAsArray()
-    ds = None
-    return arr
+from raster_io import read_band, resolve_path
 
 
 def parse_args():
@@ -34,15 +25,11 @@ def main():
 
     # FIXED: use args.isce_dir (underscore), not args.isce-dir
     isce_dir = os.path.abspath(args.isce_dir)
-    los_path = args.los_path
-    if not os.path.isabs(los_path):
-        los_path = os.path.join(isce_dir, los_path)
+    los_path = resolve_path(isce_dir, args.los_path)
 
     print("LOS displacement file:", los_path)
 
-    data = read_gdal_array(los_path)
-    if data.ndim == 3:
-        data = data[0]
+    data, _, _ = read_band(los_path, band=1)
 
     finite = np.isfinite(data)
     if not finite.any():
@@ -53,6 +40,8 @@ def main():
     vmax = np.percentile(data[finite], p_hi)
     print(f"Color scale vmin/vmax (P{p_lo}/P{p_hi}): {vmin} {vmax}")
 
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(6, 6))
     im = plt.imshow(data, cmap="jet", vmin=vmin, vmax=vmax)
     plt.colorbar(im, label="LOS displacement (mm)")
@@ -4,17 +4,8 @@
 import os
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from osgeo import gdal
 
-
-def read_gdal_array(path):
-    ds = gdal.Open(path)
-    if ds is None:
-        raise RuntimeError(f"Cannot open file: {path}")
-    arr = ds.ReadAsArray()
-    ds = None
-    return arr
+from raster_io import read_band, resolve_path
 
 
 def parse_args():
@@ -30,6 +21,13 @@ def parse_args():
         default="5,95",
         help="Percentiles for color scale, e.g., 5,95",
     )
+    p.add_argument(
+        "--save-fig",
+        "--savefig",
+        dest="save_fig",
+        default=None,
+        help="Save the figure to this file (PNG, PDF, ...; relative to the current directory).",
+    )
     return p.parse_args()
 
 
@@ -38,15 +36,11 @@ def main():
 
     # FIXED: use args.isce_dir
     isce_dir = os.path.abspath(args.isce_dir)
-    vert_path = args.los_path
-    if not os.path.isabs(vert_path):
-        vert_path = os.path.join(isce_dir, vert_path)
+    vert_path = resolve_path(isce_dir, args.los_path)
 
     print("Vertical displacement file:", vert_path)
 
-    data = read_gdal_array(vert_path)
-    if data.ndim == 3:
-        data = data[0]
+    data, _, _ = read_band(vert_path, band=1)
 
     finite = np.isfinite(data)
     if not finite.any():
@@ -57,6 +51,8 @@ def main():
     vmax = np.percentile(data[finite], p_hi)
     print(f"Color scale vmin/vmax (P{p_lo}/P{p_hi}): {vmin} {vmax}")
 
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(6, 6))
     im = plt.imshow(data, cmap="jet", vmin=vmin, vmax=vmax)
     plt.colorbar(im, label="Vertical displacement (mm)")
@@ -65,6 +61,11 @@ def main():
     plt.ylabel("Pixel index (azimuth direction)")
     plt.gca().invert_yaxis()
     plt.tight_layout()
+    if args.save_fig:
+        out_fig = os.path.abspath(args.save_fig)
+        os.makedirs(os.path.dirname(out_fig), exist_ok=True)
+        plt.savefig(out_fig, dpi=300)
+        print("Figure saved to:", out_fig)
     plt.show()
 
 